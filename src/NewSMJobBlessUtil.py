@@ -54,11 +54,62 @@
 import sys
 import os
 import getopt
+import glob
+import collections
+import contextlib
+import ctypes
+import ctypes.util
+import io
+import socket
+import socketserver
+import functools
+import json
+import shutil
+import stat
+import sqlite3
+import threading
+import time
 import subprocess
+import tempfile
 import plistlib
+import select
 import operator
-import tempfile
-from typing import Dict, List, Optional
+import mmap
+import re
+import platform
+import struct
+import hashlib
+import zipfile
+import base64
+import xml.etree.ElementTree
+import concurrent.futures
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, TextIO, Tuple
+
+# The names below are the API for build systems that import this file rather than run 
+# it; they return results and raise CheckException, and never print or exit.
+
+__all__ = [
+    "CheckException", 
+    "CheckFailures", 
+    "BundleReport", 
+    "PlistChange", 
+    "inspectBundle", 
+    "verifyFeed", 
+    "FeedItem", 
+    "Ed25519Verifier", 
+    "setreq", 
+    "compileRequirement", 
+    "evaluateRequirement", 
+    "requirementsEquivalent", 
+    "readSigningFacts", 
+    "SigningFacts", 
+    "CodeSignBackend", 
+    "CodesignToolBackend", 
+    "IncrementalCodeSignBackend", 
+    "SectionReader", 
+    "SliceInspection", 
+    "InspectionCache", 
+]
 
 # For Python 3 compatibility
 
@@ -81,9 +132,579 @@ class CheckException(Exception):
         self.path = path
 
 
+class CheckFailures(CheckException):
+    """
+    Raised when the "check" subcommand detects more than one problem; failures holds 
+    each of them, in the order the checks are listed.
+    """
+    def __init__(self, failures: List[CheckException]):
+        super().__init__(f"{len(failures)} problems found")
+        self.failures = failures
+
+
+class TraceSpan:
+    """One timed stage of a run; the code being timed adds to byteCount as it goes."""
+
+    def __init__(self, name: str, category: str, args: Dict[str, object]):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.byteCount = 0
+
+    def addBytes(self, byteCount: int) -> None:
+        self.byteCount += byteCount
+
+
+class Tracer:
+    """
+    Collects the spans recorded by traced(), each with its wall time, the CPU time of 
+    the thread that ran it, and the number of bytes it processed, and reports them as 
+    a summary or in Chrome Trace Event format.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.events: List[Dict[str, object]] = []
+
+    def record(self, span: TraceSpan, start: float, wall: float, cpu: float) -> None:
+        args = dict(span.args)
+        args["cpu_ms"] = round(cpu * 1000, 3)
+        args["bytes"] = span.byteCount
+        event = {
+            "name": span.name, 
+            "cat": span.category, 
+            "ph": "X", 
+            "ts": round((start - self.origin) * 1000000, 1), 
+            "dur": round(wall * 1000000, 1), 
+            "pid": os.getpid(), 
+            "tid": threading.get_ident(), 
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def writeChromeTrace(self, tracePath: str) -> None:
+        """Writes the spans to a file that chrome://tracing and Perfetto can load."""
+        with self._lock:
+            events = list(self.events)
+        with open(tracePath, "w") as fp:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fp)
+
+    def stageTotals(self, excludedCategories: Tuple[str, ...] = ()) -> List[Tuple[str, int, float, float, int]]:
+        """Returns (name, count, wall ms, CPU ms, bytes) for each span name, slowest first."""
+        totals: Dict[str, List] = {}
+        with self._lock:
+            for event in self.events:
+                if event["cat"] in excludedCategories:
+                    continue
+                total = totals.setdefault(event["name"], [0, 0.0, 0.0, 0])
+                total[0] += 1
+                total[1] += event["dur"] / 1000
+                total[2] += event["args"]["cpu_ms"]
+                total[3] += event["args"]["bytes"]
+        return sorted(((name, *total) for name, total in totals.items()), key=lambda total: -total[2])
+
+    def componentTimings(self) -> List[Tuple[str, float, str]]:
+        """Returns (path, wall ms, result) for each nested code component verified, slowest first."""
+        with self._lock:
+            timings = [(event["args"]["path"], event["dur"] / 1000, event["args"]["result"]) for event in self.events if event["name"] == "verify nested code"]
+        return sorted(timings, key=lambda timing: -timing[1])
+
+    def summary(self) -> str:
+        """Returns a one-line summary of the run."""
+        wall = (time.perf_counter() - self.origin) * 1000
+        with self._lock:
+            spanCount = len(self.events)
+            subprocessCount = sum(1 for event in self.events if event["cat"] == "subprocess")
+            byteCount = sum(event["args"]["bytes"] for event in self.events)
+        # The whole-command spans enclose everything else, so they're never interesting as the slowest.
+
+        totals = self.stageTotals(excludedCategories=("check", "setreq"))
+        slowest = "" if len(totals) == 0 else f", slowest {totals[0][0]} {totals[0][2]:.1f} ms"
+        return f"{spanCount} spans, {wall:.1f} ms wall, {time.process_time() * 1000:.1f} ms process CPU, {subprocessCount} subprocesses, {byteCount} bytes{slowest}"
+
+
+# The tracer that traced() records into; None, the default, makes traced() free.
+
+tracer: Optional[Tracer] = None
+
+
+@contextlib.contextmanager
+def traced(name: str, category: str, **args):
+    """Times the enclosed code as a span of the current tracer, if there is one."""
+    currentTracer = tracer
+    span = TraceSpan(name, category, args)
+    if currentTracer is None:
+        yield span
+        return
+    start = time.perf_counter()
+    startCPU = time.thread_time()
+    try:
+        yield span
+    finally:
+        currentTracer.record(span, start, time.perf_counter() - start, time.thread_time() - startCPU)
+
+
+class CodeSignCache:
+    """
+    A persistent store of codesign results, shared between runs.  Each result is keyed 
+    by the program path and a fingerprint of the program's current state, so rebuilding 
+    (and hence re-signing) a program means its stale results are never found again.  
+    Entries not used for maxAge seconds, and the least recently used entries beyond 
+    maxEntries, are evicted when the cache is opened.
+    """
+
+    def __init__(self, cacheDir: str, maxEntries: int = 10000, maxAge: float = 30 * 24 * 60 * 60):
+        os.makedirs(cacheDir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cacheDir, "codesign-cache.sqlite3"), timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "path TEXT NOT NULL, kind TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+                "value TEXT NOT NULL, lastUsed REAL NOT NULL, PRIMARY KEY (path, kind))"
+            )
+            self._db.execute("DELETE FROM results WHERE lastUsed < ?", (time.time() - maxAge,))
+            self._db.execute(
+                "DELETE FROM results WHERE rowid NOT IN "
+                "(SELECT rowid FROM results ORDER BY lastUsed DESC LIMIT ?)", 
+                (maxEntries,)
+            )
+
+    def lookup(self, programPath: str, kind: str, fingerprint: str) -> Optional[str]:
+        """Returns the cached result of the given kind for the program, or None if there isn't a current one."""
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT value FROM results WHERE path = ? AND kind = ? AND fingerprint = ?", 
+                (programPath, kind, fingerprint)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE results SET lastUsed = ? WHERE path = ? AND kind = ?", (time.time(), programPath, kind))
+            return row[0]
+
+    def store(self, programPath: str, kind: str, fingerprint: str, value: str) -> None:
+        """Records a result of the given kind for the program, replacing any earlier one."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (path, kind, fingerprint, value, lastUsed) VALUES (?, ?, ?, ?, ?)", 
+                (programPath, kind, fingerprint, value, time.time())
+            )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+# The cache consulted by checkCodeSignature and readDesignatedRequirement; None disables caching.
+
+codeSignCache: Optional[CodeSignCache] = None
+
+
+def defaultCacheDir() -> str:
+    """Returns the per-user directory in which the codesign cache is kept."""
+    if sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "NewSMJobBlessUtil")
+
+
+class ZipArchive:
+    """
+    A zip archive, such as a zipped release of the app, checked in place rather than 
+    extracted.  The members are listed from the archive's central directory when it's 
+    opened, and a member is inflated, into memory, only when a check reads it.  A member 
+    larger than maxMemberSize is refused, and the most recently read members are kept, 
+    up to maxCachedBytes, so that a binary examined by several checks is inflated once.  
+    Sealed resources, which are only hashed, are streamed through open instead.
+    """
+
+    def __init__(self, zipPath: str, maxMemberSize: int = 512 * 1024 * 1024, maxCachedBytes: int = 256 * 1024 * 1024):
+        self.zipPath = zipPath
+        self.maxMemberSize = maxMemberSize
+        self.maxCachedBytes = maxCachedBytes
+        try:
+            st = os.stat(zipPath)
+            self._zip = zipfile.ZipFile(zipPath)
+        except (OSError, zipfile.BadZipFile) as e:
+            raise CheckException(f"archive unreadable: {str(e)}", zipPath)
+        self._identity = f"{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+        self._lock = threading.Lock()
+        self._cachedBytes = 0
+        self._cache: "collections.OrderedDict[str, bytes]" = collections.OrderedDict()
+
+        # Map each directory to its entries, noting which entries are directories.  Zip 
+        # files needn't list directories explicitly, so every member's parents are 
+        # added too.  Finder's "__MACOSX" resource fork folder is ignored.
+
+        self._members: Dict[str, zipfile.ZipInfo] = {}
+        self._directories: Dict[str, Dict[str, bool]] = {"": {}}
+        for info in self._zip.infolist():
+            name = info.filename.rstrip("/")
+            if name == "" or name.split("/")[0] == "__MACOSX":
+                continue
+            isDirectory = info.is_dir() or stat.S_ISDIR(info.external_attr >> 16)
+            if isDirectory:
+                self._directories.setdefault(name, {})
+            else:
+                self._members[name] = info
+            while name != "":
+                parent, _, entryName = name.rpartition("/")
+                self._directories.setdefault(parent, {})[entryName] = isDirectory
+                name, isDirectory = parent, True
+
+    def _isSymlink(self, name: str) -> bool:
+        info = self._members.get(name)
+        return info is not None and stat.S_ISLNK(info.external_attr >> 16)
+
+    def _resolve(self, name: str) -> str:
+        """Returns the member name with any symlinks (as in a framework's "Versions/Current") resolved."""
+        components = [component for component in name.split("/") if component not in ("", ".")]
+        resolved: List[str] = []
+        for _ in range(40):
+            if len(components) == 0:
+                return "/".join(resolved)
+            component = components.pop(0)
+            if component == "..":
+                if resolved:
+                    resolved.pop()
+                continue
+            candidate = "/".join(resolved + [component])
+            if self._isSymlink(candidate):
+                target = self._zip.read(self._members[candidate]).decode("utf-8")
+                components = [c for c in target.split("/") if c not in ("", ".")] + components
+                if target.startswith("/"):
+                    resolved = []
+            else:
+                resolved.append(component)
+        raise CheckException("archive symlinks nested too deeply", os.path.join(self.zipPath, name))
+
+    def isDirectory(self, name: str) -> bool:
+        return self._resolve(name) in self._directories
+
+    def isFile(self, name: str) -> bool:
+        return self._resolve(name) in self._members
+
+    def entries(self, name: str) -> List[Tuple[str, bool, bool]]:
+        """Returns (name, is directory, is symlink) for each entry in the directory; symlinks are followed to see whether they lead to a directory."""
+        directoryName = self._resolve(name)
+        if directoryName not in self._directories:
+            raise FileNotFoundError(os.path.join(self.zipPath, name))
+        result = []
+        for entryName, isDirectory in self._directories[directoryName].items():
+            memberName = entryName if directoryName == "" else f"{directoryName}/{entryName}"
+            isSymlink = self._isSymlink(memberName)
+            result.append((entryName, self.isDirectory(memberName) if isSymlink else isDirectory, isSymlink))
+        return result
+
+    def open(self, name: str) -> BinaryIO:
+        """
+        Returns a file object that inflates the member as it's read, for data that's 
+        only streamed through once, so it's neither kept in memory nor limited in size.
+        """
+        info = self._members.get(self._resolve(name))
+        if info is None:
+            raise FileNotFoundError(os.path.join(self.zipPath, name))
+        return self._zip.open(info)
+
+    def read(self, name: str) -> bytes:
+        """Returns the contents of a member, inflating it if it's not already in memory."""
+        memberName = self._resolve(name)
+        with self._lock:
+            data = self._cache.get(memberName)
+            if data is not None:
+                self._cache.move_to_end(memberName)
+                return data
+        info = self._members.get(memberName)
+        if info is None:
+            raise FileNotFoundError(os.path.join(self.zipPath, name))
+        if info.file_size > self.maxMemberSize:
+            raise CheckException(f"archive member too large ({info.file_size} bytes)", os.path.join(self.zipPath, name))
+        with traced("inflate archive member", "archive", path=os.path.join(self.zipPath, name)) as span:
+            data = self._zip.read(info)
+            span.addBytes(len(data))
+        with self._lock:
+            if memberName not in self._cache and len(data) <= self.maxCachedBytes:
+                self._cache[memberName] = data
+                self._cachedBytes += len(data)
+                while self._cachedBytes > self.maxCachedBytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cachedBytes -= len(evicted)
+        return data
+
+    def readLink(self, name: str) -> str:
+        """Returns the target of a symlink member; the symlink itself isn't followed, but any in its parent directories are."""
+        parent, _, entryName = name.rpartition("/")
+        parentName = self._resolve(parent) if parent != "" else ""
+        memberName = entryName if parentName == "" else f"{parentName}/{entryName}"
+        if not self._isSymlink(memberName):
+            raise OSError(f"not a symlink: {os.path.join(self.zipPath, name)}")
+        return self._zip.read(self._members[memberName]).decode("utf-8")
+
+    def identity(self, name: str) -> str:
+        """Returns a statIdentity-like string for a member: the archive's identity plus the member's CRC and size."""
+        memberName = self._resolve(name)
+        info = self._members.get(memberName)
+        if info is not None:
+            return f"{self._identity}/{info.CRC:08x}:{info.file_size}"
+        if memberName in self._directories:
+            return f"{self._identity}/{memberName}/"
+        return "missing"
+
+    def appNames(self) -> List[str]:
+        """Returns the names of the app bundles at the top level of the archive."""
+        return sorted(name for name, isDirectory in self._directories[""].items() if isDirectory and name.endswith(".app"))
+
+    def close(self) -> None:
+        self._zip.close()
+
+
+# The archives being checked in place, keyed by path, each with a count of its users.  
+# A path inside one of them refers to one of its members.
+
+openArchives: Dict[str, List] = {}
+openArchivesLock = threading.Lock()
+
+
+def archiveMember(path: str) -> Optional[Tuple[ZipArchive, str]]:
+    """If path refers to something inside an archive being checked, returns the archive and the member name."""
+    if len(openArchives) == 0:
+        return None
+    with openArchivesLock:
+        archives = [entry[0] for entry in openArchives.values()]
+    for archive in archives:
+        if path == archive.zipPath:
+            return (archive, "")
+        if path.startswith(archive.zipPath + os.sep):
+            return (archive, path[len(archive.zipPath) + 1:].replace(os.sep, "/"))
+    return None
+
+
+@contextlib.contextmanager
+def openedBundle(path: str):
+    """
+    Yields the path of the app to check.  That's the path itself, unless it's a zip 
+    archive, in which case the archive is opened for checking in place and the path 
+    of the one app inside it is yielded.
+    """
+    if not (path.endswith(".zip") and os.path.isfile(path)):
+        yield path
+        return
+    zipPath = os.path.abspath(path)
+    with openArchivesLock:
+        entry = openArchives.get(zipPath)
+        if entry is not None:
+            entry[1] += 1
+    if entry is None:
+        archive = ZipArchive(zipPath)
+        with openArchivesLock:
+            entry = openArchives.setdefault(zipPath, [archive, 0])
+            entry[1] += 1
+        if entry[0] is not archive:
+            archive.close()
+    try:
+        appNames = entry[0].appNames()
+        if len(appNames) != 1:
+            raise CheckException(f"archive must contain exactly one app, found {len(appNames)}", path)
+        yield os.path.join(zipPath, appNames[0])
+    finally:
+        with openArchivesLock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del openArchives[zipPath]
+                entry[0].close()
+
+
+def isDirectory(path: str) -> bool:
+    """Like os.path.isdir, but also sees into archives being checked in place."""
+    member = archiveMember(path)
+    if member is None:
+        return os.path.isdir(path)
+    return member[0].isDirectory(member[1])
+
+
+def isFile(path: str) -> bool:
+    """Like os.path.isfile, but also sees into archives being checked in place."""
+    member = archiveMember(path)
+    if member is None:
+        return os.path.isfile(path)
+    return member[0].isFile(member[1])
+
+
+def directoryEntries(path: str) -> List[Tuple[str, bool, bool]]:
+    """
+    Returns (name, is directory, is symlink) for each entry in the directory, in name 
+    order, from a single os.scandir, or from the directory listing of an archive being 
+    checked in place.  Raises OSError if it's not a directory.
+    """
+    member = archiveMember(path)
+    if member is not None:
+        return sorted(member[0].entries(member[1]))
+    with os.scandir(path) as iterator:
+        return sorted((entry.name, entry.is_dir(), entry.is_symlink()) for entry in iterator)
+
+
+def readLink(path: str) -> str:
+    """Returns the target of the symlink, which may be a member of an archive being checked in place."""
+    member = archiveMember(path)
+    if member is None:
+        return os.readlink(path)
+    return member[0].readLink(member[1])
+
+
+def readFileData(path: str) -> bytes:
+    """Returns the contents of the file, which may be a member of an archive being checked in place."""
+    member = archiveMember(path)
+    if member is None:
+        with open(path, "rb") as fp:
+            return fp.read()
+    return member[0].read(member[1])
+
+
+def statIdentity(path: str) -> str:
+    """Returns a string that changes whenever the file at path is replaced or modified."""
+    member = archiveMember(path)
+    if member is not None:
+        return member[0].identity(member[1])
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+class BundleLayout(NamedTuple):
+    """Where a bundle keeps the things its code signature covers."""
+    contentsPath: str
+    infoPath: str
+    executableDirPath: str
+    codeResourcesPath: str
+
+
+def bundleLayout(bundlePath: str) -> BundleLayout:
+    """
+    Returns the layout of a bundle: an app, XPC service or plug-in keeps everything 
+    in "Contents", a framework in its current version, with "Info.plist" in its 
+    "Resources", and a shallow bundle at the top level.
+    """
+    contentsPath = os.path.join(bundlePath, "Contents")
+    if isDirectory(contentsPath):
+        return BundleLayout(contentsPath, os.path.join(contentsPath, "Info.plist"), os.path.join(contentsPath, "MacOS"), os.path.join(contentsPath, "_CodeSignature", "CodeResources"))
+    versionPath = os.path.join(bundlePath, "Versions", "Current")
+    if isDirectory(versionPath):
+        return BundleLayout(versionPath, os.path.join(versionPath, "Resources", "Info.plist"), versionPath, os.path.join(versionPath, "_CodeSignature", "CodeResources"))
+    return BundleLayout(bundlePath, os.path.join(bundlePath, "Info.plist"), bundlePath, os.path.join(bundlePath, "_CodeSignature", "CodeResources"))
+
+
+def programFingerprint(programPath: str) -> str:
+    """
+    Returns a fingerprint of the current state of the program, either a bundle or 
+    a tool.  For a bundle it covers the identity of every file in it, since codesign 
+    checks its resources and nested code as well as its executable, plus a hash of the 
+    resource seal; for a tool, a hash of the signature itself, which changes every time 
+    the program is re-signed.
+    """
+    digest = hashlib.sha256()
+    digest.update(programPath.encode("utf-8"))
+    digest.update(statIdentity(programPath).encode("utf-8"))
+    if isDirectory(programPath):
+
+        # Symlinks are recorded by their target and not followed, which is how the resource 
+        # seal treats them too.
+
+        def walk(directoryPath: str, prefix: str) -> None:
+            for entryName, entryIsDirectory, entryIsSymlink in directoryEntries(directoryPath):
+                entryPath = os.path.join(directoryPath, entryName)
+                digest.update(f"{prefix}{entryName}\0".encode("utf-8"))
+                if entryIsSymlink:
+                    digest.update(readLink(entryPath).encode("utf-8"))
+                elif entryIsDirectory:
+                    walk(entryPath, f"{prefix}{entryName}/")
+                else:
+                    digest.update(statIdentity(entryPath).encode("utf-8"))
+                digest.update(b"\0")
+
+        try:
+            walk(programPath, "")
+        except OSError:
+            pass
+        try:
+            digest.update(hashlib.sha256(readFileData(bundleLayout(programPath).codeResourcesPath)).digest())
+        except OSError:
+            pass
+    else:
+        try:
+            with MachOFile(programPath) as machO:
+                for slice in machO.slices:
+                    if slice.codeSignature is not None:
+                        dataOffset, dataSize = slice.codeSignature
+                        digest.update(slice.buffer[dataOffset:dataOffset + dataSize])
+        except CheckException:
+            pass
+    return digest.hexdigest()
+
+
+def executableIdentity(programPath: str) -> str:
+    """
+    Returns a string that changes whenever the program's main executable or Info.plist 
+    does, which is all that its designated requirement and signing facts are read from.
+    """
+    if not isDirectory(programPath):
+        return statIdentity(programPath)
+    infoIdentity = statIdentity(bundleLayout(programPath).infoPath)
+    try:
+        executablePath = programExecutablePath(programPath)
+    except CheckException:
+        return infoIdentity
+    return f"{infoIdentity}/{executablePath}/{statIdentity(executablePath)}"
+
+
+def cachedCodeSignResult(programPath: str, kind: str, compute, fingerprint: Callable[[str], str] = programFingerprint) -> str:
+    """
+    Returns the result of compute() for the program, consulting and updating codeSignCache, 
+    where it's stored with the fingerprint of the program's current state.  A cache that 
+    can't be read or written is treated as empty rather than as an error.
+    """
+    cache = codeSignCache
+    if cache is None:
+        return compute()
+    programState = fingerprint(programPath)
+    try:
+        value = cache.lookup(programPath, kind, programState)
+    except sqlite3.Error:
+        value = None
+    if value is None:
+        value = compute()
+        try:
+            cache.store(programPath, kind, programState, value)
+        except sqlite3.Error:
+            pass
+    return value
+
+
+# Set by the "--strict" option: verify code signatures with codesign rather than in-process.
+
+strictVerification = False
+
+
 def checkCodeSignature(programPath: str, programType: str) -> None:
     """Checks the code signature of the referenced program."""
 
+    # The codesign tool can't see into an archive, so its members are always verified in-process.  
+    # In-process, a bundle's sealed resources are checked separately from its executable.
+
+    if not strictVerification or archiveMember(programPath) is not None:
+        verifyCodeSignature(programPath, programType)
+        if isDirectory(programPath):
+            verifyResources(programPath, programType, None)
+        return
+    verifyCodeSignatureWithCodesign(programPath, programType)
+
+
+def verifyCodeSignatureWithCodesign(programPath: str, programType: str) -> None:
+    """Checks the code signature of the referenced program using the codesign tool."""
+
     # Use the codesign tool to check the signature.  The second "-v" is required to enable 
     # verbose mode, which causes codesign to do more checking.  By default it does the minimum 
     # amount of checking ("Is the program properly signed?").  If you enabled verbose mode it 
@@ -91,35 +712,108 @@ def checkCodeSignature(programPath: str, programType: str) -> None:
     # detect is "Does the code satisfy its own designated requirement?" and I need to enable 
     # verbose mode to get that.
 
-    args = [
-        # "false", 
-        "codesign", 
-        "-v", 
-        "-v",
-        programPath
-    ]
-    try:
-        subprocess.check_call(args, stderr=open("/dev/null"))
-    except subprocess.CalledProcessError as e:
+    def verify() -> str:
+        args = [
+            # "false", 
+            "codesign", 
+            "-v", 
+            "-v",
+            programPath
+        ]
+        try:
+            with traced("codesign -v -v", "subprocess", path=programPath):
+                subprocess.check_call(args, stderr=subprocess.DEVNULL)
+        except subprocess.CalledProcessError as e:
+            return "invalid"
+        except FileNotFoundError:
+            raise CheckException("codesign tool not found", programPath)
+        return "valid"
+
+    if cachedCodeSignResult(programPath, "verify", verify) != "valid":
         raise CheckException(f"{programType} code signature invalid", programPath)
 
 
+def programExecutablePath(programPath: str) -> str:
+    """Returns the path of the program's Mach-O executable; for a bundle, that's its main executable."""
+    if not isDirectory(programPath):
+        return programPath
+    layout = bundleLayout(programPath)
+    executableName = readInfoPlistFromPath(layout.infoPath).get("CFBundleExecutable")
+    if not isinstance(executableName, str):
+        raise CheckException("'CFBundleExecutable' not found", layout.infoPath)
+    return os.path.join(layout.executableDirPath, executableName)
+
+
+# Decoded designated requirements, keyed by executable path, each paired with the 
+# statIdentity of the executable it was decoded from.
+
+designatedRequirementCache: Dict[str, Tuple[str, str]] = {}
+designatedRequirementCacheLock = threading.Lock()
+
+
+def designatedRequirementOfSlice(slice: "MachOSlice") -> str:
+    signature = readCodeSignature(slice)
+    if signature is None:
+        raise CheckException("code signature not found", slice.path)
+    return formatRequirement(signature.designatedRequirement())
+
+
+def decodeDesignatedRequirement(programPath: str) -> str:
+    """
+    Decodes the designated requirement from the code signature embedded in the program's 
+    executable (its host architecture, if it's universal) and returns it in the same text 
+    form that codesign prints.
+    """
+    executablePath = programExecutablePath(programPath)
+    identity = statIdentity(executablePath)
+    with designatedRequirementCacheLock:
+        cached = designatedRequirementCache.get(executablePath)
+    if cached is not None and cached[0] == identity:
+        return cached[1]
+    with traced("decode designated requirement", "signature", path=programPath), MachOFile(executablePath) as machO:
+        requirement = designatedRequirementOfSlice(hostSlice(machO.slices))
+    with designatedRequirementCacheLock:
+        designatedRequirementCache[executablePath] = (identity, requirement)
+    return requirement
+
+
 def readDesignatedRequirement(programPath: str, programType: str) -> str:
     """Returns the designated requirement of the program as a string."""
-    args = [
-        # "false", 
-        "codesign", 
-        "-d", 
-        "-r", 
-        "-", 
-        programPath
-    ]
-    try:
-        req = subprocess.check_output(args, stderr=open("/dev/null"))
-        # Convert bytes to string in Python 3
-        req = req.decode('utf-8')
-    except subprocess.CalledProcessError as e:
-        raise CheckException(f"{programType} designated requirement unreadable", programPath)
+
+    # Decode the requirement from the signature in-process, which also works where there's 
+    # no codesign tool.  Only if that fails, and there is a codesign tool, ask codesign.
+
+    try:
+        return decodeDesignatedRequirement(programPath)
+    except CheckException as e:
+        if shutil.which("codesign") is None or archiveMember(programPath) is not None:
+            raise CheckException(f"{programType} designated requirement unreadable: {e.message}", programPath)
+    return readDesignatedRequirementWithCodesign(programPath, programType)
+
+
+def readDesignatedRequirementWithCodesign(programPath: str, programType: str) -> str:
+    """Returns the designated requirement of the program, as printed by the codesign tool."""
+
+    def read() -> str:
+        args = [
+            # "false", 
+            "codesign", 
+            "-d", 
+            "-r", 
+            "-", 
+            programPath
+        ]
+        try:
+            with traced("codesign -d -r -", "subprocess", path=programPath):
+                req = subprocess.check_output(args, stderr=subprocess.DEVNULL)
+            # Convert bytes to string in Python 3
+            return req.decode('utf-8')
+        except subprocess.CalledProcessError as e:
+            raise CheckException(f"{programType} designated requirement unreadable", programPath)
+        except FileNotFoundError:
+            raise CheckException("codesign tool not found", programPath)
+
+    req = cachedCodeSignResult(programPath, "requirement", read, executableIdentity)
 
     reqLines = req.splitlines()
     if len(reqLines) != 1 or not req.startswith("designated => "):
@@ -130,346 +824,3599 @@ def readDesignatedRequirement(programPath: str, programType: str) -> str:
 def readInfoPlistFromPath(infoPath: str) -> Dict:
     """Reads an "Info.plist" file from the specified path."""
     try:
-        with open(infoPath, 'rb') as fp:
-            info = plistlib.load(fp)
+        with traced("plistlib.load", "plist", path=infoPath) as span:
+            data = readFileData(infoPath)
+            info = plistlib.loads(data)
+            span.addBytes(len(data))
         return info
     except Exception as e:
         raise CheckException(f"'Info.plist' not readable: {str(e)}", infoPath)
 
 
-def readPlistFromToolSection(toolPath: str, segmentName: str, sectionName: str) -> Dict:
-    """Reads a dictionary property list from the specified section within the specified executable."""
-    
-    # Run otool -s to get a hex dump of the section.
-    args = [
-        "otool", 
-        "-s", 
-        segmentName, 
-        sectionName, 
-        toolPath
-    ]
-    try:
-        plistDump = subprocess.check_output(args)
-        # Convert bytes to string in Python 3
-        plistDump = plistDump.decode('utf-8')
-    except subprocess.CalledProcessError as e:
-        raise CheckException(f"tool {segmentName} / {sectionName} section unreadable", toolPath)
-
-    # Convert that hex dump to an property list.
-    plistLines = plistDump.splitlines()
-    if len(plistLines) < 3 or plistLines[1] != f"Contents of ({segmentName},{sectionName}) section":
-        raise CheckException(f"tool {segmentName} / {sectionName} section dump malformed (1)", toolPath)
-
-    del plistLines[0:2]
-
-    try:
-        bytes = bytearray()
-        for line in plistLines:
-            # line looks like this:
-            # '0000000100000b80\t3c 3f 78 6d 6c 20 76 65 72 73 69 6f 6e 3d 22 31 '
-            columns = line.split("\t")
-            assert len(columns) == 2
-            # Split hex values and convert each to a byte
-            for hexStr in columns[1].split():
-                # Convert hex string to integer, then to byte
-                try:
-                    byte = int(hexStr, 16)
-                    # If we get a large number, try interpreting it as a 2-digit hex
-                    if byte > 255:
-                        byte = int(hexStr[-2:], 16)  # Take last 2 chars as hex
-                    if byte < 0 or byte > 255:
-                        raise ValueError(f"Invalid byte value: {byte} from hex {hexStr}")
-                    bytes.append(byte)
-                except ValueError as e:
-                    raise ValueError(f"Error converting hex {hexStr}: {str(e)}")
-        
-        # Save to temporary file and read it
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(bytes)
-            temp_file.flush()
-            try:
-                with open(temp_file.name, 'rb') as f:
-                    plist = plistlib.load(f)
-            finally:
-                os.unlink(temp_file.name)
-                
-        if not isinstance(plist, dict):
-            raise CheckException(f"tool {segmentName} / {sectionName} property list root must be a dictionary", toolPath)
-        return plist
-    except Exception as e:
-        raise CheckException(f"tool {segmentName} / {sectionName} section dump malformed (2): {str(e)}", toolPath)
+# Mach-O constants, from <mach-o/loader.h> and <mach-o/fat.h>.
 
+MH_MAGIC = 0xfeedface
+MH_MAGIC_64 = 0xfeedfacf
+FAT_MAGIC = 0xcafebabe
+FAT_MAGIC_64 = 0xcafebabf
 
-def checkStep1(appPath: str) -> List[str]:
-    """Checks that the app and the tool are both correctly code signed."""
-    
-    if not os.path.isdir(appPath):
-        raise CheckException("app not found", appPath)
-    
-    # Check the app's code signature.
-        
-    checkCodeSignature(appPath, "app")
-    
-    # Check the tool directory.
-    
-    toolDirPath = os.path.join(appPath, "Contents", "Library", "LaunchServices")
-    if not os.path.isdir(toolDirPath):
-        raise CheckException("tool directory not found", toolDirPath)
+LC_SEGMENT = 0x1
+LC_SEGMENT_64 = 0x19
+LC_CODE_SIGNATURE = 0x1d
 
-    # Check each tool's code signature.
-    
-    toolPathList = []
-    for toolName in os.listdir(toolDirPath):
-        if toolName != ".DS_Store":
-            toolPath = os.path.join(toolDirPath, toolName)
-            if not os.path.isfile(toolPath):
-                raise CheckException("tool directory contains a directory", toolPath)
-            checkCodeSignature(toolPath, "tool")
-            toolPathList.append(toolPath)
+CPU_ARCH_ABI64 = 0x01000000
 
-    # Check that we have at least one tool.
-    
-    if len(toolPathList) == 0:
-        raise CheckException("no tools found", toolDirPath)
+CPU_TYPE_NAMES = {
+    7: "i386",
+    7 | CPU_ARCH_ABI64: "x86_64",
+    12: "arm",
+    12 | CPU_ARCH_ABI64: "arm64",
+    18: "ppc",
+    18 | CPU_ARCH_ABI64: "ppc64",
+}
 
-    return toolPathList
+# platform.machine() names some architectures differently on other systems: "aarch64" 
+# on Linux, "AMD64" on Windows.
 
+MACHINE_ARCH_NAMES = {
+    "aarch64": "arm64",
+    "arm64e": "arm64",
+    "AMD64": "x86_64",
+    "amd64": "x86_64",
+    "x86": "i386",
+    "i686": "i386",
+}
 
-def checkStep2(appPath: str, toolPathList: List[str]) -> None:
-    """Checks the SMPrivilegedExecutables entry in the app's Info.plist."""
 
-    # Create a map from the tool name (not path) to its designated requirement.
-    
-    toolNameToReqMap = dict()
-    for toolPath in toolPathList:
-        req = readDesignatedRequirement(toolPath, "tool")
-        toolNameToReqMap[os.path.basename(toolPath)] = req
-    
-    # Read the Info.plist for the app and extract the SMPrivilegedExecutables value.
-    
-    infoPath = os.path.join(appPath, "Contents", "Info.plist")
-    info = readInfoPlistFromPath(infoPath)
-    if "SMPrivilegedExecutables" not in info:
-        raise CheckException("'SMPrivilegedExecutables' not found", infoPath)
-    infoToolDict = info["SMPrivilegedExecutables"]
-    if not isinstance(infoToolDict, dict):
-        raise CheckException("'SMPrivilegedExecutables' must be a dictionary", infoPath)
-    
-    # Check that the list of tools matches the list of SMPrivilegedExecutables entries.
-    
-    if sorted(infoToolDict.keys()) != sorted(toolNameToReqMap.keys()):
-        raise CheckException("'SMPrivilegedExecutables' and tools in 'Contents/Library/LaunchServices' don't match")
-    
-    # Check that all the requirements match.
-    
-    # This is an interesting policy choice.  Technically the tool just needs to match 
-    # the requirement listed in SMPrivilegedExecutables, and we can check that by 
-    # putting the requirement into tmp.req and then running
-    #
-    # $ codesign -v -R tmp.req /path/to/tool
-    #
-    # However, for a Developer ID signed tool we really want to have the SMPrivilegedExecutables 
-    # entry contain the tool's designated requirement because Xcode has built a 
-    # more complex DR that does lots of useful and important checks.  So, as a matter 
-    # of policy we require that the value in SMPrivilegedExecutables match the tool's DR.
-    
-    for toolName in infoToolDict:
-        if infoToolDict[toolName] != toolNameToReqMap[toolName]:
-            raise CheckException(f"tool designated requirement ({toolNameToReqMap[toolName]}) doesn't match entry in 'SMPrivilegedExecutables' ({infoToolDict[toolName]})")
+class MachOSlice:
+    """
+    One architecture of a Mach-O file.  The load commands are walked exactly once, when 
+    the slice is created, and the location of every section is recorded so that 
+    section contents can later be handed out as zero-copy views of the underlying buffer.
+    """
 
+    def __init__(self, buffer: memoryview, path: str):
+        self.buffer = buffer
+        self.path = path
+        self.cpuType = 0
+        self.cpuSubtype = 0
+        self.sections: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        self.codeSignature: Optional[Tuple[int, int]] = None
+        self._parse()
 
-def checkStep3(appPath: str, toolPathList: List[str]) -> None:
-    """Checks the Info.plist embedded in each helper tool."""
-    
-    appReq = readDesignatedRequirement(appPath, "app")
-    
-    for toolPath in toolPathList:
-        info = readPlistFromToolSection(toolPath, "__TEXT", "__info_plist")
-        if "CFBundleInfoDictionaryVersion" not in info or info["CFBundleInfoDictionaryVersion"] != "6.0":
-            raise CheckException("'CFBundleInfoDictionaryVersion' in tool __TEXT / __info_plist section must be '6.0'", toolPath)
-        
-        if "CFBundleIdentifier" not in info or info["CFBundleIdentifier"] != os.path.basename(toolPath):
-            raise CheckException("'CFBundleIdentifier' in tool __TEXT / __info_plist section must match tool name", toolPath)
-        
-        if "SMAuthorizedClients" not in info:
-            raise CheckException("'SMAuthorizedClients' in tool __TEXT / __info_plist section not found", toolPath)
-        infoClientList = info["SMAuthorizedClients"]
-        if not isinstance(infoClientList, list):
-            raise CheckException("'SMAuthorizedClients' in tool __TEXT / __info_plist section must be an array", toolPath)
-        if len(infoClientList) != 1:
-            raise CheckException("'SMAuthorizedClients' in tool __TEXT / __info_plist section must have one entry", toolPath)
-            
-        if infoClientList[0] != appReq:
-            raise CheckException(f"app designated requirement ({appReq}) doesn't match entry in 'SMAuthorizedClients' ({infoClientList[0]})", toolPath)
+    @property
+    def archName(self) -> str:
+        return CPU_TYPE_NAMES.get(self.cpuType, f"cputype {self.cpuType}")
 
+    def _malformed(self, detail: str) -> CheckException:
+        return CheckException(f"Mach-O image malformed: {detail}", self.path)
 
-def checkStep4(appPath: str, toolPathList: List[str]) -> None:
-    """Checks the launchd.plist embedded in each helper tool."""
-    
-    for toolPath in toolPathList:
-        launchd = readPlistFromToolSection(toolPath, "__TEXT", "__launchd_plist")
-        if "Label" not in launchd or launchd["Label"] != os.path.basename(toolPath):
-            raise CheckException("'Label' in tool __TEXT / __launchd_plist section must match tool name", toolPath)
+    def _parse(self) -> None:
+        buffer = self.buffer
+        if len(buffer) < 28:
+            raise self._malformed("truncated header")
 
+        # The magic tells us both the word size and the byte order of everything that follows.
 
-def checkStep5(appPath: str) -> None:
-    """There's nothing to do here; we effectively checked for this is steps 1 and 2."""
-    pass
+        (magic,) = struct.unpack_from("<I", buffer, 0)
+        if magic in (MH_MAGIC, MH_MAGIC_64):
+            endian = "<"
+        else:
+            (magic,) = struct.unpack_from(">I", buffer, 0)
+            if magic not in (MH_MAGIC, MH_MAGIC_64):
+                raise self._malformed("bad magic")
+            endian = ">"
+        is64 = magic == MH_MAGIC_64
 
+        self.cpuType, self.cpuSubtype, _, ncmds, sizeofcmds, _ = struct.unpack_from(endian + "iiIIII", buffer, 4)
+        commandOffset = 32 if is64 else 28
+        if commandOffset + sizeofcmds > len(buffer):
+            raise self._malformed("load commands extend past end of file")
 
-def check(appPath: str) -> None:
-    """Checks the SMJobBless setup of the specified app."""
+        # Walk the load commands, recording each section and the code signature location.
 
-    # Each of the following steps matches a bullet point in the SMJobBless header doc.
-    
-    toolPathList = checkStep1(appPath)
+        if is64:
+            segmentCommand, segmentFormat, sectionFormat = LC_SEGMENT_64, endian + "16sQQQQiiII", endian + "16s16sQQIIIIIIII"
+        else:
+            segmentCommand, segmentFormat, sectionFormat = LC_SEGMENT, endian + "16sIIIIiiII", endian + "16s16sIIIIIIIII"
+        segmentSize = struct.calcsize(segmentFormat)
+        sectionSize = struct.calcsize(sectionFormat)
 
-    checkStep2(appPath, toolPathList)
+        limit = commandOffset + sizeofcmds
+        offset = commandOffset
+        for _ in range(ncmds):
+            if offset + 8 > limit:
+                raise self._malformed("load command extends past end of load commands")
+            cmd, cmdsize = struct.unpack_from(endian + "II", buffer, offset)
+            if cmdsize < 8 or offset + cmdsize > limit:
+                raise self._malformed("bad load command size")
+            if cmd == segmentCommand:
+                nsects = struct.unpack_from(segmentFormat, buffer, offset + 8)[7]
+                if 8 + segmentSize + nsects * sectionSize > cmdsize:
+                    raise self._malformed("segment sections extend past end of load command")
+                sectionOffset = offset + 8 + segmentSize
+                for _ in range(nsects):
+                    fields = struct.unpack_from(sectionFormat, buffer, sectionOffset)
+                    sectName = fields[0].rstrip(b"\0").decode("utf-8", "replace")
+                    segName = fields[1].rstrip(b"\0").decode("utf-8", "replace")
+                    size, fileOffset = fields[3], fields[4]
+                    self.sections[(segName, sectName)] = (fileOffset, size)
+                    sectionOffset += sectionSize
+            elif cmd == LC_CODE_SIGNATURE:
+                self.codeSignature = struct.unpack_from(endian + "II", buffer, offset + 8)
+            offset += cmdsize
 
-    checkStep3(appPath, toolPathList)
+    def section(self, segmentName: str, sectionName: str) -> Optional[memoryview]:
+        """Returns a view of the contents of the specified section, or None if there's no such section."""
+        location = self.sections.get((segmentName, sectionName))
+        if location is None:
+            return None
+        fileOffset, size = location
+        if fileOffset + size > len(self.buffer):
+            raise self._malformed(f"{segmentName} / {sectionName} section extends past end of file")
+        return self.buffer[fileOffset:fileOffset + size]
 
-    checkStep4(appPath, toolPathList)
 
-    checkStep5(appPath)
+def parseMachO(buffer: memoryview, path: str) -> List[MachOSlice]:
+    """Parses a thin or universal Mach-O image held in the buffer and returns its architecture slices."""
 
+    if len(buffer) < 8:
+        raise CheckException("Mach-O image malformed: truncated header", path)
 
-def setreq(appPath: str, appInfoPlistPath: str, toolInfoPlistPaths: List[str]) -> None:
-    """
-    Reads information from the built app and uses it to set the SMJobBless setup 
-    in the specified app and tool Info.plist source files.
-    """
-    print(f"Setting up SMJobBless for app: {appPath}")
-    print(f"App Info.plist: {appInfoPlistPath}")
-    print(f"Tool Info.plist paths: {toolInfoPlistPaths}")
+    # A universal binary starts with a big-endian fat header followed by one fat_arch 
+    # record per architecture; anything else is treated as a thin image.
 
-    if not os.path.isdir(appPath):
-        raise CheckException(f"app directory not found: {appPath}", appPath)
+    magic, nfatArch = struct.unpack_from(">II", buffer, 0)
+    if magic not in (FAT_MAGIC, FAT_MAGIC_64):
+        return [MachOSlice(buffer, path)]
 
-    if not os.path.isfile(appInfoPlistPath):
-        raise CheckException(f"app Info.plist not found: {appInfoPlistPath}", appInfoPlistPath)
-    
-    for toolInfoPlistPath in toolInfoPlistPaths:
-        if not os.path.isfile(toolInfoPlistPath):
-            raise CheckException(f"tool Info.plist not found: {toolInfoPlistPath}", toolInfoPlistPath)
+    archFormat = ">iiQQII" if magic == FAT_MAGIC_64 else ">iiIII"
+    archSize = struct.calcsize(archFormat)
+    if 8 + nfatArch * archSize > len(buffer):
+        raise CheckException("Mach-O image malformed: fat header extends past end of file", path)
+    slices = []
+    for index in range(nfatArch):
+        _, _, sliceOffset, sliceSize = struct.unpack_from(archFormat, buffer, 8 + index * archSize)[:4]
+        if sliceOffset + sliceSize > len(buffer):
+            raise CheckException("Mach-O image malformed: architecture extends past end of file", path)
+        slices.append(MachOSlice(buffer[sliceOffset:sliceOffset + sliceSize], path))
+    if len(slices) == 0:
+        raise CheckException("Mach-O image malformed: universal binary has no architectures", path)
+    return slices
 
-    appReq = readDesignatedRequirement(appPath, "app")
-    print(f"App designated requirement: {appReq}")
 
-    toolDirPath = os.path.join(appPath, "Contents", "Library", "LaunchServices")
-    if not os.path.isdir(toolDirPath):
-        raise CheckException(f"tool directory not found: {toolDirPath}", toolDirPath)
-    
-    toolNameToReqMap = {}
-    for toolName in os.listdir(toolDirPath):
-        if toolName == ".DS_Store":
-            continue
-        toolPath = os.path.join(toolDirPath, toolName)
-        if not os.path.isfile(toolPath):
-            raise CheckException(f"tool directory contains a directory: {toolPath}", toolPath)
-        
-        req = readDesignatedRequirement(toolPath, "tool")
-        print(f"Tool {toolName} designated requirement: {req}")
-        toolNameToReqMap[toolName] = req
+def hostSlice(slices: List[MachOSlice]) -> MachOSlice:
+    """Returns the slice that matches the host architecture, falling back to the first slice."""
+    hostArch = MACHINE_ARCH_NAMES.get(platform.machine(), platform.machine())
+    for slice in slices:
+        if slice.archName == hostArch:
+            return slice
+    return slices[0]
 
-    appToolDict = {}
-    toolInfoPlistPathToToolInfoMap = {}
-    for toolInfoPlistPath in toolInfoPlistPaths:
-        try:
-            with open(toolInfoPlistPath, 'rb') as fp:
-                toolInfo = plistlib.load(fp)
-            toolInfoPlistPathToToolInfoMap[toolInfoPlistPath] = toolInfo
-            
-            if 'CFBundleIdentifier' not in toolInfo:
-                raise CheckException("'CFBundleIdentifier' not found", toolInfoPlistPath)
-            bundleID = toolInfo['CFBundleIdentifier']
-            if not isinstance(bundleID, str):
-                raise CheckException("'CFBundleIdentifier' must be a string", toolInfoPlistPath)
-            #appToolDict[bundleID] = toolNameToReqMap[os.path.basename(toolInfoPlistPath)]
-            appToolDict[bundleID] = toolNameToReqMap["com.apple.bsd.SMJobBlessHelper"]
-        except Exception as e:
-            raise CheckException(f"Error reading tool Info.plist: {str(e)}", toolInfoPlistPath)
 
-    try:
-        with open(appInfoPlistPath, 'rb') as fp:
-            appInfo = plistlib.load(fp)
-        needsUpdate = 'SMPrivilegedExecutables' not in appInfo
-        if not needsUpdate:
-            oldAppToolDict = appInfo['SMPrivilegedExecutables']
-            if not isinstance(oldAppToolDict, dict):
-                raise CheckException("'SMPrivilegedExecutables' must be a dictionary", appInfoPlistPath)
-            appToolDictSorted = sorted(appToolDict.items())
-            oldAppToolDictSorted = sorted(oldAppToolDict.items())
-            needsUpdate = appToolDictSorted != oldAppToolDictSorted
-        
-        if needsUpdate:
-            appInfo['SMPrivilegedExecutables'] = appToolDict
-            with open(appInfoPlistPath, 'wb') as fp:
-                plistlib.dump(appInfo, fp)
-            print(f"{appInfoPlistPath}: updated")
-    except Exception as e:
-        raise CheckException(f"Error updating app Info.plist: {str(e)}", appInfoPlistPath)
+class MachOFile:
+    """
+    A memory-mapped Mach-O file.  Use it as a context manager; the section views handed 
+    out by its slices refer directly to the mapping and must not be used after it's closed.  
+    A member of an archive being checked in place is parsed from its inflated contents instead.
+    """
 
-    toolAppListSorted = [appReq]  # only one element, so obviously sorted
-    for toolInfoPlistPath in toolInfoPlistPaths:
+    def __init__(self, path: str):
+        self.path = path
+        self._mmap: Optional[mmap.mmap] = None
         try:
-            with open(toolInfoPlistPath, 'rb') as fp:
-                toolInfo = plistlib.load(fp)
-            
-            needsUpdate = 'SMAuthorizedClients' not in toolInfo
-            if not needsUpdate:
-                oldToolAppList = toolInfo['SMAuthorizedClients']
-                if not isinstance(oldToolAppList, list):
-                    raise CheckException("'SMAuthorizedClients' must be an array", toolInfoPlistPath)
-                oldToolAppListSorted = sorted(oldToolAppList)
-                needsUpdate = toolAppListSorted != oldToolAppListSorted
-            
-            if needsUpdate:
-                toolInfo['SMAuthorizedClients'] = toolAppListSorted
-                with open(toolInfoPlistPath, 'wb') as fp:
-                    plistlib.dump(toolInfo, fp)
-                print(f"{toolInfoPlistPath}: updated")
-        except Exception as e:
-            raise CheckException(f"Error updating tool Info.plist: {str(e)}", toolInfoPlistPath)
+            if archiveMember(path) is not None:
+                self._view = memoryview(readFileData(path))
+            else:
+                with open(path, "rb") as fp:
+                    self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap)
+        except (OSError, ValueError) as e:
+            raise CheckException(f"Mach-O image unreadable: {str(e)}", path)
+        try:
+            self.slices = parseMachO(self._view, path)
+        except Exception:
+            self.close()
+            raise
 
+    def close(self) -> None:
+        self.slices = []
+        self._view.release()
+        if self._mmap is None:
+            return
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A caller is still holding a section view; the mapping goes away once 
+            # the last view is released.
+            pass
 
-def main() -> None:
-    options, appArgs = getopt.getopt(sys.argv[1:], "d")
-    
-    debug = False
-    for opt, val in options:
-        if opt == "-d":
-            debug = True
-        else:
-            raise UsageException()
+    def __enter__(self) -> "MachOFile":
+        return self
 
-    if len(appArgs) == 0:
-        raise UsageException()
-    command = appArgs[0]
-    if command == "check":
-        if len(appArgs) != 2:
-            raise UsageException()
-        check(appArgs[1])
-    elif command == "setreq":
-        if len(appArgs) < 4:
-            raise UsageException()
-        setreq(appArgs[1], appArgs[2], appArgs[3:])
-    else:
-        raise UsageException()
+    def __exit__(self, *excInfo) -> None:
+        self.close()
 
 
-if __name__ == "__main__":
-    try:
-        main()
+# Code signature constants, from <kern/cs_blobs.h>.
+
+CSMAGIC_REQUIREMENT = 0xfade0c00
+CSMAGIC_REQUIREMENTS = 0xfade0c01
+CSMAGIC_EMBEDDED_SIGNATURE = 0xfade0cc0
+
+CSSLOT_CODEDIRECTORY = 0
+CSSLOT_INFOSLOT = 1
+CSSLOT_REQUIREMENTS = 2
+CSSLOT_RESOURCEDIR = 3
+CSSLOT_ALTERNATE_CODEDIRECTORIES = 0x1000
+CSSLOT_SIGNATURESLOT = 0x10000
+
+CS_HASH_TYPE_NAMES = {
+    1: "sha1",
+    2: "sha256",
+    3: "sha256",        # truncated to 20 bytes
+    4: "sha384",
+}
+
+
+class CodeDirectory:
+    """The fixed fields of a CodeDirectory blob, plus its identifier and team identifier strings."""
+
+    def __init__(self, blob: memoryview, path: str):
+        self.blob = blob
+        if len(blob) < 44:
+            raise CheckException("code directory malformed: truncated", path)
+        (
+            _, length, self.version, self.flags, self.hashOffset, identOffset, 
+            self.nSpecialSlots, self.nCodeSlots, self.codeLimit, 
+            self.hashSize, self.hashType, self.platform, pageShift, _
+        ) = struct.unpack_from(">IIIIIIIIIBBBBI", blob, 0)
+        self.pageSize = 0 if pageShift == 0 else 1 << pageShift
+        self.identifier = readCString(blob, identOffset, path)
+        self.teamIdentifier = None
+        if self.version >= 0x20200 and len(blob) >= 52:
+            (teamOffset,) = struct.unpack_from(">I", blob, 48)
+            if teamOffset != 0:
+                self.teamIdentifier = readCString(blob, teamOffset, path)
+        if self.version >= 0x20300 and len(blob) >= 64:
+            (codeLimit64,) = struct.unpack_from(">Q", blob, 56)
+            if codeLimit64 != 0:
+                self.codeLimit = codeLimit64
+        if self.hashType not in CS_HASH_TYPE_NAMES:
+            raise CheckException(f"code directory malformed: unknown hash type {self.hashType}", path)
+        if self.hashOffset < self.nSpecialSlots * self.hashSize or self.hashOffset + self.nCodeSlots * self.hashSize > len(blob):
+            raise CheckException("code directory malformed: hash slots extend past end of blob", path)
+
+    def hashFunction(self):
+        """Returns the hashlib constructor for this code directory's hash type."""
+        return getattr(hashlib, CS_HASH_TYPE_NAMES[self.hashType])
+
+    def slotHash(self, slot: int) -> memoryview:
+        """Returns the hash held in a code slot or, for a negative slot number, a special slot."""
+        offset = self.hashOffset + slot * self.hashSize
+        return self.blob[offset:offset + self.hashSize]
+
+
+def readCString(buffer: memoryview, offset: int, path: str) -> str:
+    """Reads a NUL-terminated UTF-8 string that starts at the specified offset within the buffer."""
+    end = offset
+    while end < len(buffer) and buffer[end] != 0:
+        end += 1
+    if end == len(buffer):
+        raise CheckException("code signature malformed: unterminated string", path)
+    try:
+        return bytes(buffer[offset:end]).decode("utf-8")
+    except UnicodeDecodeError:
+        raise CheckException("code signature malformed: string not UTF-8", path)
+
+
+class CodeSignature:
+    """
+    The code signature embedded in a Mach-O slice.  The SuperBlob index is parsed 
+    once and each blob is kept as a view of the slice, keyed by its slot type.
+    """
+
+    def __init__(self, slice: MachOSlice):
+        self.path = slice.path
+        self.blobs: Dict[int, memoryview] = {}
+
+        dataOffset, dataSize = slice.codeSignature
+        if dataOffset + dataSize > len(slice.buffer) or dataSize < 12:
+            raise CheckException("code signature malformed: truncated", self.path)
+        superBlob = slice.buffer[dataOffset:dataOffset + dataSize]
+        magic, length, count = struct.unpack_from(">III", superBlob, 0)
+        if magic != CSMAGIC_EMBEDDED_SIGNATURE or length > dataSize or 12 + count * 8 > length:
+            raise CheckException("code signature malformed: bad SuperBlob", self.path)
+        for index in range(count):
+            slotType, blobOffset = struct.unpack_from(">II", superBlob, 12 + index * 8)
+            if blobOffset + 8 > length:
+                raise CheckException("code signature malformed: blob extends past end of signature", self.path)
+            (blobLength,) = struct.unpack_from(">I", superBlob, blobOffset + 4)
+            if blobLength < 8 or blobOffset + blobLength > length:
+                raise CheckException("code signature malformed: blob extends past end of signature", self.path)
+            self.blobs[slotType] = superBlob[blobOffset:blobOffset + blobLength]
+
+        if CSSLOT_CODEDIRECTORY not in self.blobs:
+            raise CheckException("code signature malformed: no code directory", self.path)
+        self.codeDirectory = CodeDirectory(self.blobs[CSSLOT_CODEDIRECTORY], self.path)
+
+    def codeDirectories(self) -> List[CodeDirectory]:
+        """Returns the primary code directory followed by any alternate ones."""
+        codeDirectories = [self.codeDirectory]
+        for slotType in sorted(self.blobs):
+            if CSSLOT_ALTERNATE_CODEDIRECTORIES <= slotType < CSSLOT_ALTERNATE_CODEDIRECTORIES + 5:
+                codeDirectories.append(CodeDirectory(self.blobs[slotType], self.path))
+        return codeDirectories
+
+    def cdHashes(self) -> List[bytes]:
+        """Returns the cdhash of each code directory, in the same order as codeDirectories()."""
+        return [
+            hashlib.new(CS_HASH_TYPE_NAMES.get(codeDirectory.hashType, "sha256"), codeDirectory.blob).digest()[:20]
+            for codeDirectory in self.codeDirectories()
+        ]
+
+    def certificateChain(self) -> List["Certificate"]:
+        """Returns the signing certificates, leaf first, or an empty list if the signature is ad hoc."""
+        cmsBlob = self.blobs.get(CSSLOT_SIGNATURESLOT)
+        if cmsBlob is None:
+            return []
+        return readCertificateChain(cmsBlob, self.path)
+
+    def explicitRequirement(self, requirementType: int) -> Optional["RequirementExpr"]:
+        """Returns the requirement of the given type from the internal requirements blob, if there is one."""
+        requirements = self.blobs.get(CSSLOT_REQUIREMENTS)
+        if requirements is None:
+            return None
+        if len(requirements) < 12:
+            raise CheckException("code signature malformed: bad requirements", self.path)
+        magic, length, count = struct.unpack_from(">III", requirements, 0)
+        if magic != CSMAGIC_REQUIREMENTS or length > len(requirements) or 12 + count * 8 > length:
+            raise CheckException("code signature malformed: bad requirements", self.path)
+        for index in range(count):
+            indexType, offset = struct.unpack_from(">II", requirements, 12 + index * 8)
+            if indexType == requirementType:
+                if offset + 8 > length:
+                    raise CheckException("code signature malformed: bad requirements", self.path)
+                (requirementLength,) = struct.unpack_from(">I", requirements, offset + 4)
+                return decodeRequirement(requirements[offset:offset + requirementLength], self.path)
+        return None
+
+    def designatedRequirement(self) -> "RequirementExpr":
+        """Returns the explicit designated requirement or, failing that, the implicit one."""
+        requirement = self.explicitRequirement(kSecDesignatedRequirementType)
+        if requirement is None:
+            requirement = implicitDesignatedRequirement(self)
+        return requirement
+
+
+def readCodeSignature(slice: MachOSlice) -> Optional[CodeSignature]:
+    """Returns the code signature embedded in the slice, or None if the slice is not signed."""
+    if slice.codeSignature is None:
+        return None
+    return CodeSignature(slice)
+
+
+# DER / BER decoding, just enough to pull the certificate chain out of the CMS blob of 
+# a code signature.  Apple's CMS uses BER indefinite lengths for the outer structures, 
+# so those are handled too.
+
+DER_SEQUENCE = 0x30
+DER_OID = 0x06
+DER_CONTEXT_0 = 0xa0
+DER_CONTEXT_3 = 0xa3
+
+
+def berElement(buffer: memoryview, offset: int, limit: int, path: str) -> Tuple[int, int, int, int]:
+    """
+    Decodes the BER element that starts at offset, returning its tag, the start and end 
+    of its contents, and the offset just past the element.
+    """
+    if offset + 2 > limit:
+        raise CheckException("code signature malformed: truncated certificate data", path)
+    tag = buffer[offset]
+    length = buffer[offset + 1]
+    start = offset + 2
+    if length == 0x80:
+        # Indefinite length: the contents run up to an end-of-contents marker, which 
+        # means walking the child elements to find it.
+        end = start
+        while True:
+            if end + 2 > limit:
+                raise CheckException("code signature malformed: unterminated certificate data", path)
+            if buffer[end] == 0 and buffer[end + 1] == 0:
+                return (tag, start, end, end + 2)
+            end = berElement(buffer, end, limit, path)[3]
+    if length & 0x80:
+        lengthSize = length & 0x7f
+        if lengthSize > 4 or start + lengthSize > limit:
+            raise CheckException("code signature malformed: bad certificate data length", path)
+        length = int.from_bytes(buffer[start:start + lengthSize], "big")
+        start += lengthSize
+    if start + length > limit:
+        raise CheckException("code signature malformed: certificate data extends past end of blob", path)
+    return (tag, start, start + length, start + length)
+
+
+def berChildren(buffer: memoryview, start: int, end: int, path: str) -> List[Tuple[int, int, int, int]]:
+    """Returns the elements contained in the constructed element whose contents run from start to end."""
+    children = []
+    offset = start
+    while offset < end:
+        child = berElement(buffer, offset, end, path)
+        children.append(child)
+        offset = child[3]
+    return children
+
+
+def decodeOID(data: bytes) -> str:
+    """Returns the dotted form of DER-encoded object identifier contents."""
+    if len(data) == 0:
+        return ""
+    components = [str(min(data[0] // 40, 2)), str(data[0] - 40 * min(data[0] // 40, 2))]
+    value = 0
+    for byte in data[1:]:
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            components.append(str(value))
+            value = 0
+    return ".".join(components)
+
+
+OID_COMMON_NAME = "2.5.4.3"
+OID_ORGANIZATION = "2.5.4.10"
+OID_ORGANIZATIONAL_UNIT = "2.5.4.11"
+
+# The short names the requirement language uses for certificate subject fields.
+
+SUBJECT_FIELD_OIDS = {
+    "CN": OID_COMMON_NAME,
+    "C": "2.5.4.6",
+    "L": "2.5.4.7",
+    "ST": "2.5.4.8",
+    "O": OID_ORGANIZATION,
+    "OU": OID_ORGANIZATIONAL_UNIT,
+    "STREET": "2.5.4.9",
+    "email": "1.2.840.113549.1.9.1",
+}
+
+
+class Certificate:
+    """The parts of an X.509 certificate that code requirements can refer to."""
+
+    def __init__(self, der: bytes, path: str):
+        self.der = der
+        self.sha1 = hashlib.sha1(der).digest()
+        buffer = memoryview(der)
+        tag, start, end, _ = berElement(buffer, 0, len(buffer), path)
+        certificateFields = berChildren(buffer, start, end, path)
+        if tag != DER_SEQUENCE or len(certificateFields) < 1:
+            raise CheckException("code signature malformed: bad certificate", path)
+        tbsFields = berChildren(buffer, certificateFields[0][1], certificateFields[0][2], path)
+        if len(tbsFields) > 0 and tbsFields[0][0] == DER_CONTEXT_0:
+            del tbsFields[0]        # version
+        if len(tbsFields) < 6:
+            raise CheckException("code signature malformed: bad certificate", path)
+
+        def raw(field: Tuple[int, int, int, int]) -> bytes:
+            return bytes(buffer[field[1]:field[2]])
+
+        self.issuer = raw(tbsFields[2])
+        self.subject = raw(tbsFields[4])
+
+        # Subject is a SEQUENCE of SETs of (OID, value) SEQUENCEs.
+
+        self.subjectFields: Dict[str, List[str]] = {}
+        for rdn in berChildren(buffer, tbsFields[4][1], tbsFields[4][2], path):
+            for attribute in berChildren(buffer, rdn[1], rdn[2], path):
+                attributeFields = berChildren(buffer, attribute[1], attribute[2], path)
+                if len(attributeFields) == 2 and attributeFields[0][0] == DER_OID:
+                    value = raw(attributeFields[1]).decode("utf-8", "replace")
+                    self.subjectFields.setdefault(decodeOID(raw(attributeFields[0])), []).append(value)
+
+        # Extensions are in the optional [3] field, as a SEQUENCE of (OID, [critical], value).
+
+        self.extensions: Dict[str, bytes] = {}
+        for field in tbsFields[6:]:
+            if field[0] == DER_CONTEXT_3:
+                extensionList = berChildren(buffer, field[1], field[2], path)
+                if len(extensionList) == 1:
+                    for extension in berChildren(buffer, extensionList[0][1], extensionList[0][2], path):
+                        extensionFields = berChildren(buffer, extension[1], extension[2], path)
+                        if len(extensionFields) >= 2 and extensionFields[0][0] == DER_OID:
+                            self.extensions[decodeOID(raw(extensionFields[0]))] = raw(extensionFields[-1])
+
+    def subjectField(self, oid: str) -> Optional[str]:
+        values = self.subjectFields.get(oid)
+        return None if not values else values[0]
+
+    @property
+    def isSelfIssued(self) -> bool:
+        return self.issuer == self.subject
+
+
+def readCertificateChain(cmsBlob: memoryview, path: str) -> List["Certificate"]:
+    """
+    Returns the certificates from the CMS SignedData in a code signature's signature slot, 
+    ordered leaf first and anchor last, or an empty list if the signature is ad hoc.
+    """
+
+    # Skip the blob wrapper's magic and length; what follows is a ContentInfo whose 
+    # explicitly tagged content is the SignedData.
+
+    buffer = cmsBlob[8:]
+    if len(buffer) == 0:
+        return []
+    _, start, end, _ = berElement(buffer, 0, len(buffer), path)
+    contentInfo = berChildren(buffer, start, end, path)
+    if len(contentInfo) < 2:
+        return []
+    explicitContent = berChildren(buffer, contentInfo[1][1], contentInfo[1][2], path)
+    if len(explicitContent) != 1:
+        raise CheckException("code signature malformed: bad CMS content", path)
+    certificates = []
+    for field in berChildren(buffer, explicitContent[0][1], explicitContent[0][2], path):
+        if field[0] == DER_CONTEXT_0:
+            offset = field[1]
+            while offset < field[2]:
+                elementEnd = berElement(buffer, offset, field[2], path)[3]
+                certificates.append(Certificate(bytes(buffer[offset:elementEnd]), path))
+                offset = elementEnd
+            break
+
+    # The certificates aren't in any particular order; the leaf is the one that issued 
+    # nothing else, and the chain is followed from there through the issuers.
+
+    if len(certificates) == 0:
+        return []
+    issuers = {certificate.issuer for certificate in certificates if not certificate.isSelfIssued}
+    leaves = [certificate for certificate in certificates if certificate.subject not in issuers]
+    chain = [leaves[0] if len(leaves) != 0 else certificates[0]]
+    bySubject = {certificate.subject: certificate for certificate in certificates}
+    while not chain[-1].isSelfIssued:
+        issuer = bySubject.get(chain[-1].issuer)
+        if issuer is None or issuer in chain:
+            break
+        chain.append(issuer)
+    return chain
+
+
+# Code requirement expression opcodes and match operations, from <Security/requirement.h>.  
+# A decoded requirement is a tuple whose first element is the opcode and whose remaining 
+# elements are its operands; a match is a tuple of the match operation and its value.
+
+opFalse = 0
+opTrue = 1
+opIdent = 2
+opAppleAnchor = 3
+opAnchorHash = 4
+opInfoKeyValue = 5
+opAnd = 6
+opOr = 7
+opCDHash = 8
+opNot = 9
+opInfoKeyField = 10
+opCertField = 11
+opTrustedCert = 12
+opTrustedCerts = 13
+opCertGeneric = 14
+opAppleGenericAnchor = 15
+opEntitlementField = 16
+opCertPolicy = 17
+opNamedAnchor = 18
+opNamedCode = 19
+opPlatform = 20
+opNotarized = 21
+opCertFieldDate = 22
+opLegacyDevID = 23
+opFlagMask = 0xff000000
+
+matchExists = 0
+matchEqual = 1
+matchContains = 2
+matchBeginsWith = 3
+matchEndsWith = 4
+matchLessThan = 5
+matchGreaterThan = 6
+matchLessEqual = 7
+matchGreaterEqual = 8
+matchOn = 9
+matchBefore = 10
+matchAfter = 11
+matchOnOrBefore = 12
+matchOnOrAfter = 13
+matchAbsent = 14
+
+kSecDesignatedRequirementType = 3
+
+leafCertSlot = 0
+anchorCertSlot = -1
+
+# SHA-1 of the Apple Root CA certificate, which is what "anchor apple" means.
+
+APPLE_ANCHOR_HASH = bytes.fromhex("611e5b662c593a08ff58d14ae22452d198df6c60")
+
+OID_APPLE_IPHONE_INTERMEDIATE = "1.2.840.113635.100.6.2.1"
+OID_APPLE_DEVELOPER_ID_INTERMEDIATE = "1.2.840.113635.100.6.2.6"
+OID_APPLE_DEVELOPER_ID_LEAF = "1.2.840.113635.100.6.1.13"
+
+RequirementExpr = Tuple
+
+
+class RequirementDecoder:
+    """Decodes the expression of a binary requirement blob into a RequirementExpr tree."""
+
+    def __init__(self, blob: memoryview, path: str):
+        self.blob = blob
+        self.path = path
+        self.offset = 12        # magic, length, kind
+
+    def _malformed(self) -> CheckException:
+        return CheckException("code signature malformed: bad requirement", self.path)
+
+    def _uint32(self) -> int:
+        if self.offset + 4 > len(self.blob):
+            raise self._malformed()
+        (value,) = struct.unpack_from(">I", self.blob, self.offset)
+        self.offset += 4
+        return value
+
+    def _int32(self) -> int:
+        value = self._uint32()
+        return value - (1 << 32) if value & 0x80000000 else value
+
+    def _data(self) -> bytes:
+        length = self._uint32()
+        if self.offset + length > len(self.blob):
+            raise self._malformed()
+        data = bytes(self.blob[self.offset:self.offset + length])
+        self.offset += (length + 3) & ~3
+        return data
+
+    def _match(self) -> Tuple:
+        op = self._uint32()
+        if op in (matchExists, matchAbsent):
+            return (op,)
+        if op in (matchOn, matchBefore, matchAfter, matchOnOrBefore, matchOnOrAfter):
+            high = self._uint32()
+            return (op, (high << 32) | self._uint32())
+        if op > matchAbsent:
+            raise self._malformed()
+        return (op, self._data())
+
+    def expr(self) -> RequirementExpr:
+        op = self._uint32() & ~opFlagMask
+        if op in (opFalse, opTrue, opAppleAnchor, opAppleGenericAnchor, opTrustedCerts, opNotarized, opLegacyDevID):
+            return (op,)
+        if op in (opIdent, opCDHash, opNamedAnchor, opNamedCode):
+            return (op, self._data())
+        if op in (opAnd, opOr):
+            left = self.expr()
+            return (op, left, self.expr())
+        if op == opNot:
+            return (op, self.expr())
+        if op == opAnchorHash:
+            slot = self._int32()
+            return (op, slot, self._data())
+        if op == opInfoKeyValue:
+            key = self._data()
+            return (op, key, self._data())
+        if op in (opInfoKeyField, opEntitlementField):
+            key = self._data()
+            return (op, key, self._match())
+        if op in (opCertField, opCertGeneric, opCertPolicy, opCertFieldDate):
+            slot = self._int32()
+            field = self._data()
+            return (op, slot, field, self._match())
+        if op == opTrustedCert:
+            return (op, self._int32())
+        if op == opPlatform:
+            return (op, self._int32())
+        raise CheckException(f"code signature malformed: requirement opcode {op} not understood", self.path)
+
+
+def decodeRequirement(blob: memoryview, path: str) -> RequirementExpr:
+    """Decodes a requirement blob (CSMAGIC_REQUIREMENT) into a RequirementExpr tree."""
+    if len(blob) < 12:
+        raise CheckException("code signature malformed: bad requirement", path)
+    magic, _, kind = struct.unpack_from(">III", blob, 0)
+    if magic != CSMAGIC_REQUIREMENT or kind != 1:
+        raise CheckException("code signature malformed: bad requirement", path)
+    return RequirementDecoder(blob, path).expr()
+
+
+# Syntax levels, used to decide where the text form needs parentheses.
+
+slPrimary = 0
+slAnd = 1
+slOr = 2
+slTop = 3
+
+
+def formatRequirementData(data: bytes, dotOkay: bool = False) -> str:
+    """
+    Formats a string operand the way codesign does: bare if it's a simple word, quoted if 
+    it's printable, and as hex otherwise.
+    """
+    mode = "simple"
+    for index, byte in enumerate(data):
+        char = chr(byte)
+        if (byte < 0x80 and char.isalnum()) or (char == "." and dotOkay):
+            if index == 0 and char.isdigit():
+                mode = "printable"
+        elif 0x20 < byte < 0x7f or char in " \t\n\r\f\v":
+            mode = "printable"
+        else:
+            mode = "binary"
+            break
+    if len(data) == 0 and mode == "simple":
+        mode = "printable"
+    if mode == "simple":
+        return data.decode("ascii")
+    if mode == "printable":
+        return '"' + data.decode("ascii").replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return "0x" + data.hex()
+
+
+def formatCertSlot(slot: int) -> str:
+    if slot == anchorCertSlot:
+        return " root"
+    if slot == leafCertSlot:
+        return " leaf"
+    return f" {slot}"
+
+
+def formatTimestamp(value: int) -> str:
+    # Timestamps are CFAbsoluteTime seconds, that is, seconds since 2001-01-01 UTC.
+    return "<" + time.strftime("%Y-%m-%d %H:%M:%S +0000", time.gmtime(978307200 + value)) + ">"
+
+
+def formatMatch(match: Tuple) -> str:
+    op = match[0]
+    if op == matchExists:
+        return " /* exists */"
+    if op == matchAbsent:
+        return " absent "
+    if op >= matchOn:
+        return {matchOn: " = ", matchBefore: " < ", matchAfter: " > ", matchOnOrBefore: " <= ", matchOnOrAfter: " >= "}[op] + formatTimestamp(match[1])
+    value = formatRequirementData(match[1])
+    if op == matchBeginsWith:
+        return f" = {value}*"
+    if op == matchEndsWith:
+        return f" = *{value}"
+    return {matchEqual: " = ", matchContains: " ~ ", matchLessThan: " < ", matchGreaterThan: " > ", matchLessEqual: " <= ", matchGreaterEqual: " >= "}[op] + value
+
+
+def formatRequirement(expr: RequirementExpr, level: int = slTop) -> str:
+    """Returns the text form of a requirement, exactly as "codesign -d -r -" prints it."""
+    op = expr[0]
+    if op == opFalse:
+        return "never"
+    if op == opTrue:
+        return "always"
+    if op == opIdent:
+        return "identifier " + formatRequirementData(expr[1])
+    if op == opAppleAnchor:
+        return "anchor apple"
+    if op == opAppleGenericAnchor:
+        return "anchor apple generic"
+    if op == opAnchorHash:
+        return f"certificate{formatCertSlot(expr[1])} = H\"{expr[2].hex()}\""
+    if op == opInfoKeyValue:
+        return f"info[{formatRequirementData(expr[1], True)}] = {formatRequirementData(expr[2])}"
+    if op in (opAnd, opOr):
+        opLevel, word = (slAnd, "and") if op == opAnd else (slOr, "or")
+        text = f"{formatRequirement(expr[1], opLevel)} {word} {formatRequirement(expr[2], opLevel)}"
+        return f"({text})" if level < opLevel else text
+    if op == opNot:
+        return "! " + formatRequirement(expr[1], slPrimary)
+    if op == opCDHash:
+        return f"cdhash H\"{expr[1].hex()}\""
+    if op == opInfoKeyField:
+        return f"info[{formatRequirementData(expr[1], True)}]{formatMatch(expr[2])}"
+    if op == opEntitlementField:
+        return f"entitlement[{formatRequirementData(expr[1], True)}]{formatMatch(expr[2])}"
+    if op == opCertField:
+        return f"certificate{formatCertSlot(expr[1])}[{formatRequirementData(expr[2], True)}]{formatMatch(expr[3])}"
+    if op in (opCertGeneric, opCertPolicy, opCertFieldDate):
+        prefix = {opCertGeneric: "field", opCertPolicy: "policy", opCertFieldDate: "timestamp"}[op]
+        return f"certificate{formatCertSlot(expr[1])}[{prefix}.{decodeOID(expr[2])}]{formatMatch(expr[3])}"
+    if op == opTrustedCert:
+        return f"certificate{formatCertSlot(expr[1])} trusted"
+    if op == opTrustedCerts:
+        return "anchor trusted"
+    if op == opNamedAnchor:
+        return "anchor apple " + formatRequirementData(expr[1])
+    if op == opNamedCode:
+        return "(" + formatRequirementData(expr[1]) + ")"
+    if op == opPlatform:
+        return f"platform = {expr[1]}"
+    if op == opNotarized:
+        return "notarized"
+    if op == opLegacyDevID:
+        return "legacy"
+    raise ValueError(f"unknown requirement opcode {op}")
+
+
+def encodeOID(oid: str) -> bytes:
+    """Returns the DER contents of the object identifier with the given dotted form."""
+    components = [int(component) for component in oid.split(".")]
+    encoded = bytearray([components[0] * 40 + components[1]])
+    for component in components[2:]:
+        chunk = bytearray([component & 0x7f])
+        component >>= 7
+        while component:
+            chunk.insert(0, 0x80 | (component & 0x7f))
+            component >>= 7
+        encoded += chunk
+    return bytes(encoded)
+
+
+def implicitDesignatedRequirement(signature: "CodeSignature") -> RequirementExpr:
+    """
+    Synthesizes the designated requirement that the system assumes for code whose 
+    signature doesn't carry an explicit one, following the rules of Security's DRMaker.
+    """
+    chain = signature.certificateChain()
+
+    # An ad hoc signature can only be identified by its code directory hashes.
+
+    if len(chain) == 0:
+        cdHashes = signature.cdHashes()
+        expr: RequirementExpr = (opCDHash, cdHashes[-1])
+        for cdHash in reversed(cdHashes[:-1]):
+            expr = (opOr, (opCDHash, cdHash), expr)
+        return expr
+
+    identifier = (opIdent, signature.codeDirectory.identifier.encode("utf-8"))
+    if chain[-1].sha1 == APPLE_ANCHOR_HASH:
+        intermediate = chain[1] if len(chain) > 1 else None
+        if intermediate is not None and OID_APPLE_IPHONE_INTERMEDIATE in intermediate.extensions:
+            anchor: RequirementExpr = (opAnd, (opAppleGenericAnchor,), (opAnd, 
+                (opCertField, leafCertSlot, b"subject.CN", (matchEqual, (chain[0].subjectField(OID_COMMON_NAME) or "").encode("utf-8"))), 
+                (opCertGeneric, 1, encodeOID(OID_APPLE_IPHONE_INTERMEDIATE), (matchExists,))
+            ))
+        elif intermediate is not None and OID_APPLE_DEVELOPER_ID_INTERMEDIATE in intermediate.extensions and OID_APPLE_DEVELOPER_ID_LEAF in chain[0].extensions:
+            anchor = (opAnd, (opAppleGenericAnchor,), (opAnd, 
+                (opCertGeneric, 1, encodeOID(OID_APPLE_DEVELOPER_ID_INTERMEDIATE), (matchExists,)), (opAnd, 
+                (opCertGeneric, leafCertSlot, encodeOID(OID_APPLE_DEVELOPER_ID_LEAF), (matchExists,)), 
+                (opCertField, leafCertSlot, b"subject.OU", (matchEqual, (chain[0].subjectField(OID_ORGANIZATIONAL_UNIT) or "").encode("utf-8")))
+            )))
+        else:
+            anchor = (opAppleAnchor,)
+    else:
+        # Pin the highest certificate in the chain that still belongs to the leaf's 
+        # organization, or the anchor if they all do.
+
+        slot = leafCertSlot
+        leafOrganization = chain[0].subjectField(OID_ORGANIZATION)
+        if leafOrganization is not None:
+            while slot + 1 < len(chain) and chain[slot + 1].subjectField(OID_ORGANIZATION) == leafOrganization:
+                slot += 1
+            if slot == len(chain) - 1:
+                anchor = (opAnchorHash, anchorCertSlot, chain[slot].sha1)
+            else:
+                anchor = (opAnchorHash, slot, chain[slot].sha1)
+        else:
+            anchor = (opAnchorHash, slot, chain[slot].sha1)
+    return (opAnd, identifier, anchor)
+
+
+# Parsing of the code requirement language, the text form that formatRequirement
+# produces and that SMPrivilegedExecutables and SMAuthorizedClients hold, into the same
+# RequirementExpr trees that RequirementDecoder produces from binary requirements.
+
+REQUIREMENT_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+|/\*.*?\*/|//[^\n]*)
+  | H"(?P<hash>[0-9A-Fa-f]*)"
+  | 0x(?P<hex>[0-9A-Fa-f]+)
+  | "(?P<string>(?:[^"\\]|\\.)*)"
+  | (?P<punct>=>|<=|>=|==|[()\[\]!=~<>*])
+  | (?P<word>[A-Za-z0-9_\-][A-Za-z0-9_.\-]*)
+""", re.VERBOSE | re.DOTALL)
+
+
+def tokenizeRequirement(text: str) -> List[Tuple[str, object]]:
+    """Splits requirement text into (kind, value) tokens; strings, hashes and hex data become bytes."""
+    tokens: List[Tuple[str, object]] = []
+    offset = 0
+    while offset < len(text):
+        match = REQUIREMENT_TOKEN_PATTERN.match(text, offset)
+        if match is None:
+            raise ValueError(f"unexpected character '{text[offset]}'")
+        offset = match.end()
+        kind = match.lastgroup
+        if kind == "space":
+            continue
+        if kind == "hash" or kind == "hex":
+            tokens.append(("data", bytes.fromhex(match.group(kind))))
+        elif kind == "string":
+            tokens.append(("data", re.sub(r"\\(.)", r"\1", match.group(kind)).encode("utf-8")))
+        else:
+            tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+class RequirementParser:
+    """
+    A recursive descent parser for the code requirement language.  As in Security's own
+    parser, "and" binds more tightly than "or" and both associate to the left.
+    """
+
+    def __init__(self, text: str):
+        self.tokens = tokenizeRequirement(text)
+        self.index = 0
+
+    def _peek(self) -> Optional[Tuple[str, object]]:
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def _accept(self, kind: str, value: Optional[str] = None) -> bool:
+        token = self._peek()
+        if token is not None and token[0] == kind and (value is None or token[1] == value):
+            self.index += 1
+            return True
+        return False
+
+    def _expect(self, kind: str, value: Optional[str] = None) -> None:
+        if not self._accept(kind, value):
+            raise ValueError(f"expected '{value or kind}' {self._position()}")
+
+    def _position(self) -> str:
+        token = self._peek()
+        return "at end" if token is None else f"before '{token[1] if isinstance(token[1], str) else 'data'}'"
+
+    def _data(self) -> bytes:
+        """Returns a string operand, which may be quoted, bare or hex."""
+        token = self._peek()
+        if token is None or token[0] not in ("data", "word"):
+            raise ValueError(f"expected a value {self._position()}")
+        self.index += 1
+        return token[1] if isinstance(token[1], bytes) else token[1].encode("utf-8")
+
+    def _integer(self) -> int:
+        token = self._peek()
+        if token is None or token[0] != "word" or not re.fullmatch(r"-?[0-9]+", token[1]):
+            raise ValueError(f"expected a number {self._position()}")
+        self.index += 1
+        return int(token[1])
+
+    def requirement(self) -> RequirementExpr:
+        # codesign prints a designated requirement after a "designated =>" label.
+        if self._accept("word", "designated"):
+            self._expect("punct", "=>")
+        expr = self._or()
+        if self._peek() is not None:
+            raise ValueError(f"unexpected '{self._peek()[1]}'")
+        return expr
+
+    def _or(self) -> RequirementExpr:
+        expr = self._and()
+        while self._accept("word", "or"):
+            expr = (opOr, expr, self._and())
+        return expr
+
+    def _and(self) -> RequirementExpr:
+        expr = self._primary()
+        while self._accept("word", "and"):
+            expr = (opAnd, expr, self._primary())
+        return expr
+
+    def _primary(self) -> RequirementExpr:
+        if self._accept("punct", "!"):
+            return (opNot, self._primary())
+        if self._accept("punct", "("):
+            expr = self._or()
+            self._expect("punct", ")")
+            return expr
+        token = self._peek()
+        if token is None or token[0] != "word":
+            raise ValueError(f"expected a requirement {self._position()}")
+        self.index += 1
+        word = token[1]
+        if word in ("always", "true"):
+            return (opTrue,)
+        if word in ("never", "false"):
+            return (opFalse,)
+        if word == "identifier":
+            self._accept("punct", "=")
+            return (opIdent, self._data())
+        if word == "cdhash":
+            self._accept("punct", "=")
+            return (opCDHash, self._data())
+        if word == "platform":
+            self._expect("punct", "=")
+            return (opPlatform, self._integer())
+        if word == "notarized":
+            return (opNotarized,)
+        if word == "legacy":
+            return (opLegacyDevID,)
+        if word in ("info", "entitlement"):
+            self._expect("punct", "[")
+            key = self._data()
+            self._expect("punct", "]")
+            return (opInfoKeyField if word == "info" else opEntitlementField, key, self._match())
+        if word == "anchor":
+            if self._accept("word", "apple"):
+                if self._accept("word", "generic"):
+                    return (opAppleGenericAnchor,)
+                token = self._peek()
+                if token is not None and (token[0] == "data" or (token[0] == "word" and token[1] not in ("and", "or"))):
+                    return (opNamedAnchor, self._data())
+                return (opAppleAnchor,)
+            if self._accept("word", "trusted"):
+                return (opTrustedCerts,)
+            return self._certificate(anchorCertSlot)
+        if word in ("certificate", "cert"):
+            if self._accept("word", "leaf"):
+                slot = leafCertSlot
+            elif self._accept("word", "root") or self._accept("word", "anchor"):
+                slot = anchorCertSlot
+            else:
+                slot = self._integer()
+            return self._certificate(slot)
+        raise ValueError(f"unknown requirement '{word}'")
+
+    def _certificate(self, slot: int) -> RequirementExpr:
+        if self._accept("punct", "="):
+            return (opAnchorHash, slot, self._data())
+        if self._accept("word", "trusted"):
+            return (opTrustedCert, slot)
+        self._expect("punct", "[")
+        field = self._data().decode("utf-8")
+        self._expect("punct", "]")
+        match = self._match()
+        for prefix, op in (("field.", opCertGeneric), ("policy.", opCertPolicy), ("timestamp.", opCertFieldDate)):
+            if field.startswith(prefix):
+                try:
+                    return (op, slot, encodeOID(field[len(prefix):]), match)
+                except ValueError:
+                    raise ValueError(f"bad object identifier '{field[len(prefix):]}'")
+        return (opCertField, slot, field.encode("utf-8"), match)
+
+    def _match(self) -> Tuple:
+        if self._accept("word", "exists"):
+            return (matchExists,)
+        if self._accept("word", "absent"):
+            return (matchAbsent,)
+        if self._accept("punct", "=") or self._accept("punct", "=="):
+            leadingWildcard = self._accept("punct", "*")
+            value = self._data()
+            trailingWildcard = self._accept("punct", "*")
+            if leadingWildcard and trailingWildcard:
+                return (matchContains, value)
+            if leadingWildcard:
+                return (matchEndsWith, value)
+            if trailingWildcard:
+                return (matchBeginsWith, value)
+            return (matchEqual, value)
+        for punct, op in (("~", matchContains), ("<", matchLessThan), (">", matchGreaterThan), ("<=", matchLessEqual), (">=", matchGreaterEqual)):
+            if self._accept("punct", punct):
+                return (op, self._data())
+        return (matchExists,)
+
+
+@functools.lru_cache(maxsize=4096)
+def compileRequirement(text: str) -> RequirementExpr:
+    """
+    Parses requirement text into a RequirementExpr tree, raising ValueError if it's not
+    valid.  Trees are cached by text, since the same few requirements are compiled over
+    and over when many apps and tools are checked.
+    """
+    return RequirementParser(text).requirement()
+
+
+def canonicalRequirement(expr: RequirementExpr) -> RequirementExpr:
+    """
+    Returns a form of the requirement that's the same for all equivalent ways of writing
+    it: nested "and"s and "or"s are flattened and their operands sorted, and the legacy
+    info key comparison is expressed as a match.  It's for comparison only.
+    """
+    op = expr[0]
+    if op in (opAnd, opOr):
+        operands: List[RequirementExpr] = []
+        pending = [expr[1], expr[2]]
+        while pending:
+            operand = pending.pop()
+            if operand[0] == op:
+                pending.extend((operand[1], operand[2]))
+            else:
+                operands.append(canonicalRequirement(operand))
+        return (op, tuple(sorted(operands, key=repr)))
+    if op == opNot:
+        return (op, canonicalRequirement(expr[1]))
+    if op == opInfoKeyValue:
+        return (opInfoKeyField, expr[1], (matchEqual, expr[2]))
+    return expr
+
+
+def requirementsEquivalent(text: str, otherText: str) -> bool:
+    """Returns whether two requirements are the same apart from how they're written; text that doesn't parse is only equivalent to the same text."""
+    if text == otherText:
+        return True
+    try:
+        return canonicalRequirement(compileRequirement(text)) == canonicalRequirement(compileRequirement(otherText))
+    except ValueError:
+        return False
+
+
+class SigningFacts(NamedTuple):
+    """What a requirement can be evaluated against, read from a program's code signature (for its host architecture)."""
+    identifier: str
+    cdHashes: List[bytes]
+    chain: List["Certificate"]
+    info: Dict
+    entitlements: Dict
+
+
+def readSigningFacts(programPath: str) -> SigningFacts:
+    """Reads the signing facts of a program, either a bundle or a tool, without running codesign."""
+    executablePath = programExecutablePath(programPath)
+    with MachOFile(executablePath) as machO:
+        slice = hostSlice(machO.slices)
+        signature = readCodeSignature(slice)
+        if signature is None:
+            raise CheckException("code signature not found", programPath)
+        identifier = signature.codeDirectory.identifier
+        cdHashes = signature.cdHashes()
+        chain = signature.certificateChain()
+        if isDirectory(programPath):
+            infoData: Optional[bytes] = readFileData(bundleLayout(programPath).infoPath)
+        else:
+            infoSection = slice.section("__TEXT", "__info_plist")
+            infoData = None if infoSection is None else bytes(infoSection)
+        entitlementsBlob = signature.blobs.get(CSSLOT_ENTITLEMENTS)
+        entitlementsData = None if entitlementsBlob is None else bytes(entitlementsBlob[8:])
+        del signature
+
+    # Property lists that can't be read just leave nothing for info and entitlement
+    # requirements to match.
+
+    def plist(data: Optional[bytes]) -> Dict:
+        try:
+            value = plistlib.loads(data) if data is not None else {}
+        except Exception:
+            return {}
+        return value if isinstance(value, dict) else {}
+
+    return SigningFacts(identifier, cdHashes, chain, plist(infoData), plist(entitlementsData))
+
+
+def evaluateMatch(match: Tuple, values: List[object]) -> Optional[bool]:
+    """Returns whether any of the values satisfies the match, or None if that can't be decided in-process."""
+    op = match[0]
+    if op == matchExists:
+        return len(values) != 0
+    if op == matchAbsent:
+        return len(values) == 0
+    if op >= matchOn:
+        return None
+    target = match[1].decode("utf-8", "replace")
+    for value in values:
+        text = value if isinstance(value, str) else str(value)
+        if op == matchEqual:
+            result = text == target
+        elif op == matchContains:
+            result = target in text
+        elif op == matchBeginsWith:
+            result = text.startswith(target)
+        elif op == matchEndsWith:
+            result = text.endswith(target)
+        else:
+            result = {matchLessThan: text < target, matchGreaterThan: text > target, matchLessEqual: text <= target, matchGreaterEqual: text >= target}[op]
+        if result:
+            return True
+    return False
+
+
+def evaluateRequirement(expr: RequirementExpr, facts: SigningFacts) -> Optional[bool]:
+    """
+    Returns whether the signing facts satisfy the requirement, or None if that depends on
+    something only the system knows, such as trust settings or notarization.  Unknowns
+    propagate through "and", "or" and "!" as in three-valued logic, so a requirement is
+    only reported as unsatisfied when it definitely is.
+    """
+    op = expr[0]
+    if op in (opAnd, opOr):
+        left = evaluateRequirement(expr[1], facts)
+        if left is (op == opOr):
+            return left
+        right = evaluateRequirement(expr[2], facts)
+        if right is (op == opOr):
+            return right
+        return None if left is None or right is None else left
+    if op == opNot:
+        result = evaluateRequirement(expr[1], facts)
+        return None if result is None else not result
+    if op == opTrue:
+        return True
+    if op == opFalse:
+        return False
+    if op == opIdent:
+        return facts.identifier.encode("utf-8") == expr[1]
+    if op == opCDHash:
+        return expr[1] in facts.cdHashes
+    if op in (opAppleAnchor, opAppleGenericAnchor):
+        if len(facts.chain) != 0 and facts.chain[-1].sha1 == APPLE_ANCHOR_HASH:
+            return True
+
+        # Apple has more than one root, and only the original is known here.
+
+        if len(facts.chain) != 0 and facts.chain[-1].subjectField(OID_ORGANIZATION) == "Apple Inc.":
+            return None
+        return False
+    if op in (opInfoKeyValue, opInfoKeyField, opEntitlementField):
+        source = facts.entitlements if op == opEntitlementField else facts.info
+        key = expr[1].decode("utf-8", "replace")
+        values = [source[key]] if key in source else []
+        return evaluateMatch((matchEqual, expr[2]) if op == opInfoKeyValue else expr[2], values)
+    if op in (opAnchorHash, opCertField, opCertGeneric):
+        slot = expr[1]
+        index = slot if slot >= 0 else len(facts.chain) + slot
+        certificate = facts.chain[index] if 0 <= index < len(facts.chain) else None
+        if op == opAnchorHash:
+            return certificate is not None and certificate.sha1 == expr[2]
+        if op == opCertGeneric:
+            if expr[3][0] not in (matchExists, matchAbsent):
+                return None
+            return evaluateMatch(expr[3], [] if certificate is None or decodeOID(expr[2]) not in certificate.extensions else [True])
+        field = expr[2].decode("utf-8", "replace")
+        if not field.startswith("subject."):
+            return None
+        fieldName = field[len("subject."):]
+        oid = SUBJECT_FIELD_OIDS.get(fieldName, fieldName)
+        return evaluateMatch(expr[3], [] if certificate is None else certificate.subjectFields.get(oid, []))
+    return None
+
+
+# In-process code signature verification.  This checks that the code and the files 
+# bound to the signature (Info.plist, CodeResources and the blobs in the signature itself) 
+# match the hashes in every code directory; checkCodeSignature then checks the resources 
+# CodeResources lists with verifyResources.  It doesn't evaluate the CMS signature over the 
+# code directory, or the designated requirement; strict mode, which runs codesign, does.
+
+CSSLOT_ENTITLEMENTS = 5
+CSSLOT_DER_ENTITLEMENTS = 7
+
+# Pages are hashed in chunks of this many, one chunk per task on the hashing pool.
+
+CODE_HASH_CHUNK_PAGES = 256
+
+hashingExecutorInstance: Optional[concurrent.futures.ThreadPoolExecutor] = None
+hashingExecutorLock = threading.Lock()
+
+
+def hashingExecutor() -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Returns the thread pool shared by all page hashing.  hashlib releases the GIL while 
+    it hashes a page-sized buffer, so the pool's threads hash in parallel.
+    """
+    global hashingExecutorInstance
+    with hashingExecutorLock:
+        if hashingExecutorInstance is None:
+            hashingExecutorInstance = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        return hashingExecutorInstance
+
+
+def firstMismatchedPage(buffer: memoryview, codeDirectory: CodeDirectory, firstPage: int, endPage: int) -> Optional[int]:
+    """Returns the first page in the range whose hash doesn't match its code slot, or None if they all match."""
+    hashFunction = codeDirectory.hashFunction()
+    pageSize = codeDirectory.pageSize or codeDirectory.codeLimit
+    for page in range(firstPage, endPage):
+        pageStart = page * pageSize
+        pageEnd = min(pageStart + pageSize, codeDirectory.codeLimit)
+        if hashFunction(buffer[pageStart:pageEnd]).digest()[:codeDirectory.hashSize] != codeDirectory.slotHash(page):
+            return page
+    return None
+
+
+def verifyCodePages(slice: MachOSlice, codeDirectory: CodeDirectory, programType: str, programPath: str) -> None:
+    """Checks the hash of every page of the slice against the code directory."""
+    pageSize = codeDirectory.pageSize or codeDirectory.codeLimit
+    pageCount = 0 if pageSize == 0 else (codeDirectory.codeLimit + pageSize - 1) // pageSize
+    if codeDirectory.codeLimit > len(slice.buffer) or pageCount != codeDirectory.nCodeSlots:
+        raise CheckException(f"{programType} code signature invalid: code limit doesn't match the executable", programPath)
+    
+    if pageCount <= CODE_HASH_CHUNK_PAGES:
+        mismatch = firstMismatchedPage(slice.buffer, codeDirectory, 0, pageCount)
+    else:
+        futures = [
+            hashingExecutor().submit(firstMismatchedPage, slice.buffer, codeDirectory, firstPage, min(firstPage + CODE_HASH_CHUNK_PAGES, pageCount))
+            for firstPage in range(0, pageCount, CODE_HASH_CHUNK_PAGES)
+        ]
+        mismatches = [future.result() for future in futures]
+        mismatch = min((page for page in mismatches if page is not None), default=None)
+    if mismatch is not None:
+        raise CheckException(f"{programType} code signature invalid: page at offset 0x{mismatch * pageSize:x} modified", programPath)
+
+
+def verifySpecialSlots(signature: CodeSignature, codeDirectory: CodeDirectory, boundFiles: Dict[int, Tuple[str, Optional[bytes]]], programType: str, programPath: str) -> None:
+    """
+    Checks the special slots of the code directory: the blobs in the signature itself and 
+    the files bound to it, which map slot number to a description and contents.
+    """
+    hashFunction = codeDirectory.hashFunction()
+    slots = dict(boundFiles)
+    for slot, description in ((CSSLOT_REQUIREMENTS, "requirements"), (CSSLOT_ENTITLEMENTS, "entitlements"), (CSSLOT_DER_ENTITLEMENTS, "DER entitlements")):
+        slots[slot] = (description, signature.blobs.get(slot))
+    for slot, (description, data) in sorted(slots.items()):
+        if slot > codeDirectory.nSpecialSlots:
+            continue
+        expected = codeDirectory.slotHash(-slot)
+        if not any(expected):
+            if data is not None and slot in boundFiles:
+                raise CheckException(f"{programType} code signature invalid: {description} not sealed", programPath)
+            continue
+        if data is None:
+            raise CheckException(f"{programType} code signature invalid: {description} missing", programPath)
+        if hashFunction(data).digest()[:codeDirectory.hashSize] != expected:
+            raise CheckException(f"{programType} code signature invalid: {description} modified", programPath)
+
+
+def verifyCodeSignature(programPath: str, programType: str) -> None:
+    """
+    Checks the code signature of the referenced program in-process, across every architecture 
+    and every code directory, reporting the first thing found that doesn't match.
+    """
+    executablePath = programExecutablePath(programPath)
+
+    boundFiles: Dict[int, Tuple[str, Optional[bytes]]] = {}
+    if isDirectory(programPath):
+        layout = bundleLayout(programPath)
+        for slot, description, boundPath in ((CSSLOT_INFOSLOT, "Info.plist", layout.infoPath), (CSSLOT_RESOURCEDIR, "resource seal", layout.codeResourcesPath)):
+            try:
+                boundFiles[slot] = (description, readFileData(boundPath))
+            except FileNotFoundError:
+                boundFiles[slot] = (description, None)
+            except OSError as e:
+                raise CheckException(f"{programType} code signature invalid: {description} unreadable: {str(e)}", programPath)
+
+    with traced("verify code signature", "signature", path=programPath) as span, MachOFile(executablePath) as machO:
+        for slice in machO.slices:
+            signature = readCodeSignature(slice)
+            if signature is None:
+                raise CheckException(f"{programType} code signature invalid: not signed", programPath)
+
+            # A tool's Info.plist is the one embedded in its __info_plist section.
+
+            sliceBoundFiles = boundFiles
+            if not isDirectory(programPath):
+                infoPlist = slice.section("__TEXT", "__info_plist")
+                sliceBoundFiles = {CSSLOT_INFOSLOT: ("__TEXT / __info_plist section", None if infoPlist is None else bytes(infoPlist))}
+
+            for codeDirectory in signature.codeDirectories():
+                verifySpecialSlots(signature, codeDirectory, sliceBoundFiles, programType, programPath)
+                verifyCodePages(slice, codeDirectory, programType, programPath)
+                span.addBytes(codeDirectory.codeLimit)
+            del signature
+
+
+# Verification of the resources sealed by a bundle's "_CodeSignature/CodeResources", part 
+# of every in-process signature check.  Each file the manifest lists is hashed and compared 
+# with its entry, and every other file is checked against the manifest's rules to see 
+# whether it should have been sealed.  "check --incremental" remembers the result in a 
+# resource index kept next to the app, which records each file's statIdentity alongside 
+# the hash it was found to match, so that a later check only re-hashes the files that 
+# have changed since.
+
+RESOURCE_INDEX_VERSION = 2
+RESOURCE_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class SealedResource(NamedTuple):
+    """A file listed in a bundle's resource manifest: the hash it must have, or the target it must link to."""
+    hashName: Optional[str]
+    digest: Optional[bytes]
+    symlink: Optional[str]
+    optional: bool
+
+
+def readResourceManifest(bundlePath: str, programType: str) -> Optional[Tuple[Dict[str, SealedResource], Set[str], Dict, str]]:
+    """
+    Returns the sealed resources of the bundle, keyed by path relative to its contents,
+    the paths of the nested code it seals by code directory hash (whose own resources
+    are sealed by its own manifest), the rules for files not listed, and a hash of the 
+    manifest itself; or None if the bundle has no manifest.
+    """
+    codeResourcesPath = bundleLayout(bundlePath).codeResourcesPath
+    try:
+        manifestData = readFileData(codeResourcesPath)
+        manifest = plistlib.loads(manifestData)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        raise CheckException(f"{programType} code signature invalid: resource seal malformed: {str(e)}", bundlePath)
+    if not isinstance(manifest, dict):
+        raise CheckException(f"{programType} code signature invalid: resource seal malformed", bundlePath)
+
+    # "files2" and "rules2" supersede "files" and "rules", whose hashes are all SHA-1.
+
+    files = manifest.get("files2", manifest.get("files", {}))
+    rules = manifest.get("rules2", manifest.get("rules", {}))
+    resources: Dict[str, SealedResource] = {}
+    nestedPaths: Set[str] = set()
+    for relativePath, entry in files.items():
+        if isinstance(entry, bytes):
+            resources[relativePath] = SealedResource("sha1", entry, None, False)
+        elif isinstance(entry, dict):
+            if "cdhash" in entry:
+                nestedPaths.add(relativePath)
+            elif "symlink" in entry:
+                resources[relativePath] = SealedResource(None, None, entry["symlink"], bool(entry.get("optional")))
+            elif "hash2" in entry:
+                resources[relativePath] = SealedResource("sha256", entry["hash2"], None, bool(entry.get("optional")))
+            elif "hash" in entry:
+                resources[relativePath] = SealedResource("sha1", entry["hash"], None, bool(entry.get("optional")))
+    return (resources, nestedPaths, rules, hashlib.sha256(manifestData).hexdigest())
+
+
+def resourceRule(rules: Dict, relativePath: str) -> Optional[Dict]:
+    """Returns the heaviest of the manifest's rules that matches the path, or None if none does."""
+    bestRule: Optional[Dict] = None
+    bestWeight = -1.0
+    for pattern, rule in rules.items():
+        ruleDict = rule if isinstance(rule, dict) else {}
+        weight = float(ruleDict.get("weight", 1))
+        if weight > bestWeight and re.search(pattern, relativePath):
+            bestRule, bestWeight = ruleDict, weight
+    return bestRule
+
+
+def bundleFiles(contentsPath: str, nestedPaths: Set[str]) -> Dict[str, Tuple[str, bool]]:
+    """
+    Returns the path of every file and symlink in the bundle's contents, and whether it's 
+    a symlink, keyed by relative path, without descending into symlinked directories or 
+    the nested code in nestedPaths.
+    """
+    files: Dict[str, Tuple[str, bool]] = {}
+
+    def scan(directoryPath: str, prefix: str) -> None:
+        for entryName, entryIsDirectory, entryIsSymlink in directoryEntries(directoryPath):
+            relativePath = prefix + entryName
+            if relativePath in nestedPaths:
+                continue
+            entryPath = os.path.join(directoryPath, entryName)
+            if entryIsDirectory and not entryIsSymlink:
+                scan(entryPath, relativePath + "/")
+            else:
+                files[relativePath] = (entryPath, entryIsSymlink)
+
+    scan(contentsPath, "")
+    return files
+
+
+def hashResource(path: str, hashName: str) -> Tuple[bytes, int]:
+    """
+    Returns the hash of the file and its size.  The file, which may be a member of an 
+    archive being checked in place, is read in chunks, so that a large resource is never 
+    all in memory.
+    """
+    digest = hashlib.new(hashName)
+    byteCount = 0
+    member = archiveMember(path)
+    with open(path, "rb") if member is None else member[0].open(member[1]) as fp:
+        while True:
+            chunk = fp.read(RESOURCE_HASH_CHUNK_SIZE)
+            if not chunk:
+                return (digest.digest(), byteCount)
+            digest.update(chunk)
+            byteCount += len(chunk)
+
+
+def resourceIndexPath(appPath: str, bundlePath: str) -> str:
+    """Returns where the resource index for the bundle, which is the app or is nested in it, is kept."""
+    appPath = os.path.abspath(appPath)
+    relativePath = os.path.relpath(os.path.abspath(bundlePath), appPath)
+    indexName = hashlib.sha256(relativePath.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.path.dirname(appPath), f".{os.path.basename(appPath)}.resource-index", f"{indexName}.json")
+
+
+def verifyResources(bundlePath: str, programType: str, index: Optional[Dict]) -> Tuple[Dict, bool]:
+    """
+    Checks the bundle's files against its resource manifest and returns the resource index
+    that records the result, and whether the index given was out of date: missing, or made 
+    from a manifest that has since changed in any way, as it does whenever the bundle is 
+    re-signed.  Given the index from an earlier check, only files whose statIdentity or 
+    expected hash has changed are re-hashed; if the manifest's rules have changed too, 
+    every file is.
+    """
+    manifest = readResourceManifest(bundlePath, programType)
+    if manifest is None:
+        return ({"version": RESOURCE_INDEX_VERSION, "seal": None, "rules": None, "files": {}}, index is None or index.get("seal") is not None)
+    resources, nestedPaths, rules, sealHash = manifest
+    rulesHash = hashlib.sha256(json.dumps(rules, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    usable = index is not None and index.get("version") == RESOURCE_INDEX_VERSION
+    outOfDate = not usable or index.get("seal") != sealHash
+    knownFiles = index.get("files", {}) if usable and index.get("rules") == rulesHash else {}
+
+    layout = bundleLayout(bundlePath)
+    contentsPath = layout.contentsPath
+
+    # The Info.plist, the manifest and the main executable are sealed by the code directory,
+    # not by the manifest.
+
+    unsealedPaths = {os.path.relpath(path, contentsPath) for path in (layout.infoPath, layout.codeResourcesPath)}
+    unsealedPaths.add("CodeResources")
+    try:
+        unsealedPaths.add(os.path.relpath(programExecutablePath(bundlePath), contentsPath))
+    except CheckException:
+        pass
+
+    with traced("verify sealed resources", "signature", path=bundlePath) as span:
+        files = bundleFiles(contentsPath, nestedPaths)
+        for relativePath in sorted(files):
+            if relativePath in resources or relativePath in unsealedPaths:
+                continue
+
+            # A file no rule matches isn't covered by the seal, so it can't have been added to it.
+
+            rule = resourceRule(rules, relativePath)
+            if rule is not None and not rule.get("omit"):
+                raise CheckException(f"{programType} code signature invalid: resource '{relativePath}' added", bundlePath)
+
+        newFiles: Dict[str, List[str]] = {}
+        toHash: List[Tuple[str, SealedResource, str]] = []
+        for relativePath, resource in sorted(resources.items()):
+            entry = files.get(relativePath)
+            if entry is None:
+                if resource.optional:
+                    continue
+                raise CheckException(f"{programType} code signature invalid: resource '{relativePath}' missing", bundlePath)
+            entryPath, entryIsSymlink = entry
+            if resource.symlink is not None:
+                if not entryIsSymlink or readLink(entryPath) != resource.symlink:
+                    raise CheckException(f"{programType} code signature invalid: resource '{relativePath}' modified", bundlePath)
+                continue
+            identity = statIdentity(entryPath)
+            record = [identity, resource.digest.hex()]
+            if knownFiles.get(relativePath) == record:
+                newFiles[relativePath] = record
+            else:
+                toHash.append((relativePath, resource, identity))
+
+        span.args["rehashed"] = len(toHash)
+
+        # Hash what's changed on the shared hashing pool; hashlib releases the GIL while it
+        # hashes each chunk, so the files are hashed in parallel.
+
+        futures = [hashingExecutor().submit(hashResource, os.path.join(contentsPath, relativePath), resource.hashName) for relativePath, resource, _ in toHash]
+        for (relativePath, resource, identity), future in zip(toHash, futures):
+            try:
+                digest, byteCount = future.result()
+            except OSError as e:
+                raise CheckException(f"{programType} code signature invalid: resource '{relativePath}' unreadable: {str(e)}", bundlePath)
+            if digest[:len(resource.digest)] != resource.digest:
+                raise CheckException(f"{programType} code signature invalid: resource '{relativePath}' modified", bundlePath)
+            newFiles[relativePath] = [identity, resource.digest.hex()]
+            span.addBytes(byteCount)
+
+    return ({"version": RESOURCE_INDEX_VERSION, "seal": sealHash, "rules": rulesHash, "files": newFiles}, outOfDate)
+
+
+def readPlistFromSectionData(data: Optional[memoryview], toolPath: str, segmentName: str, sectionName: str) -> Dict:
+    """Parses the dictionary property list held in the contents of a tool section."""
+    if data is None:
+        raise CheckException(f"tool {segmentName} / {sectionName} section not found", toolPath)
+    try:
+        with traced("plistlib.loads", "plist", path=toolPath, section=sectionName) as span:
+            span.addBytes(len(data))
+            plist = plistlib.loads(data)
+    except Exception as e:
+        raise CheckException(f"tool {segmentName} / {sectionName} section malformed: {str(e)}", toolPath)
+    finally:
+        data.release()
+    if not isinstance(plist, dict):
+        raise CheckException(f"tool {segmentName} / {sectionName} property list root must be a dictionary", toolPath)
+    return plist
+
+
+def readPlistsFromToolSections(toolPath: str, segmentName: str, sectionNames: List[str]) -> Dict[str, Dict]:
+    """
+    Reads a dictionary property list from each of the specified sections within the 
+    specified executable, mapping and parsing the executable only once.
+    """
+
+    # The executable is memory-mapped and the section contents are parsed in place, so 
+    # there's no need to run otool and decode its hex dump.
+
+    with MachOFile(toolPath) as machO:
+        slice = hostSlice(machO.slices)
+        return {
+            sectionName: readPlistFromSectionData(slice.section(segmentName, sectionName), toolPath, segmentName, sectionName)
+            for sectionName in sectionNames
+        }
+
+
+class SliceInspection(NamedTuple):
+    """
+    The facts gathered from one architecture slice of a tool.  Each value is either the 
+    thing itself or, if it couldn't be read, the error message, so that slices that fail 
+    in the same way compare equal.
+    """
+    archName: str
+    sectionPlists: Dict[str, object]
+    signature: object
+
+
+def inspectSlice(slice: MachOSlice, segmentName: str, sectionNames: List[str]) -> SliceInspection:
+    """Gathers the embedded property lists and the signing identity of one slice."""
+
+    sectionPlists: Dict[str, object] = {}
+    for sectionName in sectionNames:
+        try:
+            sectionPlists[sectionName] = readPlistFromSectionData(slice.section(segmentName, sectionName), slice.path, segmentName, sectionName)
+        except CheckException as e:
+            sectionPlists[sectionName] = e.message
+
+    # Each slice has its own code directory, so the hashes always differ; what must 
+    # match is who signed it and what requirements it carries.
+
+    try:
+        codeSignature = readCodeSignature(slice)
+        if codeSignature is None:
+            signature: object = "not signed"
+        else:
+            requirements = codeSignature.blobs.get(CSSLOT_REQUIREMENTS)
+            signature = (
+                codeSignature.codeDirectory.identifier, 
+                codeSignature.codeDirectory.teamIdentifier, 
+                None if requirements is None else hashlib.sha256(requirements).hexdigest()
+            )
+    except CheckException as e:
+        signature = e.message
+
+    return SliceInspection(slice.archName, sectionPlists, signature)
+
+
+def inspectSlices(machO: MachOFile, segmentName: str, sectionNames: List[str]) -> List[SliceInspection]:
+    """Inspects every architecture slice of the file concurrently, sharing its one mapping."""
+    if len(machO.slices) == 1:
+        return [inspectSlice(machO.slices[0], segmentName, sectionNames)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(machO.slices)) as executor:
+        return list(executor.map(lambda slice: inspectSlice(slice, segmentName, sectionNames), machO.slices))
+
+
+def sliceDifferences(inspections: List[SliceInspection]) -> List[str]:
+    """Returns a description of each fact that isn't the same in every slice."""
+
+    def describe(what: str, values: List[object]) -> Optional[str]:
+        groups: List[Tuple[object, List[str]]] = []
+        for inspection, value in zip(inspections, values):
+            for groupValue, archNames in groups:
+                if groupValue == value:
+                    archNames.append(inspection.archName)
+                    break
+            else:
+                groups.append((value, [inspection.archName]))
+        if len(groups) == 1:
+            return None
+        return f"{what} differs between architectures ({' vs '.join('/'.join(archNames) for _, archNames in groups)})"
+
+    differences = []
+    for sectionName in inspections[0].sectionPlists:
+        difference = describe(f"__TEXT / {sectionName} section", [inspection.sectionPlists[sectionName] for inspection in inspections])
+        if difference is not None:
+            differences.append(difference)
+    difference = describe("code signature", [inspection.signature for inspection in inspections])
+    if difference is not None:
+        differences.append(difference)
+    return differences
+
+
+TOOL_SECTION_NAMES = ["__info_plist", "__launchd_plist"]
+
+
+class CodeSignBackend:
+    """
+    The layer BundleInspection asks to check code signatures and read designated 
+    requirements.  This one uses checkCodeSignature and readDesignatedRequirement; 
+    a build system can substitute its own (for example, one that asks a signing 
+    service) by subclassing it.  Its methods may be called from many threads at once.
+    """
+
+    def checkCodeSignature(self, programPath: str, programType: str) -> None:
+        checkCodeSignature(programPath, programType)
+
+    def designatedRequirement(self, programPath: str, programType: str) -> str:
+        return readDesignatedRequirement(programPath, programType)
+
+
+class CodesignToolBackend(CodeSignBackend):
+    """A CodeSignBackend that asks the codesign tool about every program."""
+
+    def checkCodeSignature(self, programPath: str, programType: str) -> None:
+        verifyCodeSignatureWithCodesign(programPath, programType)
+
+    def designatedRequirement(self, programPath: str, programType: str) -> str:
+        return readDesignatedRequirementWithCodesign(programPath, programType)
+
+
+class IncrementalCodeSignBackend(CodeSignBackend):
+    """
+    The CodeSignBackend used by "check --incremental".  It also verifies the resources 
+    sealed by each bundle, against a resource index kept next to the app at appPath, so 
+    that only the files changed since the last successful check are re-hashed.  While a 
+    bundle's index is current its executable is verified in-process, even in strict mode; 
+    a bundle with no index, or whose manifest has changed since (because it's been 
+    re-signed), is verified in full.
+    """
+
+    def __init__(self, appPath: str):
+        self.appPath = appPath
+
+    # Every check makes its own backend, so facts are keyed on the app it's for rather 
+    # than on the object, letting a long-running process reuse them across checks.
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, IncrementalCodeSignBackend) and other.appPath == self.appPath
+
+    def __hash__(self) -> int:
+        return hash(("incremental", self.appPath))
+
+    def checkCodeSignature(self, programPath: str, programType: str) -> None:
+        if not isDirectory(programPath) or archiveMember(programPath) is not None:
+            checkCodeSignature(programPath, programType)
+            return
+        indexPath = resourceIndexPath(self.appPath, programPath)
+        try:
+            with open(indexPath, "rb") as fp:
+                index = json.load(fp)
+        except (OSError, ValueError):
+            index = None
+        index, outOfDate = verifyResources(programPath, programType, index if isinstance(index, dict) else None)
+        if outOfDate and strictVerification:
+            verifyCodeSignatureWithCodesign(programPath, programType)
+        else:
+            verifyCodeSignature(programPath, programType)
+
+        # The index is only a cache, so failing to write it isn't a problem with the app.
+
+        with contextlib.suppress(OSError):
+            os.makedirs(os.path.dirname(indexPath), exist_ok=True)
+            writeFileAtomically(indexPath, json.dumps(index).encode("utf-8"))
+
+
+class SectionReader:
+    """
+    The layer BundleInspection asks for a tool's embedded property lists and the signing 
+    identity of each of its architectures.  This one maps the tool's Mach-O file; it can 
+    be replaced by subclassing it.  Its methods may be called from many threads at once.
+    """
+
+    def inspectTool(self, toolPath: str, segmentName: str, sectionNames: List[str]) -> Tuple[SliceInspection, List[SliceInspection]]:
+        """Returns the inspection of the tool's host slice and those of all its slices."""
+        with MachOFile(toolPath) as machO:
+            hostIndex = machO.slices.index(hostSlice(machO.slices))
+            inspections = inspectSlices(machO, segmentName, sectionNames)
+        return (inspections[hostIndex], inspections)
+
+
+defaultCodeSignBackend = CodeSignBackend()
+defaultSectionReader = SectionReader()
+
+
+class InspectionCache:
+    """
+    Facts gathered by BundleInspection, kept across inspections by a long-running process.  
+    Each fact is stored with the identity (a statIdentity, executableIdentity or 
+    programFingerprint) of the files it was gathered from and is only reused while that 
+    identity is unchanged.  The least recently used facts beyond maxEntries are dropped.
+    """
+
+    def __init__(self, maxEntries: int = 4096):
+        self.maxEntries = maxEntries
+        self._lock = threading.Lock()
+        self._entries: "collections.OrderedDict[Tuple, Tuple[str, concurrent.futures.Future]]" = collections.OrderedDict()
+
+    def lookup(self, key: Tuple, identity: str) -> Optional[concurrent.futures.Future]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != identity:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def store(self, key: Tuple, identity: str, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._entries[key] = (identity, future)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+
+# The cache BundleInspection consults before gathering a fact; only long-running modes set it.
+
+inspectionCache: Optional[InspectionCache] = None
+
+
+# The directories, relative to a bundle's contents, that hold nested code, with the 
+# type of program found in each.
+
+NESTED_CODE_DIRECTORIES = [
+    ("Frameworks", "framework"), 
+    ("XPCServices", "XPC service"), 
+    ("LoginItems", "login item"), 
+    ("PlugIns", "plug-in"), 
+    (os.path.join("Library", "LaunchServices"), "tool"), 
+]
+
+
+class NestedComponent(NamedTuple):
+    """A piece of signed code nested in a bundle; parentPath is the component it's nested in, or None if that's the bundle itself."""
+    path: str
+    programType: str
+    parentPath: Optional[str]
+
+
+class ComponentResult(NamedTuple):
+    """The outcome of verifying one nested component: the problem found (None if it's valid) and how long it took."""
+    path: str
+    programType: str
+    problem: Optional[CheckException]
+    seconds: float
+
+
+def findNestedCode(bundlePath: str, parentPath: Optional[str] = None) -> List[NestedComponent]:
+    """
+    Returns every piece of code nested in the bundle, at any depth, each listed before 
+    the code nested inside it.  Each directory is read once with directoryEntries (a 
+    single os.scandir, whose entries already say what's a directory), so nothing is stat'ed.
+    """
+    components: List[NestedComponent] = []
+    contentsPath = bundleLayout(bundlePath).contentsPath
+    for directoryName, programType in NESTED_CODE_DIRECTORIES:
+        try:
+            entries = directoryEntries(os.path.join(contentsPath, directoryName))
+        except OSError:
+            continue
+        for entryName, entryIsDirectory, entryIsSymlink in entries:
+            entryPath = os.path.join(contentsPath, directoryName, entryName)
+
+            # Skip the Finder's droppings and the symlinks that make up a framework's 
+            # or dylib's aliases; what they point to is listed in its own right.  A 
+            # directory among the tools is reported by step 1, not verified here.
+
+            if entryName.startswith(".") or entryIsSymlink:
+                continue
+            if entryIsDirectory:
+                if programType != "tool":
+                    components.append(NestedComponent(entryPath, programType, parentPath))
+                    components.extend(findNestedCode(entryPath, entryPath))
+            elif programType == "tool":
+                components.append(NestedComponent(entryPath, programType, parentPath))
+            elif entryName.endswith(".dylib"):
+                components.append(NestedComponent(entryPath, "library", parentPath))
+    return components
+
+
+class BundleInspection:
+    """
+    The facts about a built app that "check" and "setreq" rely on.  Each fact (the tool 
+    list, a code signature's validity, a designated requirement, an embedded property 
+    list) is gathered the first time it's asked for and remembered, along with any 
+    problem found while gathering it, so no tool or file is examined twice.  It's safe 
+    to ask for facts from several threads at once; a fact that's being gathered on one 
+    thread is waited for, not gathered again, on the others.  Signatures and sections 
+    are examined through the given backends, and facts are shared through the given 
+    cache (by default, inspectionCache).  Up to workers threads (by default, one per CPU) 
+    gather facts, or run checks, for it at once.
+    """
+
+    def __init__(self, appPath: str, codeSignBackend: Optional[CodeSignBackend] = None, sectionReader: Optional[SectionReader] = None, cache: Optional["InspectionCache"] = None, workers: Optional[int] = None):
+        self.appPath = appPath
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.toolDirPath = os.path.join(appPath, "Contents", "Library", "LaunchServices")
+        self.infoPath = os.path.join(appPath, "Contents", "Info.plist")
+        self.codeSignBackend = codeSignBackend if codeSignBackend is not None else defaultCodeSignBackend
+        self.sectionReader = sectionReader if sectionReader is not None else defaultSectionReader
+        self.cache = cache if cache is not None else inspectionCache
+        self._lock = threading.Lock()
+        self._facts: Dict[Tuple, concurrent.futures.Future] = {}
+
+    def _fact(self, key: Tuple, gather, identity: Optional[Callable[[], str]] = None):
+        # A fact whose inputs have an identity can come from the shared cache, if there's 
+        # one and the inputs haven't changed since the fact was gathered.
+
+        with self._lock:
+            future = self._facts.get(key)
+            isGatherer = future is None
+            if isGatherer:
+                future = concurrent.futures.Future()
+                self._facts[key] = future
+        if isGatherer:
+
+            # Whatever goes wrong, the future must be completed, or every other thread 
+            # waiting for this fact would wait forever.  Only CheckExceptions, which 
+            # describe the app, are worth keeping in the shared cache.
+
+            try:
+                sharedCache = self.cache if identity is not None else None
+                factIdentity = identity() if sharedCache is not None else ""
+                cached = None if sharedCache is None else sharedCache.lookup(key, factIdentity)
+                if cached is not None and cached.exception() is None:
+                    future.set_result(cached.result())
+                elif cached is not None:
+                    future.set_exception(cached.exception())
+                else:
+                    try:
+                        future.set_result(gather())
+                    except CheckException as e:
+                        future.set_exception(e)
+                    if sharedCache is not None:
+                        sharedCache.store(key, factIdentity, future)
+            except BaseException as e:
+                if not future.done():
+                    future.set_exception(e)
+                raise
+        return future.result()
+
+    def toolPaths(self) -> List[str]:
+        """Returns the paths of the tools in "Contents/Library/LaunchServices"."""
+
+        def gather() -> List[str]:
+            if not isDirectory(self.toolDirPath):
+                raise CheckException("tool directory not found", self.toolDirPath)
+            toolPathList = []
+            for toolName, _, _ in directoryEntries(self.toolDirPath):
+                if toolName != ".DS_Store":
+                    toolPath = os.path.join(self.toolDirPath, toolName)
+                    if not isFile(toolPath):
+                        raise CheckException("tool directory contains a directory", toolPath)
+                    toolPathList.append(toolPath)
+            return toolPathList
+
+        return self._fact(("toolPaths",), gather)
+
+    def checkCodeSignature(self, programPath: str, programType: str) -> None:
+        """Checks the code signature of the app or one of its tools."""
+        self._fact(("codeSignature", programPath, self.codeSignBackend), lambda: self.codeSignBackend.checkCodeSignature(programPath, programType), lambda: self._fingerprint(programPath))
+
+    def designatedRequirement(self, programPath: str, programType: str) -> str:
+        """Returns the designated requirement of the app or one of its tools."""
+        return self._fact(("designatedRequirement", programPath, self.codeSignBackend), lambda: self.codeSignBackend.designatedRequirement(programPath, programType), lambda: executableIdentity(programPath))
+
+    def signingFacts(self, programPath: str) -> SigningFacts:
+        """Returns what requirements are evaluated against for the app or one of its tools."""
+        return self._fact(("signingFacts", programPath), lambda: readSigningFacts(programPath), lambda: executableIdentity(programPath))
+
+    def _fingerprint(self, programPath: str) -> str:
+        # A bundle's fingerprint walks all of it, so it's taken once per inspection.
+        return self._fact(("fingerprint", programPath), lambda: programFingerprint(programPath))
+
+    def nestedCode(self) -> List[ComponentResult]:
+        """
+        Verifies the code signature of every piece of code nested in the app and returns 
+        the result for each, in the order findNestedCode lists them.
+        """
+
+        # Verification is leaf-first: a component is verified only once everything nested 
+        # inside it has been, so a broken framework inside an XPC service is reported 
+        # in its own right.  Independent components are verified in parallel.
+
+        def verify(component: NestedComponent) -> ComponentResult:
+            start = time.perf_counter()
+            problem = None
+            with traced("verify nested code", "component", path=component.path) as span:
+                try:
+                    self.checkCodeSignature(component.path, component.programType)
+                except CheckException as e:
+                    problem = e
+                span.args["result"] = "ok" if problem is None else problem.message
+            return ComponentResult(component.path, component.programType, problem, time.perf_counter() - start)
+
+        def gather() -> List[ComponentResult]:
+            with traced("find nested code", "component", path=self.appPath):
+                components = findNestedCode(self.appPath)
+            componentsByPath = {component.path: component for component in components}
+            unverifiedChildCounts = collections.Counter(component.parentPath for component in components)
+            results: Dict[str, ComponentResult] = {}
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pending = {executor.submit(verify, component) for component in components if unverifiedChildCounts[component.path] == 0}
+                while pending:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        results[result.path] = result
+                        parentPath = componentsByPath[result.path].parentPath
+                        if parentPath is not None:
+                            unverifiedChildCounts[parentPath] -= 1
+                            if unverifiedChildCounts[parentPath] == 0:
+                                pending.add(executor.submit(verify, componentsByPath[parentPath]))
+            return [results[component.path] for component in components]
+
+        # The app's fingerprint covers every file in it, so it changes whenever any of the 
+        # nested code does.
+
+        return self._fact(("nestedCode", self.appPath, self.codeSignBackend), gather, lambda: self._fingerprint(self.appPath))
+
+    def appInfo(self) -> Dict:
+        """Returns the app's "Info.plist"."""
+        return self._fact(("appInfo", self.infoPath), lambda: readInfoPlistFromPath(self.infoPath), lambda: statIdentity(self.infoPath))
+
+    def _toolSlices(self, toolPath: str) -> Tuple[SliceInspection, List[str]]:
+        # Each tool is mapped once; its host slice supplies the embedded property lists 
+        # and, for a universal tool, all its slices are compared with each other.
+
+        def gather() -> Tuple[SliceInspection, List[str]]:
+            with traced("inspect tool architectures", "macho", path=toolPath):
+                hostInspection, inspections = self.sectionReader.inspectTool(toolPath, "__TEXT", TOOL_SECTION_NAMES)
+            return (hostInspection, sliceDifferences(inspections))
+
+        return self._fact(("toolSlices", toolPath, self.sectionReader), gather, lambda: statIdentity(toolPath))
+
+    def toolSectionPlist(self, toolPath: str, sectionName: str) -> Dict:
+        """Returns the property list embedded in the specified "__TEXT" section of a tool."""
+        plist = self._toolSlices(toolPath)[0].sectionPlists[sectionName]
+        if isinstance(plist, str):
+            raise CheckException(plist, toolPath)
+        return plist
+
+    def checkToolArchitectures(self, toolPath: str) -> None:
+        """Checks that every architecture of a universal tool embeds the same property lists and signing identity."""
+        differences = self._toolSlices(toolPath)[1]
+        if len(differences) != 0:
+            raise CheckException(f"tool {'; '.join(differences)}", toolPath)
+
+
+def checkStep1App(inspection: BundleInspection) -> None:
+    """Checks that the app is correctly code signed."""
+    
+    if not isDirectory(inspection.appPath):
+        raise CheckException("app not found", inspection.appPath)
+    inspection.checkCodeSignature(inspection.appPath, "app")
+
+
+def checkStep1Tool(inspection: BundleInspection, toolPath: str) -> None:
+    """Checks that a tool is correctly code signed."""
+    inspection.checkCodeSignature(toolPath, "tool")
+    inspection.checkToolArchitectures(toolPath)
+
+
+def checkStep1ToolList(inspection: BundleInspection) -> List[str]:
+    """Returns the app's tools, checking that it has at least one."""
+    toolPathList = inspection.toolPaths()
+    if len(toolPathList) == 0:
+        raise CheckException("no tools found", inspection.toolDirPath)
+    return toolPathList
+
+
+def checkStep1NestedCode(inspection: BundleInspection) -> None:
+    """Checks that all the code nested in the app, including its tools, is correctly code signed."""
+    failures = [result.problem for result in inspection.nestedCode() if result.problem is not None]
+    if len(failures) == 1:
+        raise failures[0]
+    if len(failures) > 1:
+        raise CheckFailures(failures)
+
+
+def checkStep1(inspection: BundleInspection) -> List[str]:
+    """Checks that the app, the tool and everything else nested in the app are correctly code signed."""
+    
+    if not isDirectory(inspection.appPath):
+        raise CheckException("app not found", inspection.appPath)
+
+    # Check the code signatures of the code nested in the app, innermost first, and then 
+    # the app's own.
+
+    failures: List[CheckException] = []
+    try:
+        checkStep1NestedCode(inspection)
+    except CheckFailures as e:
+        failures.extend(e.failures)
+    except CheckException as e:
+        failures.append(e)
+    try:
+        checkStep1App(inspection)
+    except CheckException as e:
+        failures.append(e)
+    if len(failures) == 1:
+        raise failures[0]
+    if len(failures) > 1:
+        raise CheckFailures(failures)
+    
+    # Check each tool's architectures (its code signature has been checked already).
+    
+    toolPathList = inspection.toolPaths()
+    for toolPath in toolPathList:
+        checkStep1Tool(inspection, toolPath)
+
+    # Check that we have at least one tool.
+    
+    return checkStep1ToolList(inspection)
+
+
+def readPrivilegedExecutables(inspection: BundleInspection) -> Dict:
+    """Returns the SMPrivilegedExecutables dictionary from the app's Info.plist."""
+    infoPath = inspection.infoPath
+    info = inspection.appInfo()
+    if "SMPrivilegedExecutables" not in info:
+        raise CheckException("'SMPrivilegedExecutables' not found", infoPath)
+    infoToolDict = info["SMPrivilegedExecutables"]
+    if not isinstance(infoToolDict, dict):
+        raise CheckException("'SMPrivilegedExecutables' must be a dictionary", infoPath)
+    return infoToolDict
+
+
+def checkRequirementEntry(inspection: BundleInspection, programPath: str, programType: str, req: str, entry: object, keyName: str, entryPath: str) -> None:
+    """
+    Checks a requirement listed under keyName in the Info.plist at entryPath against the 
+    program it names: the program must satisfy it, and it must be equivalent to the 
+    program's designated requirement, req, however the two are written.
+    """
+    if not isinstance(entry, str):
+        raise CheckException(f"entry in '{keyName}' must be a string", entryPath)
+    try:
+        entryExpr = compileRequirement(entry)
+    except ValueError as e:
+        raise CheckException(f"entry in '{keyName}' ({entry}) is not a valid requirement: {str(e)}", entryPath)
+
+    # The signing facts come from the same in-process parsing as the rest of the checks; 
+    # if they can't be read, that's reported by step 1, so only equivalence is checked.
+
+    try:
+        facts: Optional[SigningFacts] = inspection.signingFacts(programPath)
+    except CheckException:
+        facts = None
+    if facts is not None and evaluateRequirement(entryExpr, facts) is False:
+        raise CheckException(f"{programType} doesn't satisfy entry in '{keyName}' ({entry})", entryPath)
+    if not requirementsEquivalent(req, entry):
+        raise CheckException(f"{programType} designated requirement ({req}) doesn't match entry in '{keyName}' ({entry})", entryPath)
+
+
+def checkStep2App(inspection: BundleInspection, toolPathList: List[str]) -> None:
+    """Checks that the SMPrivilegedExecutables entry in the app's Info.plist lists exactly the app's tools."""
+    
+    infoToolDict = readPrivilegedExecutables(inspection)
+    if sorted(infoToolDict.keys()) != sorted(os.path.basename(toolPath) for toolPath in toolPathList):
+        raise CheckException("'SMPrivilegedExecutables' and tools in 'Contents/Library/LaunchServices' don't match", inspection.infoPath)
+
+
+def checkStep2Tool(inspection: BundleInspection, toolPath: str) -> None:
+    """Checks a tool's SMPrivilegedExecutables entry against the tool's designated requirement."""
+
+    req = inspection.designatedRequirement(toolPath, "tool")
+    infoToolDict = readPrivilegedExecutables(inspection)
+    
+    # This is an interesting policy choice.  Technically the tool just needs to satisfy 
+    # the requirement listed in SMPrivilegedExecutables, which checkRequirementEntry 
+    # evaluates in-process, as "codesign -v -R" would.  However, for a Developer ID 
+    # signed tool we really want to have the SMPrivilegedExecutables entry contain the 
+    # tool's designated requirement because Xcode has built a more complex DR that does 
+    # lots of useful and important checks.  So, as a matter of policy we require that 
+    # the value in SMPrivilegedExecutables be equivalent to the tool's DR.
+    
+    toolName = os.path.basename(toolPath)
+    if toolName in infoToolDict:
+        checkRequirementEntry(inspection, toolPath, "tool", req, infoToolDict[toolName], "SMPrivilegedExecutables", toolPath)
+
+
+def checkStep2(inspection: BundleInspection, toolPathList: List[str]) -> None:
+    """Checks the SMPrivilegedExecutables entry in the app's Info.plist."""
+
+    for toolPath in toolPathList:
+        inspection.designatedRequirement(toolPath, "tool")
+
+    checkStep2App(inspection, toolPathList)
+
+    for toolPath in toolPathList:
+        checkStep2Tool(inspection, toolPath)
+
+
+def checkStep3Tool(inspection: BundleInspection, toolPath: str) -> None:
+    """Checks the Info.plist embedded in a helper tool."""
+    
+    appReq = inspection.designatedRequirement(inspection.appPath, "app")
+    
+    info = inspection.toolSectionPlist(toolPath, "__info_plist")
+    if "CFBundleInfoDictionaryVersion" not in info or info["CFBundleInfoDictionaryVersion"] != "6.0":
+        raise CheckException("'CFBundleInfoDictionaryVersion' in tool __TEXT / __info_plist section must be '6.0'", toolPath)
+    
+    if "CFBundleIdentifier" not in info or info["CFBundleIdentifier"] != os.path.basename(toolPath):
+        raise CheckException("'CFBundleIdentifier' in tool __TEXT / __info_plist section must match tool name", toolPath)
+    
+    if "SMAuthorizedClients" not in info:
+        raise CheckException("'SMAuthorizedClients' in tool __TEXT / __info_plist section not found", toolPath)
+    infoClientList = info["SMAuthorizedClients"]
+    if not isinstance(infoClientList, list):
+        raise CheckException("'SMAuthorizedClients' in tool __TEXT / __info_plist section must be an array", toolPath)
+    if len(infoClientList) != 1:
+        raise CheckException("'SMAuthorizedClients' in tool __TEXT / __info_plist section must have one entry", toolPath)
+        
+    checkRequirementEntry(inspection, inspection.appPath, "app", appReq, infoClientList[0], "SMAuthorizedClients", toolPath)
+
+
+def checkStep3(inspection: BundleInspection, toolPathList: List[str]) -> None:
+    """Checks the Info.plist embedded in each helper tool."""
+    
+    for toolPath in toolPathList:
+        checkStep3Tool(inspection, toolPath)
+
+
+def checkStep4Tool(inspection: BundleInspection, toolPath: str) -> None:
+    """Checks the launchd.plist embedded in a helper tool."""
+    
+    launchd = inspection.toolSectionPlist(toolPath, "__launchd_plist")
+    if "Label" not in launchd or launchd["Label"] != os.path.basename(toolPath):
+        raise CheckException("'Label' in tool __TEXT / __launchd_plist section must match tool name", toolPath)
+
+
+def checkStep4(inspection: BundleInspection, toolPathList: List[str]) -> None:
+    """Checks the launchd.plist embedded in each helper tool."""
+    
+    for toolPath in toolPathList:
+        checkStep4Tool(inspection, toolPath)
+
+
+def checkStep5(inspection: BundleInspection) -> None:
+    """There's nothing to do here; we effectively checked for this is steps 1 and 2."""
+    pass
+
+
+def runCheckTask(task: Tuple[str, str, Callable[[], None]]) -> Optional[CheckException]:
+    """Runs a (step name, path, check) task and returns the problem it found, if any."""
+    stepName, path, checkFunction = task
+    try:
+        with traced(stepName, "step", path=path):
+            checkFunction()
+    except CheckException as e:
+        return e
+    return None
+
+
+def runCheckTasks(tasks: List[Tuple[str, str, Callable[[], None]]], workers: int) -> List[CheckException]:
+    """
+    Runs the (step name, path, check) tasks, up to workers at once, and returns every 
+    problem they found, in task order, with duplicates (several tasks tripping over the 
+    same bad input) reported only once.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(runCheckTask, tasks))
+    failures: List[CheckException] = []
+    seen = set()
+    for e in results:
+        if e is not None and (e.message, e.path) not in seen:
+            seen.add((e.message, e.path))
+            failures.append(e)
+    return failures
+
+
+def checkProblems(inspection: BundleInspection) -> List[CheckException]:
+    """Runs every check step against the inspected app and returns the problems found."""
+
+    appPath = inspection.appPath
+
+    # Each of the following steps matches a bullet point in the SMJobBless header doc.  
+    # They share one inspection of the app, so each fact about it is gathered only once.
+    
+    with traced("check", "check", path=appPath):
+        try:
+            with traced("checkStep1", "step", path=appPath):
+                toolPathList = checkStep1(inspection)
+        except CheckFailures as e:
+            return e.failures
+        except CheckException as e:
+            return [e]
+
+        # Steps 2 through 4 depend only on the tool list, so they run all at once, as one 
+        # task per step and tool, and every problem they find is reported rather than 
+        # just the first.
+
+        tasks: List[Tuple[str, str, Callable[[], None]]] = [("checkStep2", appPath, functools.partial(checkStep2App, inspection, toolPathList))]
+        for stepName, checkTool in (("checkStep2", checkStep2Tool), ("checkStep3", checkStep3Tool), ("checkStep4", checkStep4Tool)):
+            tasks.extend((stepName, toolPath, functools.partial(checkTool, inspection, toolPath)) for toolPath in toolPathList)
+        failures = runCheckTasks(tasks, inspection.workers)
+
+        with traced("checkStep5", "step", path=appPath):
+            checkStep5(inspection)
+
+    return failures
+
+
+def check(appPath: str, incremental: bool = False, workers: Optional[int] = None) -> None:
+    """
+    Checks the SMJobBless setup of the specified app, which may be in a zip archive, using 
+    up to workers threads (by default, one per CPU).  With incremental, sealed resources 
+    are verified too, using IncrementalCodeSignBackend.
+    """
+
+    with openedBundle(appPath) as bundlePath:
+        failures = checkProblems(BundleInspection(bundlePath, IncrementalCodeSignBackend(bundlePath) if incremental else None, workers=workers))
+    if len(failures) == 1:
+        raise failures[0]
+    if len(failures) > 1:
+        raise CheckFailures(failures)
+
+
+class BundleReport(NamedTuple):
+    """
+    The result of inspectBundle: the problems found (empty if the app passed), the app's 
+    tools, the designated requirements of the app and of each tool (keyed by tool 
+    name), with None for any requirement that couldn't be read, and the result of 
+    verifying each piece of nested code.
+    """
+    appPath: str
+    problems: List[CheckException]
+    toolPaths: List[str]
+    appRequirement: Optional[str]
+    toolRequirements: Dict[str, Optional[str]]
+    components: List[ComponentResult]
+
+    @property
+    def ok(self) -> bool:
+        return len(self.problems) == 0
+
+
+def inspectBundle(appPath: str, codeSignBackend: Optional[CodeSignBackend] = None, sectionReader: Optional[SectionReader] = None, cache: Optional[InspectionCache] = None) -> BundleReport:
+    """
+    Checks the SMJobBless setup of the specified app (or zipped app), as "check" does, and 
+    returns what it found rather than raising.  It's safe to call from many threads at 
+    once; passing the same cache to each call shares the facts gathered between them.
+    """
+    try:
+        with openedBundle(appPath) as bundlePath:
+            return inspectOpenedBundle(BundleInspection(bundlePath, codeSignBackend, sectionReader, cache))
+    except CheckException as e:
+        return BundleReport(appPath, [e], [], None, {}, [])
+
+
+def inspectOpenedBundle(inspection: BundleInspection) -> BundleReport:
+    """Returns the BundleReport for an app that's on disk or in an archive that's been opened in place."""
+    appPath = inspection.appPath
+    problems = checkProblems(inspection)
+
+    def requirement(programPath: str, programType: str) -> Optional[str]:
+        try:
+            return inspection.designatedRequirement(programPath, programType)
+        except CheckException:
+            return None
+
+    try:
+        toolPathList = inspection.toolPaths()
+    except CheckException:
+        toolPathList = []
+    return BundleReport(
+        appPath, 
+        problems, 
+        toolPathList, 
+        requirement(appPath, "app") if isDirectory(appPath) else None, 
+        {os.path.basename(toolPath): requirement(toolPath, "tool") for toolPath in toolPathList}, 
+        inspection.nestedCode() if isDirectory(appPath) else []
+    )
+
+
+def expandAppPaths(appArgs: List[str]) -> List[str]:
+    """
+    Expands the app arguments of the "check" subcommand.  "-" reads app paths from stdin, 
+    one per line, and an argument containing glob characters is replaced by its matches.
+    """
+    appPaths = []
+    for appArg in appArgs:
+        if appArg == "-":
+            appPaths.extend(line.strip() for line in sys.stdin if line.strip() != "")
+        elif glob.has_magic(appArg):
+            # A pattern that matches nothing is passed through, so that it's reported 
+            # as "app not found" rather than silently ignored.
+            appPaths.extend(sorted(glob.glob(appArg)) or [appArg])
+        else:
+            appPaths.append(appArg)
+    return appPaths
+
+
+def checkMany(appPaths: List[str], jobs: int, incremental: bool = False) -> List[Tuple[str, Optional[CheckException]]]:
+    """
+    Checks each of the specified apps, as check does, running up to "jobs" checks at once, and 
+    returns each app path paired with the problem found (None if the app passed), in the order given.
+    """
+
+    # The checks spend nearly all their time hashing pages and resources, and hashlib 
+    # releases the GIL while it hashes, so threads run them in parallel.  The "jobs" 
+    # threads are shared out between the checks running at once, so that each check's 
+    # own threads don't multiply them.
+
+    checkCount = max(1, min(jobs, len(appPaths)))
+    workers = max(1, jobs // checkCount)
+
+    def checkOne(appPath: str) -> Optional[CheckException]:
+        try:
+            check(appPath, incremental, workers)
+        except CheckException as e:
+            return e
+        return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=checkCount) as executor:
+        return list(zip(appPaths, executor.map(checkOne, appPaths)))
+
+
+def formatCheckException(e: CheckException, defaultPrefix: str) -> str:
+    """Formats a check problem, or each of several, the way it's reported on stderr."""
+    if isinstance(e, CheckFailures):
+        return "\n".join(formatCheckException(failure, defaultPrefix) for failure in e.failures)
+    if e.path is None:
+        return f"{defaultPrefix}: {e.message}"
+    path = e.path
+    if path.endswith("/"):
+        path = path[:-1]
+    return f"{path}: {e.message}"
+
+
+class PlistChange(NamedTuple):
+    """A change setreq makes (or, in a dry run, would make) to one key of an Info.plist; oldValue is None if the key was absent."""
+    path: str
+    key: str
+    oldValue: object
+    newValue: object
+
+
+def writeFileAtomically(path: str, data: bytes) -> None:
+    """
+    Replaces the file's contents with data by writing a temporary file alongside it and
+    renaming that over it, so that an interrupted write never leaves a truncated file.
+    The file keeps its permissions.
+    """
+    directoryPath = os.path.dirname(path) or "."
+    fd, tempPath = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=directoryPath)
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        try:
+            os.chmod(tempPath, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            os.chmod(tempPath, 0o644)
+        os.replace(tempPath, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tempPath)
+        raise
+
+
+def writeFileIfChanged(path: str, data: bytes) -> bool:
+    """Writes data to the file atomically unless it already holds exactly that, returning whether it was written."""
+    try:
+        with open(path, "rb") as fp:
+            if fp.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    writeFileAtomically(path, data)
+    return True
+
+
+class SourcePlist(NamedTuple):
+    """An Info.plist source file as setreq read it: its bytes, its contents, and its format (plistlib.FMT_XML or FMT_BINARY)."""
+    path: str
+    data: bytes
+    value: dict
+    format: plistlib.PlistFormat
+
+
+def readSourcePlist(path: str) -> SourcePlist:
+    with traced("plistlib.load", "plist", path=path) as span, open(path, "rb") as fp:
+        data = fp.read()
+        span.addBytes(len(data))
+    value = plistlib.loads(data)
+    if not isinstance(value, dict):
+        raise CheckException("property list is not a dictionary", path)
+    return SourcePlist(path, data, value, plistlib.FMT_BINARY if data.startswith(b"bplist00") else plistlib.FMT_XML)
+
+
+def writeSourcePlist(sourcePlist: SourcePlist) -> None:
+    """Writes the source plist's value back to it, atomically and in the format it was read in."""
+    with traced("plistlib.dump", "plist", path=sourcePlist.path) as span:
+        data = plistlib.dumps(sourcePlist.value, fmt=sourcePlist.format)
+        writeFileAtomically(sourcePlist.path, data)
+        span.addBytes(len(data))
+
+
+def setreqInputPaths(appPath: str, appInfoPlistPath: str, toolInfoPlistPaths: List[str]) -> List[str]:
+    """
+    Returns the files and directories setreq's result depends on: those whose signatures
+    hold the designated requirements, the directories listing them (so that an added or
+    removed tool is noticed), and the Info.plist source files.
+    """
+    layout = bundleLayout(appPath)
+    toolDirPath = os.path.join(layout.contentsPath, "Library", "LaunchServices")
+    paths = [layout.infoPath, layout.codeResourcesPath]
+    for directoryPath in (layout.executableDirPath, toolDirPath):
+        paths.append(directoryPath)
+        try:
+            paths.extend(os.path.join(directoryPath, name) for name, _, _ in directoryEntries(directoryPath))
+        except OSError:
+            pass
+    return paths + [appInfoPlistPath] + toolInfoPlistPaths
+
+
+def readSetreqStamp(stampPath: str) -> dict:
+    """Returns the stamp left by the last setreq, or an empty one if there's none or it can't be read."""
+    try:
+        with open(stampPath, "rb") as fp:
+            stamp = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    return stamp if isinstance(stamp, dict) else {}
+
+
+def setreq(appPath: str, appInfoPlistPath: str, toolInfoPlistPaths: List[str], out: Optional[TextIO] = None, dryRun: bool = False, codeSignBackend: Optional[CodeSignBackend] = None, stampPath: Optional[str] = None, inputFileListPath: Optional[str] = None, outputFileListPath: Optional[str] = None) -> List[PlistChange]:
+    """
+    Reads information from the built app and uses it to set the SMJobBless setup
+    in the specified app and tool Info.plist source files, and returns the changes
+    made.  With dryRun, nothing is written; the changes are only returned.  Progress
+    is printed to out, if given.
+
+    With stampPath, setreq records the identity of everything it read, and a hash of
+    the designated requirements and source files, in that file.  A later run whose
+    inputs all have the same identity returns without reading any of them; one whose
+    inputs have the same hash writes nothing but the stamp.  inputFileListPath and
+    outputFileListPath name Xcode file lists (.xcfilelist) to write, listing those
+    inputs and the stamp, so that Xcode can skip the build phase altogether.  Only
+    source files whose contents change are ever written, each atomically and in the
+    format (XML or binary) it was in.
+    """
+
+    def report(message: str) -> None:
+        if out is not None:
+            print(message, file=out)
+
+    report(f"Setting up SMJobBless for app: {appPath}")
+    report(f"App Info.plist: {appInfoPlistPath}")
+    report(f"Tool Info.plist paths: {toolInfoPlistPaths}")
+
+    if not os.path.isdir(appPath):
+        raise CheckException(f"app directory not found: {appPath}", appPath)
+
+    if not os.path.isfile(appInfoPlistPath):
+        raise CheckException(f"app Info.plist not found: {appInfoPlistPath}", appInfoPlistPath)
+
+    for toolInfoPlistPath in toolInfoPlistPaths:
+        if not os.path.isfile(toolInfoPlistPath):
+            raise CheckException(f"tool Info.plist not found: {toolInfoPlistPath}", toolInfoPlistPath)
+
+    # The file lists are written first, and only if their contents change, since Xcode
+    # reruns the phase whenever a file list is newer than its outputs.  The input list 
+    # holds the same paths as the stamp's identities, directories included, so that 
+    # Xcode notices an added or removed tool just as setreq does.
+
+    inputPaths = setreqInputPaths(appPath, appInfoPlistPath, toolInfoPlistPaths)
+    if not dryRun:
+        if inputFileListPath is not None:
+            writeFileIfChanged(inputFileListPath, "".join(f"{os.path.abspath(path)}\n" for path in inputPaths if os.path.exists(path)).encode("utf-8"))
+        if outputFileListPath is not None and stampPath is not None:
+            writeFileIfChanged(outputFileListPath, f"{os.path.abspath(stampPath)}\n".encode("utf-8"))
+
+    # If nothing has been touched since the stamp was written, there's nothing to do.
+
+    arguments = [os.path.abspath(path) for path in [appPath, appInfoPlistPath] + toolInfoPlistPaths]
+    stamp = readSetreqStamp(stampPath) if stampPath is not None else {}
+    identities = {path: statIdentity(path) for path in inputPaths}
+    if stamp.get("arguments") == arguments and stamp.get("identities") == identities:
+        report("Nothing changed since the last run")
+        return []
+
+    inspection = BundleInspection(appPath, codeSignBackend)
+    changes: List[PlistChange] = []
+
+    appReq = inspection.designatedRequirement(appPath, "app")
+    report(f"App designated requirement: {appReq}")
+
+    toolNameToReqMap = {}
+    for toolPath in inspection.toolPaths():
+        toolName = os.path.basename(toolPath)
+        req = inspection.designatedRequirement(toolPath, "tool")
+        report(f"Tool {toolName} designated requirement: {req}")
+        toolNameToReqMap[toolName] = req
+
+    # The hash covers the requirements and the source files as read, so a source file
+    # that's been touched, but not changed, doesn't cause any work.
+
+    def contentHash(sourceData: List[bytes]) -> str:
+        digest = hashlib.sha256()
+        digest.update(json.dumps([arguments, appReq, sorted(toolNameToReqMap.items())]).encode("utf-8"))
+        for data in sourceData:
+            digest.update(hashlib.sha256(data).digest())
+        return digest.hexdigest()
+
+    try:
+        appInfoPlist = readSourcePlist(appInfoPlistPath)
+    except Exception as e:
+        raise CheckException(f"Error reading app Info.plist: {str(e)}", appInfoPlistPath)
+    sourcePlists = [appInfoPlist]
+
+    appToolDict = {}
+    toolInfoPlists = []
+    for toolInfoPlistPath in toolInfoPlistPaths:
+        try:
+            toolInfoPlist = readSourcePlist(toolInfoPlistPath)
+            toolInfoPlists.append(toolInfoPlist)
+            toolInfo = toolInfoPlist.value
+
+            if 'CFBundleIdentifier' not in toolInfo:
+                raise CheckException("'CFBundleIdentifier' not found", toolInfoPlistPath)
+            bundleID = toolInfo['CFBundleIdentifier']
+            if not isinstance(bundleID, str):
+                raise CheckException("'CFBundleIdentifier' must be a string", toolInfoPlistPath)
+            if bundleID not in toolNameToReqMap:
+                raise CheckException(f"tool '{bundleID}' not found in 'Contents/Library/LaunchServices'", toolInfoPlistPath)
+            appToolDict[bundleID] = toolNameToReqMap[bundleID]
+        except Exception as e:
+            raise CheckException(f"Error reading tool Info.plist: {str(e)}", toolInfoPlistPath)
+    sourcePlists.extend(toolInfoPlists)
+
+    inputHash = contentHash([sourcePlist.data for sourcePlist in sourcePlists])
+    if stamp.get("contentHash") == inputHash:
+        report("Nothing changed since the last run")
+    else:
+        try:
+            appInfo = appInfoPlist.value
+            needsUpdate = 'SMPrivilegedExecutables' not in appInfo
+            if not needsUpdate:
+                oldAppToolDict = appInfo['SMPrivilegedExecutables']
+                if not isinstance(oldAppToolDict, dict):
+                    raise CheckException("'SMPrivilegedExecutables' must be a dictionary", appInfoPlistPath)
+                appToolDictSorted = sorted(appToolDict.items())
+                oldAppToolDictSorted = sorted(oldAppToolDict.items())
+                needsUpdate = appToolDictSorted != oldAppToolDictSorted
+
+            if needsUpdate:
+                changes.append(PlistChange(appInfoPlistPath, 'SMPrivilegedExecutables', appInfo.get('SMPrivilegedExecutables'), appToolDict))
+                appInfo['SMPrivilegedExecutables'] = appToolDict
+                if not dryRun:
+                    writeSourcePlist(appInfoPlist)
+                report(f"{appInfoPlistPath}: {'would be updated' if dryRun else 'updated'}")
+        except Exception as e:
+            raise CheckException(f"Error updating app Info.plist: {str(e)}", appInfoPlistPath)
+
+        toolAppListSorted = [appReq]  # only one element, so obviously sorted
+        for toolInfoPlist in toolInfoPlists:
+            toolInfoPlistPath = toolInfoPlist.path
+            try:
+                toolInfo = toolInfoPlist.value
+
+                needsUpdate = 'SMAuthorizedClients' not in toolInfo
+                if not needsUpdate:
+                    oldToolAppList = toolInfo['SMAuthorizedClients']
+                    if not isinstance(oldToolAppList, list):
+                        raise CheckException("'SMAuthorizedClients' must be an array", toolInfoPlistPath)
+                    oldToolAppListSorted = sorted(oldToolAppList)
+                    needsUpdate = toolAppListSorted != oldToolAppListSorted
+
+                if needsUpdate:
+                    changes.append(PlistChange(toolInfoPlistPath, 'SMAuthorizedClients', toolInfo.get('SMAuthorizedClients'), toolAppListSorted))
+                    toolInfo['SMAuthorizedClients'] = toolAppListSorted
+                    if not dryRun:
+                        writeSourcePlist(toolInfoPlist)
+                    report(f"{toolInfoPlistPath}: {'would be updated' if dryRun else 'updated'}")
+            except Exception as e:
+                raise CheckException(f"Error updating tool Info.plist: {str(e)}", toolInfoPlistPath)
+
+    # The stamp records the source files as they are now, after any changes, and is
+    # rewritten even when nothing else is, so that it's newer than every input.
+
+    if stampPath is not None and not dryRun:
+        if len(changes) != 0:
+            inputHash = contentHash([readFileData(sourcePlist.path) for sourcePlist in sourcePlists])
+        stamp = {
+            "arguments": arguments,
+            "identities": {path: statIdentity(path) for path in inputPaths},
+            "contentHash": inputHash,
+        }
+        try:
+            writeFileAtomically(stampPath, json.dumps(stamp, indent=1).encode("utf-8"))
+        except OSError as e:
+            raise CheckException(f"Error writing stamp: {str(e)}", stampPath)
+
+    return changes
+
+
+# Ed25519 parameters, from RFC 8032.
+
+ED25519_P = 2 ** 255 - 19
+ED25519_L = 2 ** 252 + 27742317777372353535851937790883648493
+ED25519_D = -121665 * pow(121666, ED25519_P - 2, ED25519_P) % ED25519_P
+ED25519_SQRT_M1 = pow(2, (ED25519_P - 1) // 4, ED25519_P)
+
+
+def ed25519RecoverX(y: int, sign: int) -> Optional[int]:
+    p = ED25519_P
+    xx = (y * y - 1) * pow(ED25519_D * y * y + 1, p - 2, p) % p
+    if xx == 0:
+        return None if sign else 0
+    x = pow(xx, (p + 3) // 8, p)
+    if (x * x - xx) % p != 0:
+        x = x * ED25519_SQRT_M1 % p
+    if (x * x - xx) % p != 0:
+        return None
+    if (x & 1) != sign:
+        x = p - x
+    return x
+
+
+def ed25519Decode(encoded: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """Decodes a point to extended coordinates, or returns None if it's not on the curve."""
+    if len(encoded) != 32:
+        return None
+    y = int.from_bytes(encoded, "little")
+    sign = y >> 255
+    y &= (1 << 255) - 1
+    if y >= ED25519_P:
+        return None
+    x = ed25519RecoverX(y, sign)
+    if x is None:
+        return None
+    return (x, y, 1, x * y % ED25519_P)
+
+
+def ed25519Add(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+    p = ED25519_P
+    A = (a[1] - a[0]) * (b[1] - b[0]) % p
+    B = (a[1] + a[0]) * (b[1] + b[0]) % p
+    C = 2 * a[3] * b[3] * ED25519_D % p
+    D = 2 * a[2] * b[2] % p
+    E, F, G, H = B - A, D - C, D + C, B + A
+    return (E * F % p, G * H % p, F * G % p, E * H % p)
+
+
+def ed25519Multiply(scalar: int, point: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+    result = (0, 1, 1, 0)
+    while scalar > 0:
+        if scalar & 1:
+            result = ed25519Add(result, point)
+        point = ed25519Add(point, point)
+        scalar >>= 1
+    return result
+
+
+def ed25519Equal(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> bool:
+    p = ED25519_P
+    return (a[0] * b[2] - b[0] * a[2]) % p == 0 and (a[1] * b[2] - b[1] * a[2]) % p == 0
+
+
+ED25519_BASE_Y = 4 * pow(5, ED25519_P - 2, ED25519_P) % ED25519_P
+ED25519_BASE = (ed25519RecoverX(ED25519_BASE_Y, 0), ED25519_BASE_Y, 1, ed25519RecoverX(ED25519_BASE_Y, 0) * ED25519_BASE_Y % ED25519_P)
+
+
+class Ed25519Verifier:
+    """
+    Checks an Ed25519 signature, as in Sparkle's sparkle:edSignature, over data that's fed 
+    to it in pieces.  The only thing Ed25519 needs from the data is SHA-512(R || A || data), 
+    so the data is hashed as it streams past and never held in memory.
+    """
+
+    def __init__(self, publicKey: bytes, signature: bytes):
+        self.publicKey = publicKey
+        self.signature = signature
+        self._digest = hashlib.sha512(signature[:32] + publicKey)
+
+    def update(self, data: bytes) -> None:
+        self._digest.update(data)
+
+    def verify(self) -> bool:
+        if len(self.signature) != 64:
+            return False
+        R = ed25519Decode(self.signature[:32])
+        A = ed25519Decode(self.publicKey)
+        s = int.from_bytes(self.signature[32:], "little")
+        if R is None or A is None or s >= ED25519_L:
+            return False
+        h = int.from_bytes(self._digest.digest(), "little") % ED25519_L
+        return ed25519Equal(ed25519Multiply(s, ED25519_BASE), ed25519Add(R, ed25519Multiply(h, A)))
+
+
+SPARKLE_NAMESPACE = "{http://www.andymatuschak.org/xml-namespaces/sparkle}"
+
+
+class FeedItem(NamedTuple):
+    """A release listed in a Sparkle appcast; the enclosure fields are None if they're missing."""
+    title: str
+    version: Optional[str]
+    shortVersion: Optional[str]
+    url: Optional[str]
+    length: Optional[int]
+    edSignature: Optional[str]
+
+
+def parseFeedItems(feedPath: str) -> Iterator[FeedItem]:
+    """Yields each item of the appcast as soon as it's been parsed, discarding the XML as it goes."""
+    try:
+        for event, element in xml.etree.ElementTree.iterparse(feedPath, events=("end",)):
+            if element.tag != "item":
+                continue
+            enclosure = element.find("enclosure")
+            attributes = {} if enclosure is None else enclosure.attrib
+            version = element.findtext(SPARKLE_NAMESPACE + "version") or attributes.get(SPARKLE_NAMESPACE + "version")
+            shortVersion = element.findtext(SPARKLE_NAMESPACE + "shortVersionString") or attributes.get(SPARKLE_NAMESPACE + "shortVersionString")
+            length = attributes.get("length")
+            yield FeedItem(
+                element.findtext("title") or shortVersion or version or "item", 
+                version, 
+                shortVersion, 
+                attributes.get("url"), 
+                int(length) if length is not None and length.isdigit() else None, 
+                attributes.get(SPARKLE_NAMESPACE + "edSignature")
+            )
+            element.clear()
+    except (OSError, xml.etree.ElementTree.ParseError) as e:
+        raise CheckException(f"feed unreadable: {str(e)}", feedPath)
+
+
+def feedArchiveCandidates(item: FeedItem, archivesDir: str) -> List[str]:
+    """
+    Returns the paths at which a local copy of the item's archive might be, most specific 
+    first: a per-version directory, then a versioned file name, then the enclosure's name.
+    """
+    if item.url is None:
+        return []
+    name = os.path.basename(item.url.split("?")[0])
+    stem, extension = os.path.splitext(name)
+    candidates = []
+    for version in (item.shortVersion, item.version):
+        if version is not None:
+            candidates.append(os.path.join(archivesDir, version, name))
+            candidates.append(os.path.join(archivesDir, f"{stem}-{version}{extension}"))
+    candidates.append(os.path.join(archivesDir, name))
+    return candidates
+
+
+def measureArchive(archivePath: str, verifier: Optional[Ed25519Verifier]) -> int:
+    """Reads the archive once, from start to end, feeding it to the verifier, and returns its length."""
+    length = 0
+    with traced("measure archive", "archive", path=archivePath) as span, open(archivePath, "rb") as fp:
+        while True:
+            chunk = fp.read(1024 * 1024)
+            if len(chunk) == 0:
+                break
+            length += len(chunk)
+            if verifier is not None:
+                verifier.update(chunk)
+        span.addBytes(length)
+    return length
+
+
+def verifyFeedItem(item: FeedItem, archivePath: str, makeVerifier: Callable[[bytes, bytes], Ed25519Verifier] = Ed25519Verifier, workers: Optional[int] = None) -> List[CheckException]:
+    """
+    Checks that the local archive matches the feed item (its length, EdDSA signature and 
+    version) and that the app in it passes "check", using up to workers threads, and 
+    returns every problem found.
+    """
+    problems: List[CheckException] = []
+    try:
+        with openedBundle(archivePath) as appPath:
+
+            # The public key comes from the app in the archive, which is read in place, so 
+            # the archive itself is read from start to end just once, to measure it and 
+            # check its signature together.
+
+            appInfo = readInfoPlistFromPath(bundleLayout(appPath).infoPath)
+            publicKey = appInfo.get("SUPublicEDKey")
+            verifier = None
+            if item.edSignature is not None and isinstance(publicKey, str):
+                try:
+                    verifier = makeVerifier(base64.b64decode(publicKey), base64.b64decode(item.edSignature))
+                except ValueError:
+                    problems.append(CheckException("sparkle:edSignature or 'SUPublicEDKey' isn't valid base64", archivePath))
+            length = measureArchive(archivePath, verifier)
+
+            if item.length is not None and length != item.length:
+                problems.append(CheckException(f"archive length ({length}) doesn't match enclosure length ({item.length})", archivePath))
+            if item.edSignature is None:
+                if publicKey is not None:
+                    problems.append(CheckException("enclosure has no sparkle:edSignature but the app has an 'SUPublicEDKey'", archivePath))
+            elif not isinstance(publicKey, str):
+                problems.append(CheckException("enclosure has a sparkle:edSignature but the app has no 'SUPublicEDKey'", archivePath))
+            elif verifier is not None and not verifier.verify():
+                problems.append(CheckException("archive doesn't match enclosure sparkle:edSignature", archivePath))
+            bundleVersion = appInfo.get("CFBundleVersion")
+            if item.version is not None and bundleVersion != item.version:
+                problems.append(CheckException(f"sparkle:version ({item.version}) doesn't match app 'CFBundleVersion' ({bundleVersion})", archivePath))
+
+            problems.extend(checkProblems(BundleInspection(appPath, workers=workers)))
+    except CheckException as e:
+        problems.append(e)
+    return problems
+
+
+def verifyFeed(feedPath: str, archivesDir: str, jobs: int, makeVerifier: Callable[[bytes, bytes], Ed25519Verifier] = Ed25519Verifier) -> Iterator[Tuple[FeedItem, Optional[str], List[CheckException]]]:
+    """
+    Verifies each item of the appcast against its local archive in archivesDir, up to jobs 
+    at once, each on a single thread, and yields (item, archive path, problems) for each 
+    in feed order.  Items are queued for verification as they're parsed.
+    """
+
+    # An archive found only by the enclosure's name belongs to the first (newest) item 
+    # with that name; older releases that reused the name must be kept under a version.
+
+    claimedPaths: Set[str] = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        pending = []
+        for item in parseFeedItems(feedPath):
+            candidates = feedArchiveCandidates(item, archivesDir)
+            archivePath = next((path for path in candidates if os.path.isfile(path) and path not in claimedPaths), None)
+            if archivePath is None:
+                missing = CheckException(f"no local archive for this release (looked for {', '.join(os.path.relpath(path, archivesDir) for path in candidates) or 'nothing; no enclosure URL'})", archivesDir)
+                future: concurrent.futures.Future = concurrent.futures.Future()
+                future.set_result([missing])
+            else:
+                if archivePath == candidates[-1]:
+                    claimedPaths.add(archivePath)
+                future = executor.submit(verifyFeedItem, item, archivePath, makeVerifier, 1)
+            pending.append((item, archivePath, future))
+        for item, archivePath, future in pending:
+            yield (item, archivePath, future.result())
+
+
+def reportTimings(showTimings: bool, tracePath: Optional[str]) -> None:
+    """Prints the timing summary, and the per-stage table if asked for, and writes the trace file."""
+    if tracer is None:
+        return
+    if showTimings:
+        print(f"{'stage':<32} {'count':>6} {'wall ms':>10} {'cpu ms':>10} {'bytes':>12}", file=sys.stderr)
+        for name, count, wall, cpu, byteCount in tracer.stageTotals():
+            print(f"{name:<32} {count:>6} {wall:>10.1f} {cpu:>10.1f} {byteCount:>12}", file=sys.stderr)
+        components = tracer.componentTimings()
+        if len(components) != 0:
+            print(f"{'nested code':<60} {'wall ms':>10} result", file=sys.stderr)
+            for path, wall, result in components:
+                print(f"{path:<60} {wall:>10.1f} {result}", file=sys.stderr)
+    if tracePath is not None:
+        tracer.writeChromeTrace(tracePath)
+    print(f"{os.path.basename(sys.argv[0])}: {tracer.summary()}", file=sys.stderr)
+
+
+# Event masks from <sys/inotify.h>.
+
+IN_MODIFY       = 0x00000002
+IN_ATTRIB       = 0x00000004
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_FROM   = 0x00000040
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_DELETE       = 0x00000200
+IN_DELETE_SELF  = 0x00000400
+IN_MOVE_SELF    = 0x00000800
+IN_Q_OVERFLOW   = 0x00004000
+IN_IGNORED      = 0x00008000
+IN_ISDIR        = 0x40000000
+IN_NONBLOCK     = 0o4000
+IN_CLOEXEC      = 0o2000000
+
+INOTIFY_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+
+class InotifyWatcher:
+    """
+    Watches a directory tree using Linux's inotify, through ctypes.  Directories created 
+    within the tree are watched as they appear.  Raises OSError if inotify isn't available.
+    """
+
+    def __init__(self, rootPath: str):
+        self.rootPath = rootPath
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify not available")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self._dirPaths: Dict[int, str] = {}
+        self._addTree(rootPath)
+
+    def _addTree(self, dirPath: str) -> None:
+        for parentPath, dirNames, fileNames in os.walk(dirPath):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(parentPath), INOTIFY_WATCH_MASK)
+            if wd >= 0:
+                self._dirPaths[wd] = parentPath
+
+    def _readEvents(self) -> Set[str]:
+        changedPaths: Set[str] = set()
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return changedPaths
+            offset = 0
+            while offset < len(data):
+                (wd, mask, cookie, nameLength) = struct.unpack_from("=iIII", data, offset)
+                name = data[offset + 16:offset + 16 + nameLength].rstrip(b"\0")
+                offset += 16 + nameLength
+
+                # An overflowed queue, or the root being deleted or replaced, means 
+                # everything must be checked again.
+
+                dirPath = self._dirPaths.get(wd)
+                if (mask & IN_Q_OVERFLOW) != 0 or dirPath is None:
+                    changedPaths.add(self.rootPath)
+                    continue
+                if (mask & IN_IGNORED) != 0:
+                    del self._dirPaths[wd]
+                    if dirPath == self.rootPath:
+                        changedPaths.add(self.rootPath)
+                    continue
+                path = os.path.join(dirPath, os.fsdecode(name)) if name else dirPath
+                if (mask & (IN_DELETE_SELF | IN_MOVE_SELF)) != 0 and dirPath == self.rootPath:
+                    path = self.rootPath
+                if (mask & IN_ISDIR) != 0 and (mask & (IN_CREATE | IN_MOVED_TO)) != 0:
+                    self._addTree(path)
+                changedPaths.add(path)
+
+    def changes(self, debounce: float) -> Set[str]:
+        """Waits for something in the tree to change, then for debounce seconds of quiet, and returns the changed paths."""
+        changedPaths: Set[str] = set()
+        timeout: Optional[float] = None
+        while True:
+            ready, _, _ = select.select([self._fd], [], [], timeout)
+            if not ready:
+                if changedPaths:
+                    return changedPaths
+                continue
+            changedPaths |= self._readEvents()
+            if self.rootPath in changedPaths and len(self._dirPaths) == 0:
+                return changedPaths
+            timeout = debounce
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Watches a directory tree by periodically comparing the stat identity of everything in it."""
+
+    def __init__(self, rootPath: str, interval: float = 0.5):
+        self.rootPath = rootPath
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int, int]]:
+        snapshot: Dict[str, Tuple[int, int, int]] = {}
+        dirPaths = [self.rootPath]
+        try:
+            st = os.stat(self.rootPath)
+            snapshot[self.rootPath] = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            return snapshot
+        while dirPaths:
+            try:
+                entries = list(os.scandir(dirPaths.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                snapshot[entry.path] = (st.st_ino, st.st_size, st.st_mtime_ns)
+                if entry.is_dir(follow_symlinks=False):
+                    dirPaths.append(entry.path)
+        return snapshot
+
+    def _poll(self) -> Set[str]:
+        snapshot = self._scan()
+        previous = self._snapshot
+        self._snapshot = snapshot
+        return {path for path in snapshot.keys() | previous.keys() if snapshot.get(path) != previous.get(path)}
+
+    def changes(self, debounce: float) -> Set[str]:
+        """Waits for something in the tree to change, then for debounce seconds of quiet, and returns the changed paths."""
+        changedPaths: Set[str] = set()
+        while True:
+            time.sleep(self.interval if not changedPaths else max(debounce, self.interval))
+            newPaths = self._poll()
+            if not newPaths and changedPaths:
+                return changedPaths
+            changedPaths |= newPaths
+
+    def close(self) -> None:
+        pass
+
+
+def makeWatcher(appPath: str):
+    """Returns an InotifyWatcher for the app where inotify is available, a PollingWatcher otherwise."""
+    if sys.platform.startswith("linux") and os.path.isdir(appPath):
+        try:
+            return InotifyWatcher(appPath)
+        except OSError:
+            pass
+    return PollingWatcher(appPath)
+
+
+def classifyChanges(appPath: str, changedPaths: Set[str]) -> Tuple[Set[str], Set[str]]:
+    """
+    Sorts the changed paths within the app into the inputs they affect and returns 
+    (kinds, toolPaths), where kinds contains "all", "appInfo" (the app's Info.plist) 
+    and "appCode" (anything else the app's signature covers), and toolPaths holds the 
+    tools that changed.
+    """
+    kinds: Set[str] = set()
+    toolPaths: Set[str] = set()
+    toolDirPath = os.path.join(appPath, "Contents", "Library", "LaunchServices")
+    for path in changedPaths:
+        relativePath = os.path.relpath(path, appPath)
+        if relativePath == "." or relativePath.startswith(".."):
+            kinds.add("all")
+            continue
+        components = relativePath.split(os.sep)
+        if components[-1] == ".DS_Store":
+            continue
+        if components[:3] == ["Contents", "Library", "LaunchServices"]:
+            if len(components) > 3:
+                toolPaths.add(os.path.join(toolDirPath, components[3]))
+        elif components == ["Contents", "Info.plist"]:
+            kinds.add("appInfo")
+        else:
+            kinds.add("appCode")
+    return kinds, toolPaths
+
+
+def watchTasks(inspection: BundleInspection, toolPathList: List[str], kinds: Set[str], changedToolPaths: Set[str]) -> List[Tuple[str, str, Callable[[], None]]]:
+    """
+    Returns the check tasks whose inputs are affected by the classified changes.  A tool 
+    change re-checks just that tool; a change to the app's Info.plist re-checks the 
+    SMPrivilegedExecutables and SMAuthorizedClients pairings; a change to the app's 
+    code (and so its designated requirement) re-checks step 3; and "tools" in kinds 
+    means tools were added or removed.  The nested code is re-verified after any code 
+    change, but the shared cache means only the changed components are examined again.
+    """
+    everything = "all" in kinds
+    appPath = inspection.appPath
+    tasks: List[Tuple[str, str, Callable[[], None]]] = []
+
+    def add(stepName: str, path: str, checkFunction: Callable, *args) -> None:
+        tasks.append((stepName, path, functools.partial(checkFunction, inspection, *args)))
+
+    if everything or kinds & {"appInfo", "appCode"}:
+        add("checkStep1", appPath, checkStep1App)
+    if everything or "appCode" in kinds or changedToolPaths:
+        add("checkStep1", os.path.join(appPath, "Contents"), checkStep1NestedCode)
+    if everything or "tools" in kinds:
+        add("checkStep1", inspection.toolDirPath, checkStep1ToolList)
+    if everything or kinds & {"appInfo", "tools"}:
+        add("checkStep2", appPath, checkStep2App, toolPathList)
+    for toolPath in toolPathList:
+        toolChanged = everything or toolPath in changedToolPaths
+        if toolChanged:
+            add("checkStep1", toolPath, checkStep1Tool, toolPath)
+        if toolChanged or "appInfo" in kinds:
+            add("checkStep2", toolPath, checkStep2Tool, toolPath)
+        if toolChanged or "appCode" in kinds:
+            add("checkStep3", toolPath, checkStep3Tool, toolPath)
+        if toolChanged:
+            add("checkStep4", toolPath, checkStep4Tool, toolPath)
+    return tasks
+
+
+def watch(appPath: str, debounce: float, out: TextIO) -> None:
+    """
+    Checks the app, then watches it and, each time it changes, re-runs the checks whose 
+    inputs changed, printing their problems as they're found, until interrupted.
+    """
+    global inspectionCache
+
+    if inspectionCache is None:
+        inspectionCache = InspectionCache()
+
+    # The outcome of every check task, keyed by (step name, path), so that the status 
+    # line can count the problems that remain from checks that weren't re-run.
+
+    outcomes: Dict[Tuple[str, str], Optional[CheckException]] = {}
+    kinds, changedToolPaths = {"all"}, set()
+    previousToolPathList: List[str] = []
+    watcher = makeWatcher(appPath)
+    try:
+        while True:
+            inspection = BundleInspection(appPath)
+            try:
+                toolPathList = inspection.toolPaths() if os.path.isdir(appPath) else []
+            except CheckException:
+                toolPathList = []
+            if "all" in kinds:
+                outcomes.clear()
+            elif toolPathList != previousToolPathList:
+                kinds.add("tools")
+            previousToolPathList = toolPathList
+            for key in [key for key in outcomes if key[1] in changedToolPaths and key[1] not in toolPathList]:
+                del outcomes[key]
+            
+            tasks = watchTasks(inspection, toolPathList, kinds, changedToolPaths)
+            if not os.path.isdir(appPath):
+                tasks = [task for task in tasks if task[2].func is checkStep1App]
+
+            # Problems are printed as each task finishes, except those already printed 
+            # by another task in this round.
+
+            printed = set()
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                futures = {executor.submit(runCheckTask, task): task for task in tasks}
+                for future in concurrent.futures.as_completed(futures):
+                    stepName, path, checkFunction = futures[future]
+                    e = future.result()
+                    outcomes[(stepName, path)] = e
+                    if e is not None and (e.message, e.path) not in printed:
+                        printed.add((e.message, e.path))
+                        print(formatCheckException(e, appPath), file=out)
+                        out.flush()
+
+            remaining = {(e.message, e.path) for e in outcomes.values() if e is not None}
+            status = "ok" if len(remaining) == 0 else f"{len(remaining)} problem{'s' if len(remaining) != 1 else ''}"
+            print(f"[{time.strftime('%H:%M:%S')}] {len(tasks)} checks run, {status}", file=out)
+            out.flush()
+
+            changedPaths = watcher.changes(debounce)
+            kinds, changedToolPaths = classifyChanges(appPath, changedPaths)
+
+            # The app being deleted or replaced (as a clean build does) takes the 
+            # inotify watches with it, so start watching afresh.
+
+            if "all" in kinds:
+                watcher.close()
+                watcher = makeWatcher(appPath)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def defaultSocketPath() -> str:
+    """Returns the path of the Unix domain socket that "serve" listens on and "client" connects to."""
+    return os.path.join(defaultCacheDir(), "daemon.sock")
+
+
+class ClientStream(io.TextIOBase):
+    """A text stream, standing in for stdout or stderr, whose output is sent to a client."""
+
+    def __init__(self, send: Callable[[Dict], None], name: str):
+        self._send = send
+        self.name = name
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if len(text) != 0:
+            self._send({"stream": self.name, "text": text})
+        return len(text)
+
+
+class VerificationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    The "serve" daemon.  Each connection carries one request, handled on its own thread; 
+    the server shuts itself down once it's been idle for idleTimeout seconds.
+    """
+    daemon_threads = True
+
+    def __init__(self, socketPath: str, idleTimeout: float):
+        super().__init__(socketPath, VerificationRequestHandler)
+        self.idleTimeout = idleTimeout
+        self._lock = threading.Lock()
+        self._activeRequests = 0
+        self._lastActivity = time.monotonic()
+
+    def requestStarted(self) -> None:
+        with self._lock:
+            self._activeRequests += 1
+
+    def requestFinished(self) -> None:
+        with self._lock:
+            self._activeRequests -= 1
+            self._lastActivity = time.monotonic()
+
+    def watchForIdle(self) -> None:
+        """Shuts the server down once no request has been active for idleTimeout seconds."""
+        while True:
+            time.sleep(min(self.idleTimeout, 1.0))
+            with self._lock:
+                isIdle = self._activeRequests == 0 and time.monotonic() - self._lastActivity >= self.idleTimeout
+            if isIdle:
+                self.shutdown()
+                return
+
+
+class VerificationRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one client request: a JSON line holding the command, its arguments (with 
+    paths already made absolute) and the job count.  The reply is a JSON line for each 
+    chunk of output, then one holding the exit status.
+    """
+
+    def handle(self) -> None:
+        self.server.requestStarted()
+        try:
+            request = json.loads(self.rfile.readline())
+            sendLock = threading.Lock()
+
+            def send(message: Dict) -> None:
+                with sendLock:
+                    self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+
+            status = runRequest(request.get("args", []), request.get("jobs", 1), ClientStream(send, "stdout"), ClientStream(send, "stderr"))
+            send({"exit": status})
+        except (OSError, ValueError):
+            # The client went away or sent garbage; there's no one to report it to.
+            pass
+        finally:
+            self.server.requestFinished()
+
+
+def serve(socketPath: str, idleTimeout: float) -> None:
+    """Runs the verification daemon, with warm caches, until it's been idle for idleTimeout seconds."""
+    global inspectionCache
+
+    inspectionCache = InspectionCache()
+
+    # A socket file that nothing answers on was left by a daemon that died; one that 
+    # does answer means a daemon is already running.
+
+    if os.path.exists(socketPath):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socketPath)
+            raise CheckException("daemon already running", socketPath)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(socketPath)
+        finally:
+            probe.close()
+    os.makedirs(os.path.dirname(socketPath), exist_ok=True)
+
+    server = VerificationServer(socketPath, idleTimeout)
+    try:
+        os.chmod(socketPath, 0o600)
+        threading.Thread(target=server.watchForIdle, daemon=True).start()
+        print(f"{os.path.basename(sys.argv[0])}: listening on {socketPath}", file=sys.stderr)
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(socketPath)
+        except FileNotFoundError:
+            pass
+
+
+def client(appArgs: List[str], socketPath: str, jobs: int, localOptions: List[str], runLocally: Callable[[List[str]], int]) -> int:
+    """
+    Forwards a "check" or "setreq" to the daemon and relays its output, returning its exit 
+    status.  If there's no daemon, the command is passed to runLocally instead.  The daemon 
+    can't apply the options that change how this process runs (localOptions, the ones given 
+    of "--strict", "--no-cache", "--timings" and "--trace"), so if any were given, a 
+    command that would go to the daemon is refused rather than run without them.
+    """
+
+    # The daemon has a different working directory and no access to our stdin, so 
+    # expand the app arguments and make every path absolute before sending them.
+
+    if len(appArgs) == 0:
+        raise UsageException()
+    def absoluteArg(arg: str) -> str:
+        if arg.startswith("--"):
+            option, equals, value = arg.partition("=")
+            return f"{option}={os.path.abspath(value)}" if equals else arg
+        return os.path.abspath(arg)
+
+    if appArgs[0] == "check":
+        paths = [arg for arg in appArgs[1:] if arg.startswith("--")] + expandAppPaths([arg for arg in appArgs[1:] if not arg.startswith("--")])
+    else:
+        paths = appArgs[1:]
+    forwardedArgs = [appArgs[0]] + [absoluteArg(path) for path in paths]
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socketPath)
+    except (ConnectionRefusedError, FileNotFoundError):
+        connection.close()
+        return runLocally(forwardedArgs)
+    if len(localOptions) != 0:
+        connection.close()
+        raise CheckException(f"the daemon can't apply {', '.join(localOptions)}; run the command without 'client'", socketPath)
+
+    with connection, connection.makefile("rwb") as stream:
+        stream.write((json.dumps({"args": forwardedArgs, "jobs": jobs}) + "\n").encode("utf-8"))
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if "exit" in message:
+                return message["exit"]
+            (sys.stdout if message.get("stream") == "stdout" else sys.stderr).write(message.get("text", ""))
+    raise CheckException("daemon closed the connection without finishing the request", socketPath)
+
+
+def printUsage(err: TextIO) -> None:
+    print(f"usage: {os.path.basename(sys.argv[0])} [options] check [--incremental] /path/to/app... | -", file=err)
+    print(f"       {os.path.basename(sys.argv[0])} [options] setreq /path/to/app /path/to/app/Info.plist /path/to/tool/Info.plist...", file=err)
+    print("           [--stamp /path/to/stamp] [--input-file-list /path/to/inputs.xcfilelist] [--output-file-list /path/to/outputs.xcfilelist]", file=err)
+    print(f"       {os.path.basename(sys.argv[0])} [options] verify-feed /path/to/appcast.xml [--archives /path/to/archives]", file=err)
+    print(f"       {os.path.basename(sys.argv[0])} [options] watch /path/to/app", file=err)
+    print(f"       {os.path.basename(sys.argv[0])} [options] serve", file=err)
+    print(f"       {os.path.basename(sys.argv[0])} [options] client check|setreq ...", file=err)
+    print("options: -j jobs --no-cache --strict --timings --trace /path/to/trace.json", file=err)
+    print("         --socket /path/to/socket --idle-timeout seconds --debounce seconds", file=err)
+
+
+def runRequest(appArgs: List[str], jobs: int, out: TextIO, err: TextIO) -> int:
+    """Runs a command on behalf of a client, reporting problems to err, and returns its exit status."""
+    try:
+        return runCommand(appArgs, jobs, out, err)
     except CheckException as e:
-        if e.path is None:
-            print(f"{os.path.basename(sys.argv[0])}: {e.message}", file=sys.stderr)
+        print(formatCheckException(e, os.path.basename(sys.argv[0])), file=err)
+        return 1
+    except UsageException as e:
+        printUsage(err)
+        return 1
+
+
+def main() -> None:
+    global strictVerification
+
+    try:
+        options, appArgs = getopt.getopt(sys.argv[1:], "dj:", ["no-cache", "strict", "timings", "trace=", "socket=", "idle-timeout=", "debounce="])
+    except getopt.GetoptError:
+        raise UsageException()
+    
+    debug = False
+    useCache = True
+    showTimings = False
+    tracePath = None
+    socketPath = defaultSocketPath()
+    idleTimeout = 600.0
+    debounce = 0.3
+    jobs = os.cpu_count() or 1
+    for opt, val in options:
+        if opt == "-d":
+            debug = True
+        elif opt == "-j":
+            try:
+                jobs = int(val)
+            except ValueError:
+                raise UsageException()
+            if jobs < 1:
+                raise UsageException()
+        elif opt == "--no-cache":
+            useCache = False
+        elif opt == "--strict":
+            strictVerification = True
+        elif opt == "--timings":
+            showTimings = True
+        elif opt == "--trace":
+            tracePath = val
+        elif opt == "--socket":
+            socketPath = val
+        elif opt == "--idle-timeout":
+            try:
+                idleTimeout = float(val)
+            except ValueError:
+                raise UsageException()
+            if idleTimeout <= 0:
+                raise UsageException()
+        elif opt == "--debounce":
+            try:
+                debounce = float(val)
+            except ValueError:
+                raise UsageException()
+            if debounce < 0:
+                raise UsageException()
+        else:
+            raise UsageException()
+
+    def openCache() -> None:
+        global codeSignCache
+        if useCache and codeSignCache is None:
+            try:
+                codeSignCache = CodeSignCache(defaultCacheDir())
+            except (OSError, sqlite3.Error):
+                codeSignCache = None
+
+    def runLocally(commandArgs: List[str]) -> int:
+        global tracer
+        openCache()
+        if showTimings or tracePath is not None:
+            tracer = Tracer()
+        try:
+            return runCommand(commandArgs, jobs, sys.stdout, sys.stderr)
+        finally:
+            reportTimings(showTimings, tracePath)
+
+    # The client sets up what a local run needs only if there turns out to be no daemon.
+
+    if len(appArgs) != 0 and appArgs[0] == "client":
+        localOptions = list(dict.fromkeys(opt for opt, _ in options if opt in ("--strict", "--no-cache", "--timings", "--trace")))
+        status = client(appArgs[1:], socketPath, jobs, localOptions, runLocally)
+        if status != 0:
+            sys.exit(status)
+        return
+
+    openCache()
+
+    if len(appArgs) == 1 and appArgs[0] == "serve":
+        serve(socketPath, idleTimeout)
+        return
+
+    if len(appArgs) == 2 and appArgs[0] == "watch":
+        watch(appArgs[1], debounce, sys.stdout)
+        return
+
+    status = runLocally(appArgs)
+    if status != 0:
+        sys.exit(status)
+
+
+def runCommand(appArgs: List[str], jobs: int, out: TextIO, err: TextIO) -> int:
+    """
+    Runs a "check", "verify-feed" or "setreq" command line, writing its output to out and err, and 
+    returns its exit status.  A problem with a single app is raised, not returned.
+    """
+    if len(appArgs) == 0:
+        raise UsageException()
+    command = appArgs[0]
+    if command == "check":
+        try:
+            options, checkArgs = getopt.gnu_getopt(appArgs[1:], "", ["incremental"])
+        except getopt.GetoptError:
+            raise UsageException()
+        incremental = len(options) != 0
+        appPaths = expandAppPaths(checkArgs)
+        if len(appPaths) == 0:
+            raise UsageException()
+        if len(appPaths) == 1:
+            check(appPaths[0], incremental, jobs)
         else:
-            path = e.path
-            if path.endswith("/"):
-                path = path[:-1]
-            print(f"{path}: {e.message}", file=sys.stderr)
+            results = checkMany(appPaths, jobs, incremental)
+            failureCount = 0
+            for appPath, e in results:
+                if e is None:
+                    print(f"{appPath}: ok", file=out)
+                else:
+                    failureCount += 1
+                    print(formatCheckException(e, appPath), file=err)
+            print(f"{len(results)} apps checked, {len(results) - failureCount} passed, {failureCount} failed", file=err)
+            if failureCount != 0:
+                return 1
+    elif command == "verify-feed":
+        try:
+            options, feedArgs = getopt.gnu_getopt(appArgs[1:], "", ["archives="])
+        except getopt.GetoptError:
+            raise UsageException()
+        if len(feedArgs) != 1:
+            raise UsageException()
+        archivesDir = dict(options).get("--archives", os.path.dirname(feedArgs[0]) or ".")
+        itemCount = 0
+        failureCount = 0
+        for item, archivePath, problems in verifyFeed(feedArgs[0], archivesDir, jobs):
+            itemCount += 1
+            if len(problems) == 0:
+                print(f"{item.title}: ok", file=out)
+            else:
+                failureCount += 1
+                for e in problems:
+                    print(f"{item.title}: {formatCheckException(e, archivePath or archivesDir)}", file=err)
+        print(f"{itemCount} releases verified, {itemCount - failureCount} passed, {failureCount} failed", file=err)
+        if failureCount != 0:
+            return 1
+    elif command == "setreq":
+        try:
+            options, setreqArgs = getopt.gnu_getopt(appArgs[1:], "", ["stamp=", "input-file-list=", "output-file-list="])
+        except getopt.GetoptError:
+            raise UsageException()
+        if len(setreqArgs) < 3:
+            raise UsageException()
+        options = dict(options)
+
+        # Without an explicit stamp, one is kept in the cache directory, unless caching 
+        # is off, named for the arguments so that each app and its sources get their own.
+
+        stampPath = options.get("--stamp")
+        if stampPath is None and codeSignCache is not None:
+            stampName = hashlib.sha256(json.dumps([os.path.abspath(path) for path in setreqArgs]).encode("utf-8")).hexdigest()
+            stampDirPath = os.path.join(defaultCacheDir(), "setreq")
+            with contextlib.suppress(OSError):
+                os.makedirs(stampDirPath, exist_ok=True)
+                stampPath = os.path.join(stampDirPath, f"{stampName}.json")
+        with traced("setreq", "setreq", path=setreqArgs[0]):
+            setreq(setreqArgs[0], setreqArgs[1], setreqArgs[2:], out, stampPath=stampPath, inputFileListPath=options.get("--input-file-list"), outputFileListPath=options.get("--output-file-list"))
+    else:
+        raise UsageException()
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except CheckException as e:
+        print(formatCheckException(e, os.path.basename(sys.argv[0])), file=sys.stderr)
         sys.exit(1)
     except UsageException as e:
-        print(f"usage: {os.path.basename(sys.argv[0])} check  /path/to/app", file=sys.stderr)
-        print(f"       {os.path.basename(sys.argv[0])} setreq /path/to/app /path/to/app/Info.plist /path/to/tool/Info.plist...", file=sys.stderr)
+        printUsage(sys.stderr)
         sys.exit(1)
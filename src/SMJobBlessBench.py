@@ -0,0 +1,431 @@
+#! /usr/bin/env python3
+#
+#   File:       SMJobBlessBench.py
+#
+#   Contains:   Benchmarks for NewSMJobBlessUtil.py.
+#
+#               Generates synthetic app bundles, each with N helper tools, whose
+#               Mach-O images carry real embedded property lists and ad hoc code
+#               signatures, and times "check" and "setreq" against them.  A stand-in
+#               codesign executable, with a configurable latency, is put on PATH, so
+#               it runs the same on a Mac or a plain Linux box.
+#
+
+import sys
+import os
+import getopt
+import hashlib
+import json
+import platform
+import plistlib
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class UsageException(Exception):
+    """
+    Raised when the progam detects a usage issue; the top-level code catches this
+    and prints a usage message.
+    """
+    pass
+
+
+UTIL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NewSMJobBlessUtil.py")
+
+PAGE_SIZE = 4096
+CPU_TYPE_ARM64 = 0x0100000c
+
+
+def align(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def identifierRequirement(identifier: str) -> bytes:
+    """Returns a requirements blob whose designated requirement is 'identifier "<identifier>"'."""
+    data = identifier.encode("utf-8")
+    expression = struct.pack(">II", 2, len(data)) + data + b"\0" * (-len(data) % 4)                    # opIdent
+    requirement = struct.pack(">III", 0xfade0c00, 12 + len(expression), 1) + expression
+    return struct.pack(">IIIII", 0xfade0c01, 20 + len(requirement), 1, 3, 20) + requirement             # kSecDesignatedRequirementType
+
+
+def codeDirectory(identifier: str, code: bytes, specialHashes: List[Optional[bytes]]) -> bytes:
+    """Returns a SHA-256 CodeDirectory (version 0x20400) over the code, with the given special slot hashes (slot 1 first)."""
+    identifierData = identifier.encode("utf-8") + b"\0"
+    headerSize = 88
+    hashOffset = headerSize + len(identifierData) + len(specialHashes) * 32
+    pageCount = (len(code) + PAGE_SIZE - 1) // PAGE_SIZE
+    length = hashOffset + pageCount * 32
+    blob = struct.pack(">IIIIIIIIIBBBBI", 0xfade0c02, length, 0x20400, 0x2, hashOffset, headerSize, len(specialHashes), pageCount, len(code), 32, 2, 0, 12, 0)
+    blob += struct.pack(">IIIQQQQ", 0, 0, 0, 0, 0, 0, 0)
+    blob += identifierData
+    for specialHash in reversed(specialHashes):
+        blob += specialHash if specialHash is not None else b"\0" * 32
+    for offset in range(0, len(code), PAGE_SIZE):
+        blob += hashlib.sha256(code[offset:offset + PAGE_SIZE]).digest()
+    return blob
+
+
+def superBlob(blobs: List[Tuple[int, bytes]]) -> bytes:
+    indexSize = 12 + 8 * len(blobs)
+    index = b""
+    data = b""
+    for slot, blob in blobs:
+        index += struct.pack(">II", slot, indexSize + len(data))
+        data += blob
+    return struct.pack(">III", 0xfade0cc0, indexSize + len(data), len(blobs)) + index + data
+
+
+def machOImage(identifier: str, sections: List[Tuple[str, bytes]], size: int, boundFiles: Tuple[Optional[bytes], Optional[bytes]] = (None, None)) -> bytes:
+    """
+    Returns an ad hoc signed, thin arm64 Mach-O image of roughly size bytes whose "__TEXT"
+    segment holds the given sections.  boundFiles are the Info.plist and CodeResources
+    contents the signature seals, for a bundle's main executable; a tool's signature
+    seals its "__info_plist" section instead.
+    """
+    commandsSize = (72 + 80 * len(sections)) + 72 + 16
+    dataOffset = 32 + commandsSize
+    sectionRecords = b""
+    body = b""
+    for sectionName, data in sections:
+        sectionRecords += struct.pack("<16s16sQQIIIIIIII", sectionName.encode(), b"__TEXT", 0x100000000 + dataOffset + len(body), len(data), dataOffset + len(body), 0, 0, 0, 0, 0, 0, 0)
+        body += data
+    body += b"\xcc" * max(0, size - dataOffset - len(body))
+    textEnd = align(dataOffset + len(body), 16)
+    body += b"\0" * (textEnd - dataOffset - len(body))
+
+    requirements = identifierRequirement(identifier)
+    infoData, resourcesData = boundFiles
+    if infoData is None:
+        infoData = dict(sections).get("__info_plist")
+    specialHashes = [
+        None if infoData is None else hashlib.sha256(infoData).digest(),
+        hashlib.sha256(requirements).digest(),
+        None if resourcesData is None else hashlib.sha256(resourcesData).digest(),
+    ]
+
+    def image(signatureSize: int) -> bytes:
+        textSegment = struct.pack("<II16sQQQQiiII", 0x19, 72 + 80 * len(sections), b"__TEXT", 0x100000000, align(textEnd, PAGE_SIZE), 0, textEnd, 5, 5, len(sections), 0) + sectionRecords
+        linkEditSegment = struct.pack("<II16sQQQQiiII", 0x19, 72, b"__LINKEDIT", 0x100000000 + align(textEnd, PAGE_SIZE), align(signatureSize, PAGE_SIZE), textEnd, signatureSize, 1, 1, 0, 0)
+        codeSignature = struct.pack("<IIII", 0x1d, 16, textEnd, signatureSize)
+        header = struct.pack("<IiiIIIII", 0xfeedfacf, CPU_TYPE_ARM64, 0, 2, 3, commandsSize, 0, 0)
+        return header + textSegment + linkEditSegment + codeSignature + body
+
+    # The signature's size doesn't depend on the hashes in it, so sign a draft to learn
+    # the size, then sign the real thing.
+
+    def signature(code: bytes) -> bytes:
+        return superBlob([(0, codeDirectory(identifier, code, specialHashes)), (2, requirements), (0x10000, struct.pack(">II", 0xfade0b01, 8))])
+
+    signatureSize = len(signature(image(0)))
+    code = image(signatureSize)
+    return code + signature(code)
+
+
+def cdHash(image: bytes) -> bytes:
+    """Returns the cdhash of a thin image made by machOImage: the truncated SHA-256 of its code directory."""
+    ncmds = struct.unpack_from("<I", image, 16)[0]
+    offset = 32
+    for _ in range(ncmds):
+        cmd, cmdsize = struct.unpack_from("<II", image, offset)
+        if cmd == 0x1d:
+            dataOffset = struct.unpack_from("<I", image, offset + 8)[0]
+            blobOffset = struct.unpack_from(">I", image, dataOffset + 16)[0]
+            length = struct.unpack_from(">I", image, dataOffset + blobOffset + 4)[0]
+            return hashlib.sha256(image[dataOffset + blobOffset:dataOffset + blobOffset + length]).digest()[:20]
+        offset += cmdsize
+    raise ValueError("image not signed")
+
+
+# The resource rules codesign writes into an app's CodeResources.
+
+RESOURCE_RULES = {
+    "^.*": True,
+    "^Info\\.plist$": {"omit": True, "weight": 20.0},
+    "^PkgInfo$": {"omit": True, "weight": 20.0},
+    "^Resources/": {"weight": 20.0},
+    "^(.*/)?\\.DS_Store$": {"omit": True, "weight": 2000.0},
+    "^(Frameworks|SharedFrameworks|PlugIns|Plug-ins|XPCServices|Helpers|MacOS|Library/(Automator|Spotlight|LoginItems))/": {"nested": True, "weight": 10.0},
+    "^[^/]+$": {"nested": True, "weight": 10.0},
+}
+
+
+def makeBundle(appPath: str, appIdentifier: str, toolCount: int, toolSize: int, appSize: int, resources: Optional[Dict[str, bytes]] = None) -> List[str]:
+    """
+    Creates a synthetic app with toolCount helper tools, and the given files in
+    "Contents/Resources", all sealed by its CodeResources, and returns the tool names.
+    """
+    contentsPath = os.path.join(appPath, "Contents")
+    toolDirPath = os.path.join(contentsPath, "Library", "LaunchServices")
+    os.makedirs(os.path.join(contentsPath, "MacOS"))
+    os.makedirs(os.path.join(contentsPath, "_CodeSignature"))
+    os.makedirs(toolDirPath)
+
+    appRequirement = f'identifier "{appIdentifier}"'
+    toolNames = [f"{appIdentifier}.helper{index}" for index in range(toolCount)]
+    sealedFiles: Dict[str, object] = {}
+    for toolName in toolNames:
+        info = plistlib.dumps({"CFBundleIdentifier": toolName, "CFBundleInfoDictionaryVersion": "6.0", "SMAuthorizedClients": [appRequirement]})
+        launchd = plistlib.dumps({"Label": toolName})
+        image = machOImage(toolName, [("__info_plist", info), ("__launchd_plist", launchd)], toolSize)
+        with open(os.path.join(toolDirPath, toolName), "wb") as fp:
+            fp.write(image)
+        sealedFiles[f"Library/LaunchServices/{toolName}"] = {"cdhash": cdHash(image), "requirement": f'identifier "{toolName}"'}
+    for resourceName, data in (resources or {}).items():
+        resourcePath = os.path.join(contentsPath, "Resources", resourceName)
+        os.makedirs(os.path.dirname(resourcePath), exist_ok=True)
+        with open(resourcePath, "wb") as fp:
+            fp.write(data)
+        sealedFiles[f"Resources/{resourceName}"] = {"hash": hashlib.sha1(data).digest(), "hash2": hashlib.sha256(data).digest()}
+
+    infoData = plistlib.dumps({
+        "CFBundleExecutable": "App",
+        "CFBundleIdentifier": appIdentifier,
+        "SMPrivilegedExecutables": {toolName: f'identifier "{toolName}"' for toolName in toolNames},
+    })
+    resourcesData = plistlib.dumps({"files": {}, "files2": sealedFiles, "rules": {}, "rules2": RESOURCE_RULES})
+    with open(os.path.join(contentsPath, "Info.plist"), "wb") as fp:
+        fp.write(infoData)
+    with open(os.path.join(contentsPath, "_CodeSignature", "CodeResources"), "wb") as fp:
+        fp.write(resourcesData)
+    with open(os.path.join(contentsPath, "MacOS", "App"), "wb") as fp:
+        fp.write(machOImage(appIdentifier, [], appSize, (infoData, resourcesData)))
+    return toolNames
+
+
+# The stand-in answers the questions NewSMJobBlessUtil asks of codesign, after sleeping
+# for BENCH_TOOL_LATENCY seconds to model the cost of the real one.
+
+CODESIGN_STAND_IN = '''
+import os, plistlib, sys, time
+time.sleep(float(os.environ.get("BENCH_TOOL_LATENCY", "0")))
+path = sys.argv[-1]
+if "-d" in sys.argv:
+    if os.path.isdir(path):
+        with open(os.path.join(path, "Contents", "Info.plist"), "rb") as fp:
+            identifier = plistlib.load(fp)["CFBundleIdentifier"]
+    else:
+        identifier = os.path.basename(path)
+    print(f'designated => identifier "{identifier}"')
+sys.exit(0 if os.path.exists(path) else 1)
+'''
+
+
+def installStandIns(binPath: str) -> None:
+    """Writes the codesign stand-in into binPath."""
+    os.makedirs(binPath, exist_ok=True)
+    toolPath = os.path.join(binPath, "codesign")
+    with open(toolPath, "w") as fp:
+        fp.write(f"#! {sys.executable}\n{CODESIGN_STAND_IN}")
+    os.chmod(toolPath, 0o755)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Returns the given percentile (0.0 to 1.0) of the values, interpolating between the nearest two."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class ScenarioResult(NamedTuple):
+    """The timings of one scenario at one tool count, in milliseconds per bundle."""
+    scenario: str
+    toolCount: int
+    bundleCount: int
+    samples: List[float]
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "scenario": self.scenario,
+            "tools": self.toolCount,
+            "bundles": self.bundleCount,
+            "runs": len(self.samples),
+            "p50_ms": round(percentile(self.samples, 0.50), 3),
+            "p90_ms": round(percentile(self.samples, 0.90), 3),
+            "p99_ms": round(percentile(self.samples, 0.99), 3),
+            "mean_ms": round(sum(self.samples) / len(self.samples), 3),
+            "bundles_per_s": round(1000 * len(self.samples) / sum(self.samples), 3) if sum(self.samples) > 0 else None,
+        }
+
+
+def runUtil(args: List[str], env: Dict[str, str]) -> float:
+    """Runs NewSMJobBlessUtil.py and returns its wall time in milliseconds; it must succeed."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, UTIL_PATH] + args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args[:3])}... failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return elapsed
+
+
+def benchmark(workPath: str, toolCounts: List[int], bundleCount: int, repeats: int, scenarios: List[str], toolSize: int, latency: float, out) -> List[ScenarioResult]:
+    """Generates the bundles for each tool count and times each scenario against each bundle repeats times."""
+    binPath = os.path.join(workPath, "bin")
+    installStandIns(binPath)
+    env = dict(os.environ)
+    env["PATH"] = binPath + os.pathsep + env.get("PATH", "")
+    env["BENCH_TOOL_LATENCY"] = str(latency)
+    env["XDG_CACHE_HOME"] = os.path.join(workPath, "cache")
+
+    results = []
+    for toolCount in toolCounts:
+        start = time.perf_counter()
+        bundles: List[Tuple[str, List[str]]] = []
+        for bundleIndex in range(bundleCount):
+            appPath = os.path.join(workPath, f"N{toolCount}", f"Bench{bundleIndex}.app")
+            bundles.append((appPath, makeBundle(appPath, f"com.example.bench{bundleIndex}", toolCount, toolSize, toolSize)))
+        print(f"generated {bundleCount} bundles with {toolCount} tools in {time.perf_counter() - start:.1f} s", file=out)
+
+        for scenario in scenarios:
+            samples = []
+            for _ in range(repeats):
+                for appPath, toolNames in bundles:
+                    if scenario == "check":
+                        samples.append(runUtil(["--no-cache", "check", appPath], env))
+                    elif scenario == "check-strict":
+                        samples.append(runUtil(["--no-cache", "--strict", "check", appPath], env))
+                    elif scenario == "setreq":
+
+                        # setreq edits the Info.plist sources, so each run gets fresh copies
+                        # of them, with the SMJobBless keys missing so that they're all written.
+
+                        sourcePath = os.path.join(os.path.dirname(appPath), "sources")
+                        shutil.rmtree(sourcePath, ignore_errors=True)
+                        os.makedirs(sourcePath)
+                        appInfoPath = os.path.join(sourcePath, "App-Info.plist")
+                        with open(appInfoPath, "wb") as fp:
+                            plistlib.dump({"CFBundleIdentifier": os.path.basename(appPath)}, fp)
+                        toolInfoPaths = []
+                        for toolName in toolNames:
+                            toolInfoPath = os.path.join(sourcePath, f"{toolName}-Info.plist")
+                            with open(toolInfoPath, "wb") as fp:
+                                plistlib.dump({"CFBundleIdentifier": toolName}, fp)
+                            toolInfoPaths.append(toolInfoPath)
+                        samples.append(runUtil(["--no-cache", "setreq", appPath, appInfoPath] + toolInfoPaths, env))
+                    else:
+                        raise UsageException()
+            result = ScenarioResult(scenario, toolCount, bundleCount, samples)
+            results.append(result)
+            summary = result.summary()
+            print(f"{scenario:<14} N={toolCount:<5} p50 {summary['p50_ms']:>9.1f} ms  p90 {summary['p90_ms']:>9.1f} ms  p99 {summary['p99_ms']:>9.1f} ms  {summary['bundles_per_s']:>8.2f} bundles/s", file=out)
+    return results
+
+
+def compareWithBaseline(summaries: List[Dict[str, object]], baseline: Dict[str, object], threshold: float, out) -> int:
+    """Prints how each result compares with the baseline's and returns the number that regressed by more than threshold."""
+    baselineSummaries = {(entry["scenario"], entry["tools"]): entry for entry in baseline.get("results", [])}
+    regressions = 0
+    for summary in summaries:
+        previous = baselineSummaries.get((summary["scenario"], summary["tools"]))
+        if previous is None:
+            print(f"{summary['scenario']:<14} N={summary['tools']:<5} no baseline", file=out)
+            continue
+        ratio = summary["p50_ms"] / previous["p50_ms"] if previous["p50_ms"] else 1.0
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions += 1
+        print(f"{summary['scenario']:<14} N={summary['tools']:<5} p50 {previous['p50_ms']:.1f} -> {summary['p50_ms']:.1f} ms ({(ratio - 1) * 100:+.1f}%){'  REGRESSION' if regressed else ''}", file=out)
+    return regressions
+
+
+def printUsage() -> None:
+    print(f"usage: {os.path.basename(sys.argv[0])} [options]", file=sys.stderr)
+    print("options: -n tool,counts (default 1,10,100,500) -b bundles (default 3) -r repeats (default 3)", file=sys.stderr)
+    print("         --scenarios check,check-strict,setreq --latency seconds --tool-size bytes", file=sys.stderr)
+    print("         --save /path/to/results.json --baseline /path/to/baseline.json --threshold fraction", file=sys.stderr)
+    print("         --keep /path/to/work/dir", file=sys.stderr)
+
+
+def main() -> None:
+    try:
+        options, args = getopt.getopt(sys.argv[1:], "n:b:r:", ["scenarios=", "latency=", "tool-size=", "save=", "baseline=", "threshold=", "keep="])
+    except getopt.GetoptError:
+        raise UsageException()
+    if len(args) != 0:
+        raise UsageException()
+
+    toolCounts = [1, 10, 100, 500]
+    bundleCount = 3
+    repeats = 3
+    scenarios = ["check", "check-strict", "setreq"]
+    latency = 0.005
+    toolSize = 64 * 1024
+    savePath = None
+    baselinePath = None
+    threshold = 0.10
+    keepPath = None
+    try:
+        for opt, val in options:
+            if opt == "-n":
+                toolCounts = [int(count) for count in val.split(",")]
+            elif opt == "-b":
+                bundleCount = int(val)
+            elif opt == "-r":
+                repeats = int(val)
+            elif opt == "--scenarios":
+                scenarios = val.split(",")
+            elif opt == "--latency":
+                latency = float(val)
+            elif opt == "--tool-size":
+                toolSize = int(val)
+            elif opt == "--save":
+                savePath = val
+            elif opt == "--baseline":
+                baselinePath = val
+            elif opt == "--threshold":
+                threshold = float(val)
+            elif opt == "--keep":
+                keepPath = val
+    except ValueError:
+        raise UsageException()
+    if min(toolCounts) < 1 or bundleCount < 1 or repeats < 1 or latency < 0:
+        raise UsageException()
+    if any(scenario not in ("check", "check-strict", "setreq") for scenario in scenarios):
+        raise UsageException()
+
+    # Read the baseline first, so that a bad path is reported before the run, not after.
+
+    baseline = None
+    if baselinePath is not None:
+        with open(baselinePath) as fp:
+            baseline = json.load(fp)
+
+    # A kept run goes in a new directory inside the one named, so that nothing already 
+    # there is touched.
+
+    if keepPath is not None:
+        os.makedirs(keepPath, exist_ok=True)
+        workPath = tempfile.mkdtemp(prefix="SMJobBlessBench.", dir=keepPath)
+        print(f"keeping bundles in {workPath}")
+    else:
+        workPath = tempfile.mkdtemp(prefix="SMJobBlessBench.")
+    try:
+        results = benchmark(workPath, toolCounts, bundleCount, repeats, scenarios, toolSize, latency, sys.stdout)
+    finally:
+        if keepPath is None:
+            shutil.rmtree(workPath, ignore_errors=True)
+
+    summaries = [result.summary() for result in results]
+    report = {
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "settings": {"bundles": bundleCount, "repeats": repeats, "latency_s": latency, "tool_size": toolSize},
+        "results": summaries,
+    }
+    if savePath is not None:
+        with open(savePath, "w") as fp:
+            json.dump(report, fp, indent=2)
+    if baseline is not None and compareWithBaseline(summaries, baseline, threshold, sys.stdout) != 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except UsageException as e:
+        printUsage()
+        sys.exit(1)
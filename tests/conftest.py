@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The scripts live in "src" and aren't installed, so make them importable as modules.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
@@ -0,0 +1,264 @@
+#
+#   Tests for the in-process Mach-O and code signature parsing in NewSMJobBlessUtil.py,
+#   run against synthetic images and bundles made by SMJobBlessBench.
+#
+
+import hashlib
+import os
+import plistlib
+import struct
+import threading
+import time
+import zipfile
+
+import pytest
+
+import NewSMJobBlessUtil as util
+import SMJobBlessBench as bench
+
+CPU_TYPE_X86_64 = 0x01000007
+
+
+def makeTool(identifier: str = "com.example.tool", size: int = 3 * bench.PAGE_SIZE) -> bytes:
+    info = plistlib.dumps({"CFBundleIdentifier": identifier, "SMAuthorizedClients": ['identifier "com.example.app"']})
+    launchd = plistlib.dumps({"Label": identifier})
+    return bench.machOImage(identifier, [("__info_plist", info), ("__launchd_plist", launchd)], size)
+
+
+def withCPUType(image: bytes, cpuType: int) -> bytes:
+    return image[:4] + struct.pack("<i", cpuType) + image[8:]
+
+
+def fatImage(images: list) -> bytes:
+    """Returns a universal image holding the thin images, each page aligned."""
+    header = struct.pack(">II", util.FAT_MAGIC, len(images))
+    offset = bench.align(8 + 20 * len(images), bench.PAGE_SIZE)
+    body = b""
+    for image in images:
+        cpuType, cpuSubtype = struct.unpack_from("<ii", image, 4)
+        header += struct.pack(">iiIII", cpuType, cpuSubtype, offset + len(body), len(image), 12)
+        body += image + b"\0" * (bench.align(len(image), bench.PAGE_SIZE) - len(image))
+    return header + b"\0" * (offset - len(header)) + body
+
+
+def writeFile(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def flipByte(data: bytes, offset: int) -> bytes:
+    return data[:offset] + bytes([data[offset] ^ 0xff]) + data[offset + 1:]
+
+
+# Section reads.
+
+def test_sectionRead(tmp_path):
+    toolPath = writeFile(tmp_path, "tool", makeTool())
+    with util.MachOFile(toolPath) as machO:
+        assert len(machO.slices) == 1
+        slice = machO.slices[0]
+        assert slice.archName == "arm64"
+        assert plistlib.loads(bytes(slice.section("__TEXT", "__info_plist")))["CFBundleIdentifier"] == "com.example.tool"
+        assert plistlib.loads(bytes(slice.section("__TEXT", "__launchd_plist"))) == {"Label": "com.example.tool"}
+        assert slice.section("__TEXT", "__nothing") is None
+
+
+def test_sectionPastEndOfFile(tmp_path):
+    image = makeTool()
+    fileOffset = struct.unpack_from("<I", image, 32 + 72 + 48)[0]  # offset of the first section
+    toolPath = writeFile(tmp_path, "tool", image[:fileOffset + 4])
+    with util.MachOFile(toolPath) as machO:
+        with pytest.raises(util.CheckException, match="__info_plist section extends past end of file"):
+            machO.slices[0].section("__TEXT", "__info_plist")
+
+
+def test_readPlistsFromToolSections(tmp_path):
+    toolPath = writeFile(tmp_path, "tool", makeTool())
+    plists = util.readPlistsFromToolSections(toolPath, "__TEXT", ["__info_plist", "__launchd_plist"])
+    assert plists["__launchd_plist"] == {"Label": "com.example.tool"}
+
+
+# Fat slices.
+
+def test_fatSlices(tmp_path):
+    toolPath = writeFile(tmp_path, "tool", fatImage([makeTool("com.example.a"), makeTool("com.example.b")]))
+    with util.MachOFile(toolPath) as machO:
+        identifiers = [plistlib.loads(bytes(slice.section("__TEXT", "__info_plist")))["CFBundleIdentifier"] for slice in machO.slices]
+    assert identifiers == ["com.example.a", "com.example.b"]
+    util.verifyCodeSignature(toolPath, "tool")
+
+
+def test_fatSliceModified(tmp_path):
+    toolPath = writeFile(tmp_path, "tool", fatImage([makeTool(), flipByte(makeTool(), bench.PAGE_SIZE + 1)]))
+    with pytest.raises(util.CheckException, match="page at offset 0x1000 modified"):
+        util.verifyCodeSignature(toolPath, "tool")
+
+
+def test_fatSliceDifferences(tmp_path):
+    toolPath = writeFile(tmp_path, "tool", fatImage([makeTool("com.example.a"), makeTool("com.example.b")]))
+    with util.MachOFile(toolPath) as machO:
+        inspections = util.inspectSlices(machO, "__TEXT", util.TOOL_SECTION_NAMES)
+    assert len(util.sliceDifferences(inspections)) != 0
+
+
+def test_fatHeaderPastEndOfFile(tmp_path):
+    toolPath = writeFile(tmp_path, "tool", struct.pack(">II", util.FAT_MAGIC, 100))
+    with pytest.raises(util.CheckException, match="fat header extends past end of file"):
+        util.MachOFile(toolPath)
+
+
+@pytest.mark.parametrize("machine, archName", [("arm64", "arm64"), ("aarch64", "arm64"), ("x86_64", "x86_64"), ("AMD64", "x86_64")])
+def test_hostSlice(tmp_path, monkeypatch, machine, archName):
+    toolPath = writeFile(tmp_path, "tool", fatImage([withCPUType(makeTool(), CPU_TYPE_X86_64), makeTool()]))
+    monkeypatch.setattr(util.platform, "machine", lambda: machine)
+    with util.MachOFile(toolPath) as machO:
+        assert util.hostSlice(machO.slices).archName == archName
+
+
+# Page and special slot mismatches.
+
+def test_signatureValid(tmp_path):
+    toolPath = writeFile(tmp_path, "tool", makeTool())
+    util.verifyCodeSignature(toolPath, "tool")
+
+
+def test_pageModified(tmp_path):
+    toolPath = writeFile(tmp_path, "tool", flipByte(makeTool(), 2 * bench.PAGE_SIZE + 1))
+    with pytest.raises(util.CheckException, match="page at offset 0x2000 modified"):
+        util.verifyCodeSignature(toolPath, "tool")
+
+
+def test_infoPlistSectionModified(tmp_path):
+    image = makeTool()
+    toolPath = writeFile(tmp_path, "tool", image.replace(b"com.example.app", b"com.example.APP", 1))
+    with pytest.raises(util.CheckException, match="__info_plist section modified"):
+        util.verifyCodeSignature(toolPath, "tool")
+
+
+def test_requirementsModified(tmp_path):
+    image = makeTool()
+    requirementsOffset = image.rindex(bench.identifierRequirement("com.example.tool"))
+    toolPath = writeFile(tmp_path, "tool", flipByte(image, requirementsOffset + 40))
+    with pytest.raises(util.CheckException, match="requirements modified"):
+        util.verifyCodeSignature(toolPath, "tool")
+
+
+def test_bundleInfoPlistModified(tmp_path):
+    appPath = str(tmp_path / "Test.app")
+    bench.makeBundle(appPath, "com.example.app", 1, 8192, 8192)
+    infoPath = tmp_path / "Test.app" / "Contents" / "Info.plist"
+    infoPath.write_bytes(infoPath.read_bytes().replace(b"com.example.app", b"com.example.APP", 1))
+    with pytest.raises(util.CheckException, match="Info.plist modified"):
+        util.verifyCodeSignature(appPath, "app")
+
+
+def test_bundleResourceModified(tmp_path):
+    appPath = str(tmp_path / "Test.app")
+    bench.makeBundle(appPath, "com.example.app", 1, 8192, 8192, {"a.txt": b"hello"})
+    util.check(appPath)
+    (tmp_path / "Test.app" / "Contents" / "Resources" / "a.txt").write_bytes(b"HELLO")
+    with pytest.raises(util.CheckException, match="resource 'Resources/a.txt' modified"):
+        util.check(appPath)
+
+
+def zipBundle(tmp_path, appName: str) -> str:
+    zipPath = str(tmp_path / f"{appName}.zip")
+    with zipfile.ZipFile(zipPath, "w", zipfile.ZIP_DEFLATED) as archive:
+        for directoryPath, _, fileNames in os.walk(tmp_path / appName):
+            for fileName in fileNames:
+                filePath = os.path.join(directoryPath, fileName)
+                archive.write(filePath, os.path.relpath(filePath, tmp_path))
+    return zipPath
+
+
+def test_archivedResourceStreamed(tmp_path):
+    bench.makeBundle(str(tmp_path / "Test.app"), "com.example.app", 1, 8192, 8192, {"big.bin": b"x" * 100000})
+    zipPath = zipBundle(tmp_path, "Test.app")
+    util.check(zipPath)
+    with util.openedBundle(zipPath) as bundlePath:
+        archive = util.archiveMember(bundlePath)[0]
+        archive.maxMemberSize = 1000
+        resourcePath = os.path.join(bundlePath, "Contents", "Resources", "big.bin")
+        assert util.hashResource(resourcePath, "sha256") == (hashlib.sha256(b"x" * 100000).digest(), 100000)
+        assert len(archive._cache) == 0
+
+
+def test_archivedResourceModified(tmp_path):
+    bench.makeBundle(str(tmp_path / "Test.app"), "com.example.app", 1, 8192, 8192, {"a.txt": b"hello"})
+    (tmp_path / "Test.app" / "Contents" / "Resources" / "a.txt").write_bytes(b"HELLO")
+    with pytest.raises(util.CheckException, match="resource 'Resources/a.txt' modified"):
+        util.check(zipBundle(tmp_path, "Test.app"))
+
+
+# Malformed images and blobs.
+
+@pytest.mark.parametrize("data, message", [
+    (b"\xcf\xfa\xed", "truncated header"),
+    (b"\0" * 64, "bad magic"),
+    (struct.pack("<IiiIIIII", util.MH_MAGIC_64, bench.CPU_TYPE_ARM64, 0, 2, 1, 0x1000, 0, 0), "load commands extend past end of file"),
+    (struct.pack("<IiiIIIIIII", util.MH_MAGIC_64, bench.CPU_TYPE_ARM64, 0, 2, 1, 8, 0, 0, 0x19, 4), "bad load command size"),
+])
+def test_malformedImage(tmp_path, data, message):
+    toolPath = writeFile(tmp_path, "tool", data)
+    with pytest.raises(util.CheckException, match=message):
+        util.MachOFile(toolPath)
+
+
+def test_malformedSignature(tmp_path):
+    image = makeTool()
+    signatureOffset = image.rindex(struct.pack(">I", 0xfade0cc0))
+    toolPath = writeFile(tmp_path, "tool", image[:signatureOffset + 8] + struct.pack(">I", 1000) + image[signatureOffset + 12:])
+    with pytest.raises(util.CheckException, match="code signature malformed: bad SuperBlob"):
+        util.verifyCodeSignature(toolPath, "tool")
+
+
+def test_shortRequirementsBlob(tmp_path, monkeypatch):
+
+    # This used to hang: each helper's designated requirement raised struct.error, which
+    # left the fact's future incomplete for the other threads waiting on it.
+
+    monkeypatch.setattr(bench, "identifierRequirement", lambda identifier: struct.pack(">II", 0xfade0c01, 8))
+    appPath = str(tmp_path / "Bad.app")
+    bench.makeBundle(appPath, "com.example.bad", 3, 8192, 8192)
+    raised = []
+    thread = threading.Thread(target=lambda: raised.append(pytest.raises(util.CheckException, util.check, appPath)), daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive()
+    failures = raised[0].value.failures
+    assert len(failures) == 4
+    assert all("code signature malformed: bad requirements" in str(failure) for failure in failures)
+
+
+# Concurrency.
+
+@pytest.mark.parametrize("jobs, appCount, workers", [(8, 2, 4), (8, 16, 1), (3, 1, 3), (1, 4, 1)])
+def test_checkManySharesJobs(monkeypatch, jobs, appCount, workers):
+    calls = []
+    monkeypatch.setattr(util, "check", lambda appPath, incremental, checkWorkers: calls.append(checkWorkers))
+    util.checkMany([f"/nonexistent/{index}.app" for index in range(appCount)], jobs)
+    assert calls == [workers] * appCount
+
+
+def test_nestedCodeBoundedByWorkers(tmp_path, monkeypatch):
+    bench.makeBundle(str(tmp_path / "Test.app"), "com.example.app", 6, 8192, 8192)
+    running = []
+    peak = []
+    lock = threading.Lock()
+    checkCodeSignature = util.CodeSignBackend.checkCodeSignature
+
+    def counted(self, programPath, programType):
+        with lock:
+            running.append(programPath)
+            peak.append(len(running))
+        try:
+            time.sleep(0.01)
+            checkCodeSignature(self, programPath, programType)
+        finally:
+            with lock:
+                running.remove(programPath)
+
+    monkeypatch.setattr(util.CodeSignBackend, "checkCodeSignature", counted)
+    util.check(str(tmp_path / "Test.app"), False, 2)
+    assert max(peak) <= 2
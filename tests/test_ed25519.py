@@ -0,0 +1,87 @@
+#
+#   Tests for Ed25519Verifier, the check of Sparkle's sparkle:edSignature, against the
+#   test vectors in RFC 8032, section 7.1.
+#
+
+import hashlib
+
+import pytest
+
+import NewSMJobBlessUtil as util
+
+RFC8032_VECTORS = [
+    (
+        "d75a980182b10ab7d54bfed3c964073a0ee172f3daa62325af021a68f707511a",
+        "",
+        "e5564300c360ac729086e2cc806e828a84877f1eb8e5d974d873e065224901555fb8821590a33bacc61e39701cf9b46bd25bf5f0595bbe24655141438e7a100b",
+    ),
+    (
+        "3d4017c3e843895a92b70aa74d1b7ebc9c982ccf2ec4968cc0cd55f12af4660c",
+        "72",
+        "92a009a9f0d4cab8720e820b5f642540a2b27b5416503f8fb3762223ebdb69da085ac1e43e15996e458f3613d0f11d8c387b2eaeb4302aeeb00d291612bb0c00",
+    ),
+    (
+        "fc51cd8e6218a1a38da47ed00230f0580816ed13ba3303ac5deb911548908025",
+        "af82",
+        "6291d657deec24024827e69c3abe01a30ce548a284743a445e3680d7db5ac3ac18ff9b538d16f290ae67f760984dc6594a7c15e9716ed28dc027beceea1ec40a",
+    ),
+    (
+        "ec172b93ad5e563bf4932c70e1245034c35467ef2efd4d64ebf819683467e2bf",
+        hashlib.sha512(b"abc").hexdigest(),
+        "dc2a4459e7369633a52b1bf277839a00201009a3efbf3ecb69bea2186c26b58909351fc9ac90b3ecfdfbc7c66431e0303dca179c138ac17ad9bef1177331a704",
+    ),
+]
+
+
+def verify(publicKey: bytes, message: bytes, signature: bytes, pieceSize: int = 0) -> bool:
+    verifier = util.Ed25519Verifier(publicKey, signature)
+    if pieceSize == 0:
+        verifier.update(message)
+    else:
+        for offset in range(0, len(message), pieceSize):
+            verifier.update(message[offset:offset + pieceSize])
+    return verifier.verify()
+
+
+@pytest.mark.parametrize("publicKey, message, signature", RFC8032_VECTORS)
+def test_valid(publicKey, message, signature):
+    assert verify(bytes.fromhex(publicKey), bytes.fromhex(message), bytes.fromhex(signature))
+
+
+@pytest.mark.parametrize("publicKey, message, signature", RFC8032_VECTORS)
+def test_validInPieces(publicKey, message, signature):
+    assert verify(bytes.fromhex(publicKey), bytes.fromhex(message), bytes.fromhex(signature), 1)
+
+
+@pytest.mark.parametrize("publicKey, message, signature", RFC8032_VECTORS)
+def test_modifiedMessage(publicKey, message, signature):
+    assert not verify(bytes.fromhex(publicKey), bytes.fromhex(message) + b"\0", bytes.fromhex(signature))
+
+
+@pytest.mark.parametrize("offset", [0, 31, 32, 63])
+def test_modifiedSignature(offset):
+    publicKey, message, signature = (bytes.fromhex(value) for value in RFC8032_VECTORS[2])
+    signature = signature[:offset] + bytes([signature[offset] ^ 1]) + signature[offset + 1:]
+    assert not verify(publicKey, message, signature)
+
+
+def test_wrongKey():
+    publicKey = bytes.fromhex(RFC8032_VECTORS[0][0])
+    _, message, signature = (bytes.fromhex(value) for value in RFC8032_VECTORS[1])
+    assert not verify(publicKey, message, signature)
+
+
+def test_malleatedScalarRejected():
+
+    # s + L satisfies the verification equation just as s does, but RFC 8032 requires
+    # s < L so that a signature can't be altered into another valid one.
+
+    publicKey, message, signature = (bytes.fromhex(value) for value in RFC8032_VECTORS[0])
+    s = int.from_bytes(signature[32:], "little") + util.ED25519_L
+    assert not verify(publicKey, message, signature[:32] + s.to_bytes(32, "little"))
+
+
+@pytest.mark.parametrize("length", [0, 63, 65])
+def test_wrongSignatureLength(length):
+    publicKey, message, signature = (bytes.fromhex(value) for value in RFC8032_VECTORS[0])
+    assert not verify(publicKey, message, (signature * 2)[:length])
@@ -0,0 +1,115 @@
+#
+#   Tests for "check --incremental": the resource index, when it's out of date, and the
+#   reuse of its facts by a long-running process.
+#
+
+import json
+import os
+import plistlib
+
+import pytest
+
+import NewSMJobBlessUtil as util
+import SMJobBlessBench as bench
+
+
+@pytest.fixture
+def appPath(tmp_path):
+    path = str(tmp_path / "Test.app")
+    bench.makeBundle(path, "com.example.app", 2, 8192, 8192, {"a.txt": b"hello", "b.txt": b"world"})
+    return path
+
+
+def rewriteCodeResources(appPath: str, change) -> None:
+    codeResourcesPath = os.path.join(appPath, "Contents", "_CodeSignature", "CodeResources")
+    with open(codeResourcesPath, "rb") as fp:
+        manifest = plistlib.load(fp)
+    change(manifest)
+    with open(codeResourcesPath, "wb") as fp:
+        plistlib.dump(manifest, fp)
+
+
+def test_indexCurrent(appPath):
+    index, outOfDate = util.verifyResources(appPath, "app", None)
+    assert outOfDate
+    assert sorted(index["files"]) == ["Resources/a.txt", "Resources/b.txt"]
+    assert util.verifyResources(appPath, "app", index) == (index, False)
+
+
+def test_indexStaleAfterResigning(appPath):
+    index, _ = util.verifyResources(appPath, "app", None)
+    rewriteCodeResources(appPath, lambda manifest: manifest.update({"files": {"x": b"\0" * 20}}))
+    assert util.verifyResources(appPath, "app", index)[1]
+
+
+def test_indexStaleAfterRuleChange(appPath, monkeypatch):
+    index, _ = util.verifyResources(appPath, "app", None)
+    rewriteCodeResources(appPath, lambda manifest: manifest["rules2"].update({"^Extra/": {"weight": 5.0}}))
+    hashed = []
+    hashResource = util.hashResource
+    monkeypatch.setattr(util, "hashResource", lambda path, hashName: hashed.append(path) or hashResource(path, hashName))
+    assert util.verifyResources(appPath, "app", index)[1]
+    assert len(hashed) == 2
+
+
+def test_indexStaleAfterVersionChange(appPath):
+    index, _ = util.verifyResources(appPath, "app", None)
+    index["version"] = util.RESOURCE_INDEX_VERSION - 1
+    assert util.verifyResources(appPath, "app", index)[1]
+
+
+def test_indexRehashesOnlyChangedFiles(appPath, monkeypatch):
+    index, _ = util.verifyResources(appPath, "app", None)
+    hashed = []
+    hashResource = util.hashResource
+    monkeypatch.setattr(util, "hashResource", lambda path, hashName: hashed.append(os.path.basename(path)) or hashResource(path, hashName))
+    resourcePath = os.path.join(appPath, "Contents", "Resources", "a.txt")
+    with open(resourcePath, "wb") as fp:
+        fp.write(b"HELLO")
+    with pytest.raises(util.CheckException, match="resource 'Resources/a.txt' modified"):
+        util.verifyResources(appPath, "app", index)
+    assert hashed == ["a.txt"]
+
+
+def backendCalls(monkeypatch, strict: bool):
+    calls = []
+    monkeypatch.setattr(util, "strictVerification", strict)
+    monkeypatch.setattr(util, "verifyCodeSignatureWithCodesign", lambda programPath, programType: calls.append(("codesign", os.path.basename(programPath))))
+    verifyCodeSignature = util.verifyCodeSignature
+    monkeypatch.setattr(util, "verifyCodeSignature", lambda programPath, programType: calls.append(("in-process", os.path.basename(programPath))) or verifyCodeSignature(programPath, programType))
+    return calls
+
+
+def test_strictFallsBackToCodesignWhileIndexOutOfDate(appPath, monkeypatch):
+    calls = backendCalls(monkeypatch, True)
+    backend = util.IncrementalCodeSignBackend(appPath)
+    backend.checkCodeSignature(appPath, "app")
+    backend.checkCodeSignature(appPath, "app")
+    rewriteCodeResources(appPath, lambda manifest: manifest.update({"files": {"x": b"\0" * 20}}))
+    backend.checkCodeSignature(appPath, "app")
+    assert calls == [("codesign", "Test.app"), ("in-process", "Test.app"), ("codesign", "Test.app")]
+
+
+def test_unreadableIndexIsRebuilt(appPath, monkeypatch):
+    calls = backendCalls(monkeypatch, True)
+    backend = util.IncrementalCodeSignBackend(appPath)
+    indexPath = util.resourceIndexPath(appPath, appPath)
+    os.makedirs(os.path.dirname(indexPath))
+    with open(indexPath, "w") as fp:
+        fp.write("not json")
+    backend.checkCodeSignature(appPath, "app")
+    assert calls == [("codesign", "Test.app")]
+    with open(indexPath) as fp:
+        assert json.load(fp)["version"] == util.RESOURCE_INDEX_VERSION
+
+
+def test_factsSharedAcrossChecks(appPath, monkeypatch):
+    monkeypatch.setattr(util, "inspectionCache", util.InspectionCache())
+    verified = []
+    verifyResources = util.verifyResources
+    monkeypatch.setattr(util, "verifyResources", lambda bundlePath, programType, index: verified.append(bundlePath) or verifyResources(bundlePath, programType, index))
+    util.check(appPath, True)
+    util.check(appPath, True)
+    assert verified == [appPath]
+    assert util.IncrementalCodeSignBackend(appPath) == util.IncrementalCodeSignBackend(appPath)
+    assert util.IncrementalCodeSignBackend(appPath) != util.IncrementalCodeSignBackend(appPath + "x")
@@ -0,0 +1,128 @@
+#
+#   Tests for the facts a long-running process keeps across inspections in an
+#   InspectionCache, and what makes each of them stale.
+#
+
+import concurrent.futures
+import os
+
+import pytest
+
+import NewSMJobBlessUtil as util
+import SMJobBlessBench as bench
+
+
+@pytest.fixture
+def appPath(tmp_path):
+    path = str(tmp_path / "Test.app")
+    bench.makeBundle(path, "com.example.app", 2, 8192, 8192, {"a.txt": b"hello"})
+    return path
+
+
+@pytest.fixture
+def counts(monkeypatch):
+    """Counts the calls to the functions that gather the cached facts."""
+    counts = {"verify": 0, "requirement": 0, "signingFacts": 0, "findNestedCode": 0}
+
+    def counted(name: str, function):
+        def call(*args):
+            counts[name] += 1
+            return function(*args)
+        return call
+
+    monkeypatch.setattr(util.CodeSignBackend, "checkCodeSignature", counted("verify", util.CodeSignBackend.checkCodeSignature))
+    monkeypatch.setattr(util.CodeSignBackend, "designatedRequirement", counted("requirement", util.CodeSignBackend.designatedRequirement))
+    monkeypatch.setattr(util, "readSigningFacts", counted("signingFacts", util.readSigningFacts))
+    monkeypatch.setattr(util, "findNestedCode", counted("findNestedCode", util.findNestedCode))
+    return counts
+
+
+def inspectApp(appPath: str, cache: util.InspectionCache) -> util.BundleInspection:
+    inspection = util.BundleInspection(appPath, cache=cache)
+    inspection.checkCodeSignature(appPath, "app")
+    inspection.designatedRequirement(appPath, "app")
+    inspection.signingFacts(appPath)
+    inspection.nestedCode()
+    return inspection
+
+
+def touch(path: str) -> None:
+    with open(path, "rb") as fp:
+        data = fp.read()
+    os.unlink(path)
+    with open(path, "wb") as fp:
+        fp.write(data)
+
+
+def test_factsReused(appPath, counts):
+    cache = util.InspectionCache()
+    inspectApp(appPath, cache)
+    first = dict(counts)
+    inspectApp(appPath, cache)
+    assert counts == first
+    assert first["findNestedCode"] == 1
+
+
+def test_factsNotSharedWithoutCache(appPath, counts):
+    inspectApp(appPath, None)
+    first = dict(counts)
+    inspectApp(appPath, None)
+    assert counts == {name: 2 * count for name, count in first.items()}
+
+
+def test_resourceChangeInvalidatesSignatureOnly(appPath, counts):
+    cache = util.InspectionCache()
+    inspectApp(appPath, cache)
+    first = dict(counts)
+    with open(os.path.join(appPath, "Contents", "Resources", "a.txt"), "wb") as fp:
+        fp.write(b"HELLO")
+    with pytest.raises(util.CheckException, match="resource 'Resources/a.txt' modified"):
+        inspectApp(appPath, cache)
+    assert counts["verify"] == first["verify"] + 1
+    assert counts["requirement"] == first["requirement"]
+    assert counts["signingFacts"] == first["signingFacts"]
+
+
+def test_executableChangeInvalidatesRequirement(appPath, counts):
+    cache = util.InspectionCache()
+    inspectApp(appPath, cache)
+    first = dict(counts)
+    touch(os.path.join(appPath, "Contents", "MacOS", "App"))
+    inspectApp(appPath, cache)
+    assert counts["requirement"] == first["requirement"] + 1
+    assert counts["signingFacts"] == first["signingFacts"] + 1
+
+
+def test_nestedCodeChangeInvalidatesNestedCode(appPath, counts):
+    cache = util.InspectionCache()
+    inspectApp(appPath, cache)
+    toolPath = os.path.join(appPath, "Contents", "Library", "LaunchServices", "com.example.app.helper0")
+    with open(toolPath, "r+b") as fp:
+        fp.seek(bench.PAGE_SIZE + 1)
+        fp.write(b"\0")
+    inspection = inspectApp(appPath, cache)
+    assert counts["findNestedCode"] == 2
+    problems = {os.path.basename(result.path): result.problem for result in inspection.nestedCode()}
+    assert "page at offset 0x1000 modified" in str(problems["com.example.app.helper0"])
+    assert problems["com.example.app.helper1"] is None
+
+
+def test_problemsReused(appPath, counts):
+    cache = util.InspectionCache()
+    os.unlink(os.path.join(appPath, "Contents", "Resources", "a.txt"))
+    for _ in range(2):
+        with pytest.raises(util.CheckException, match="resource 'Resources/a.txt' missing"):
+            util.BundleInspection(appPath, cache=cache).checkCodeSignature(appPath, "app")
+    assert counts["verify"] == 1
+
+
+def test_leastRecentlyUsedDropped():
+    cache = util.InspectionCache(maxEntries=2)
+    futures = [concurrent.futures.Future() for _ in range(3)]
+    cache.store(("a",), "1", futures[0])
+    cache.store(("b",), "1", futures[1])
+    assert cache.lookup(("a",), "1") is futures[0]
+    cache.store(("c",), "1", futures[2])
+    assert cache.lookup(("b",), "1") is None
+    assert cache.lookup(("a",), "1") is futures[0]
+    assert cache.lookup(("a",), "2") is None
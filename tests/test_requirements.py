@@ -0,0 +1,127 @@
+#
+#   Tests for the code requirement language: parsing, formatting, equivalence and
+#   evaluation against signing facts.
+#
+
+import pytest
+
+import NewSMJobBlessUtil as util
+
+
+class StandInCertificate:
+    """Just the parts of a Certificate that requirements are evaluated against."""
+
+    def __init__(self, sha1: bytes, subjectFields: dict, extensions: tuple = ()):
+        self.sha1 = sha1
+        self.subjectFields = {oid: [value] for oid, value in subjectFields.items()}
+        self.extensions = set(extensions)
+
+    def subjectField(self, oid: str):
+        values = self.subjectFields.get(oid)
+        return None if values is None else values[0]
+
+
+LEAF = StandInCertificate(b"\1" * 20, {util.OID_COMMON_NAME: "Developer ID Application: Example (ABCDE12345)", util.OID_ORGANIZATIONAL_UNIT: "ABCDE12345"}, (util.OID_APPLE_DEVELOPER_ID_LEAF,))
+APPLE_ROOT = StandInCertificate(util.APPLE_ANCHOR_HASH, {util.OID_ORGANIZATION: "Apple Inc."})
+
+FACTS = util.SigningFacts(
+    "com.example.tool",
+    [b"\2" * 20],
+    [LEAF, APPLE_ROOT],
+    {"CFBundleShortVersionString": "1.2"},
+    {"com.apple.security.app-sandbox": True},
+)
+
+
+@pytest.mark.parametrize("text", [
+    'identifier "com.example.tool"',
+    'identifier "com.example.tool" and anchor apple generic',
+    'identifier "com.example.tool" and anchor apple generic and certificate leaf[subject.OU] = ABCDE12345',
+    'identifier "com.example.tool" or identifier "com.example.other"',
+    '(identifier "com.example.tool" or identifier "com.example.other") and anchor apple',
+    '!(identifier "com.example.tool")',
+    'cdhash H"0202020202020202020202020202020202020202"',
+    'info[CFBundleShortVersionString] = "1.2"',
+    'certificate 1[field.1.2.840.113635.100.6.2.6] exists',
+])
+def test_roundTrip(text):
+    expr = util.compileRequirement(text)
+    assert util.compileRequirement(util.formatRequirement(expr)) == expr
+
+
+def test_andBindsTighterThanOr():
+    a, b, c = (util.compileRequirement(f'identifier "{name}"') for name in "abc")
+    assert util.compileRequirement('identifier "a" or identifier "b" and identifier "c"') == (util.opOr, a, (util.opAnd, b, c))
+    assert util.compileRequirement('identifier "a" and identifier "b" or identifier "c"') == (util.opOr, (util.opAnd, a, b), c)
+    assert util.compileRequirement('(identifier "a" or identifier "b") and identifier "c"') == (util.opAnd, (util.opOr, a, b), c)
+
+
+def test_negationBindsTightest():
+    a, b = (util.compileRequirement(f'identifier "{name}"') for name in "ab")
+    assert util.compileRequirement('! identifier "a" and identifier "b"') == (util.opAnd, (util.opNot, a), b)
+    assert util.compileRequirement('!(identifier "a" and identifier "b")') == (util.opNot, (util.opAnd, a, b))
+
+
+def test_designatedLabel():
+    assert util.compileRequirement('designated => identifier "a"') == util.compileRequirement('identifier "a"')
+
+
+@pytest.mark.parametrize("text", ['identifier "a" and', 'identifier "a" identifier "b"', '(identifier "a"', 'bogus', 'certificate leaf[field.x] exists'])
+def test_invalid(text):
+    with pytest.raises(ValueError):
+        util.compileRequirement(text)
+
+
+@pytest.mark.parametrize("text, otherText", [
+    ('identifier "a" and anchor apple', 'anchor apple and identifier "a"'),
+    ('identifier "a" and (anchor apple and identifier "b")', '(identifier "b" and identifier "a") and anchor apple'),
+    ('identifier a', 'identifier "a"'),
+    ('  identifier  "a"  /* a comment */ ', 'identifier "a"'),
+    ('certificate root = H"0101010101010101010101010101010101010101"', 'anchor = H"0101010101010101010101010101010101010101"'),
+])
+def test_equivalent(text, otherText):
+    assert util.requirementsEquivalent(text, otherText)
+
+
+@pytest.mark.parametrize("text, otherText", [
+    ('identifier "a" and anchor apple', 'identifier "a" or anchor apple'),
+    ('identifier "a" and (identifier "b" or anchor apple)', '(identifier "a" and identifier "b") or anchor apple'),
+    ('!identifier "a"', 'identifier "a"'),
+    ('identifier "a" and', 'identifier "a"'),
+])
+def test_notEquivalent(text, otherText):
+    assert not util.requirementsEquivalent(text, otherText)
+
+
+@pytest.mark.parametrize("text, result", [
+    ('identifier "com.example.tool"', True),
+    ('identifier "com.example.other"', False),
+    ('!identifier "com.example.other"', True),
+    ('cdhash H"0202020202020202020202020202020202020202"', True),
+    ('cdhash H"0303030303030303030303030303030303030303"', False),
+    ('anchor apple generic', True),
+    ('certificate leaf[subject.OU] = ABCDE12345', True),
+    ('certificate leaf[subject.OU] = ZZZZZ99999', False),
+    ('certificate leaf[subject.CN] = "Developer ID Application:"*', True),
+    ('certificate leaf[field.1.2.840.113635.100.6.1.13] exists', True),
+    ('certificate 1[field.1.2.840.113635.100.6.1.13] exists', False),
+    ('info[CFBundleShortVersionString] = "1.2"', True),
+    ('info[CFBundleShortVersionString] < "1.1"', False),
+    ('entitlement["com.apple.security.app-sandbox"] exists', True),
+    ('entitlement["com.apple.security.get-task-allow"] absent', True),
+    ('notarized', None),
+    ('notarized or identifier "com.example.tool"', True),
+    ('notarized and identifier "com.example.other"', False),
+    ('notarized and identifier "com.example.tool"', None),
+    ('!notarized', None),
+])
+def test_evaluate(text, result):
+    assert util.evaluateRequirement(util.compileRequirement(text), FACTS) is result
+
+
+def test_evaluateUnknownAppleRoot():
+    otherRoot = StandInCertificate(b"\4" * 20, {util.OID_ORGANIZATION: "Apple Inc."})
+    facts = FACTS._replace(chain=[LEAF, otherRoot])
+    assert util.evaluateRequirement(util.compileRequirement("anchor apple generic"), facts) is None
+    facts = FACTS._replace(chain=[])
+    assert util.evaluateRequirement(util.compileRequirement("anchor apple generic"), facts) is False
@@ -0,0 +1,141 @@
+#
+#   Tests for "setreq": the changes it makes to the Info.plist source files, the format
+#   it writes them in, and the stamp and Xcode file lists that let it skip work.
+#
+
+import io
+import os
+import plistlib
+
+import pytest
+
+import NewSMJobBlessUtil as util
+import SMJobBlessBench as bench
+
+
+class Project:
+    """A built app with two tools, and the Info.plist source files setreq updates."""
+
+    def __init__(self, tmp_path):
+        self.appPath = str(tmp_path / "build" / "Test.app")
+        self.toolNames = bench.makeBundle(self.appPath, "com.example.app", 2, 8192, 8192)
+        self.appInfoPlistPath = str(tmp_path / "App-Info.plist")
+        with open(self.appInfoPlistPath, "wb") as fp:
+            plistlib.dump({"CFBundleIdentifier": "com.example.app"}, fp, fmt=plistlib.FMT_XML)
+        os.chmod(self.appInfoPlistPath, 0o600)
+        self.toolInfoPlistPaths = []
+        for toolName in self.toolNames:
+            toolInfoPlistPath = str(tmp_path / f"{toolName}-Info.plist")
+            with open(toolInfoPlistPath, "wb") as fp:
+                plistlib.dump({"CFBundleIdentifier": toolName}, fp, fmt=plistlib.FMT_BINARY)
+            self.toolInfoPlistPaths.append(toolInfoPlistPath)
+        self.stampPath = str(tmp_path / "setreq.stamp")
+        self.inputFileListPath = str(tmp_path / "inputs.xcfilelist")
+        self.outputFileListPath = str(tmp_path / "outputs.xcfilelist")
+
+    def setreq(self, **options):
+        out = io.StringIO()
+        changes = util.setreq(self.appPath, self.appInfoPlistPath, self.toolInfoPlistPaths, out, stampPath=self.stampPath, inputFileListPath=self.inputFileListPath, outputFileListPath=self.outputFileListPath, **options)
+        return (changes, out.getvalue())
+
+    def sourcePaths(self):
+        return [self.appInfoPlistPath] + self.toolInfoPlistPaths
+
+    def sourceStates(self):
+        return {path: os.stat(path).st_mtime_ns for path in self.sourcePaths()}
+
+
+@pytest.fixture
+def project(tmp_path):
+    return Project(tmp_path)
+
+
+@pytest.fixture
+def inspections(monkeypatch):
+    """Counts the BundleInspections setreq makes, that is, the runs that read the app."""
+    inspections = []
+    BundleInspection = util.BundleInspection
+    monkeypatch.setattr(util, "BundleInspection", lambda *args: inspections.append(args) or BundleInspection(*args))
+    return inspections
+
+
+def test_setsRequirements(project):
+    changes, _ = project.setreq()
+    assert sorted(change.key for change in changes) == ["SMAuthorizedClients", "SMAuthorizedClients", "SMPrivilegedExecutables"]
+    with open(project.appInfoPlistPath, "rb") as fp:
+        assert plistlib.load(fp)["SMPrivilegedExecutables"] == {toolName: f'identifier "{toolName}"' for toolName in project.toolNames}
+    for toolInfoPlistPath in project.toolInfoPlistPaths:
+        with open(toolInfoPlistPath, "rb") as fp:
+            assert plistlib.load(fp)["SMAuthorizedClients"] == ['identifier "com.example.app"']
+
+
+def test_keepsFormatAndPermissions(project):
+    project.setreq()
+    with open(project.appInfoPlistPath, "rb") as fp:
+        assert fp.read().startswith(b"<?xml")
+    for toolInfoPlistPath in project.toolInfoPlistPaths:
+        with open(toolInfoPlistPath, "rb") as fp:
+            assert fp.read().startswith(b"bplist00")
+    assert os.stat(project.appInfoPlistPath).st_mode & 0o777 == 0o600
+
+
+def test_dryRunWritesNothing(project):
+    before = {path: open(path, "rb").read() for path in project.sourcePaths()}
+    changes, _ = project.setreq(dryRun=True)
+    assert len(changes) == 3
+    assert {path: open(path, "rb").read() for path in project.sourcePaths()} == before
+    assert not os.path.exists(project.stampPath)
+    assert not os.path.exists(project.inputFileListPath)
+
+
+def test_fileLists(project):
+    project.setreq()
+    with open(project.inputFileListPath) as fp:
+        inputPaths = fp.read().splitlines()
+    contentsPath = os.path.join(project.appPath, "Contents")
+    assert os.path.join(contentsPath, "MacOS") in inputPaths
+    assert os.path.join(contentsPath, "Library", "LaunchServices") in inputPaths
+    assert os.path.join(contentsPath, "Library", "LaunchServices", project.toolNames[0]) in inputPaths
+    assert set(project.sourcePaths()) <= set(inputPaths)
+    with open(project.outputFileListPath) as fp:
+        assert fp.read() == f"{project.stampPath}\n"
+
+
+def test_skipsWhenNothingTouched(project, inspections):
+    project.setreq()
+    states = project.sourceStates()
+    changes, output = project.setreq()
+    assert changes == []
+    assert "Nothing changed since the last run" in output
+    assert len(inspections) == 1
+    assert project.sourceStates() == states
+
+
+def test_touchedButUnchangedWritesNothing(project, inspections):
+    project.setreq()
+    executablePath = os.path.join(project.appPath, "Contents", "MacOS", "App")
+    os.utime(executablePath, ns=(0, 0))
+    states = project.sourceStates()
+    changes, output = project.setreq()
+    assert changes == []
+    assert "Nothing changed since the last run" in output
+    assert len(inspections) == 2
+    assert project.sourceStates() == states
+    assert project.setreq()[0] == []
+    assert len(inspections) == 2
+
+
+def test_removedToolNoticed(project, inspections):
+    project.setreq()
+    os.unlink(os.path.join(project.appPath, "Contents", "Library", "LaunchServices", project.toolNames[1]))
+    with pytest.raises(util.CheckException, match="not found in"):
+        project.setreq()
+    assert len(inspections) == 2
+
+
+def test_changedSourceUpdated(project):
+    project.setreq()
+    with open(project.appInfoPlistPath, "wb") as fp:
+        plistlib.dump({"CFBundleIdentifier": "com.example.app", "SMPrivilegedExecutables": {}}, fp)
+    changes, _ = project.setreq()
+    assert [change.key for change in changes] == ["SMPrivilegedExecutables"]